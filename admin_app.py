@@ -4,10 +4,19 @@ from datetime import date
 from shared import (
      LANG_OPTIONS,
      labels,
-     load_drivers_from_db,
-     load_trips_from_db,
      ADMIN_CODE,
 )
+from distance_matrix import snap_to_neighborhoods, neighborhood_distance_miles
+from driver_ledger import get_driver_ledger
+from rollups import get_daily_rollups
+from trip_archive import get_trip_archive, load_archived_trips
+from aggregation import grouping_sets
+from sketches import get_heavy_hitters
+from exports import available_formats, export_download_button
+from pagination import archive_source, frame_source, paginated_table
+from chart_data import downsample, hexbin
+from driver_dimension import get_driver_dimension
+from driver_store import get_driver_store
 st.set_page_config(page_title="Mali Ride – Admin Dashboard", layout="wide")
 # ----------------------------
 # LANGUAGE
@@ -36,27 +45,23 @@ st.session_state["admin_ok"] = True
 # ----------------------------
 # LOAD DATA
 # ----------------------------
-drivers = load_drivers_from_db()
-trips = load_trips_from_db()
+drivers = get_driver_store().snapshot()
 
-df_trips = pd.DataFrame(trips) if trips else pd.DataFrame()
-if not df_trips.empty and "created_at" in df_trips.columns:
-    df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-    df_trips["date_only"] = df_trips["created_at"].dt.date
+# Pre-aggregated (date, city, provider, driver, promo, status) cells; the
+# filters, metrics and breakdowns below read these, not the raw trips.
+rollups = get_daily_rollups()
+df_roll_all = rollups.frame()
 
 # ----------------------------
 # FILTERS
 # ----------------------------
-if not df_trips.empty:
+if not df_roll_all.empty:
     st.markdown("### 🔎 Filters (trips)")
 
     colf1, colf2, colf3 = st.columns(3)
 
     with colf1:
-        if "city" in df_trips.columns:
-            city_options = sorted([c for c in df_trips["city"].dropna().unique()])
-        else:
-            city_options = []
+        city_options = sorted([c for c in df_roll_all["city"].dropna().unique()])
         city_filter = st.multiselect(
             "City (from trips)",
             city_options,
@@ -64,10 +69,9 @@ if not df_trips.empty:
         )
 
     with colf2:
-        if "created_at" in df_trips.columns and df_trips["created_at"].notna().any():
-            dates = df_trips["created_at"].dropna()
-            min_date = dates.min().date()
-            max_date = dates.max().date()
+        if not df_roll_all.empty:
+            min_date = df_roll_all["date"].min()
+            max_date = df_roll_all["date"].max()
         else:
             today = date.today()
             min_date = max_date = today
@@ -78,31 +82,45 @@ if not df_trips.empty:
         )
 
     with colf3:
-        if "routing_provider" in df_trips.columns:
-            provider_options = sorted([p for p in df_trips["routing_provider"].dropna().unique()])
-        else:
-            provider_options = []
+        provider_options = sorted([p for p in df_roll_all["routing_provider"].dropna().unique()])
         provider_filter = st.multiselect(
             "Routing provider",
             provider_options,
             default=provider_options if provider_options else None,
         )
 
-    df_trips_filtered = df_trips.copy()
-
-    if city_options and city_filter:
-        df_trips_filtered = df_trips_filtered[df_trips_filtered["city"].isin(city_filter)]
-
-    if "created_at" in df_trips_filtered.columns and df_trips_filtered["created_at"].notna().any():
-        df_trips_filtered = df_trips_filtered[
-            (df_trips_filtered["created_at"].dt.date >= start_date)
-            & (df_trips_filtered["created_at"].dt.date <= end_date)
-        ]
-
-    if provider_options and provider_filter and "routing_provider" in df_trips_filtered.columns:
-        df_trips_filtered = df_trips_filtered[df_trips_filtered["routing_provider"].isin(provider_filter)]
+    selection = {
+        "cities": city_filter if city_options and city_filter else None,
+        "providers": provider_filter if provider_options and provider_filter else None,
+        "start": start_date,
+        "end": end_date,
+    }
+    # Raw trips (for the per-trip sections) come from the date / city
+    # partitioned archive, so only the selected partitions are read.
+    df_trips_filtered = load_archived_trips(**selection)
+    df_roll = rollups.query(**selection)
 else:
-    df_trips_filtered = df_trips
+    df_trips_filtered = load_archived_trips()
+    df_roll = df_roll_all
+    selection = {}
+
+if not df_trips_filtered.empty and "created_at" in df_trips_filtered.columns:
+    df_trips_filtered["date_only"] = df_trips_filtered["created_at"].dt.date
+
+# Every breakdown of the rollup cells (driver, day, city, promo, status)
+# and of the raw trips (referral code, client app) in one scan each
+roll_tables = {}
+if not df_roll.empty:
+    roll_tables = grouping_sets(
+        df_roll,
+        ["driver_username", "date", "city", "promo_code", "status"],
+        measures=("price_xof", "price_before_discount_xof", "discount_xof", "driver_earnings_xof"),
+        count_column="trips",
+    )
+trip_tables = {}
+raw_dims = [d for d in ("referral_code", "client_app") if d in df_trips_filtered.columns]
+if not df_trips_filtered.empty and raw_dims:
+    trip_tables = grouping_sets(df_trips_filtered, raw_dims, measures=("price_xof",))
 
 # ----------------------------
 # TOP-LEVEL METRICS
@@ -121,11 +139,11 @@ n_available = sum(1 for d in drivers if d.get("status") == status_available)
 n_busy = sum(1 for d in drivers if d.get("status") == status_busy)
 n_offline = sum(1 for d in drivers if d.get("status") == status_offline)
 
-if not df_trips_filtered.empty:
-    total_gross = float(df_trips_filtered.get("price_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    total_platform = float(df_trips_filtered.get("platform_commission_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    total_driver = float(df_trips_filtered.get("driver_earnings_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    n_trips = len(df_trips_filtered)
+if not df_roll.empty:
+    total_gross = float(df_roll["price_xof"].sum())
+    total_platform = float(df_roll["platform_commission_xof"].sum())
+    total_driver = float(df_roll["driver_earnings_xof"].sum())
+    n_trips = int(df_roll["trips"].sum())
 else:
     total_gross = total_platform = total_driver = 0.0
     n_trips = 0
@@ -147,6 +165,17 @@ with col_g:
 with col_h:
     st.metric(L("metric_driver_earnings") + " (filtered)", f"{total_driver:,.0f}")
 
+# Distinct counts from the rollups' HyperLogLog sketches (city + date filters)
+distinct_selection = {k: v for k, v in selection.items() if k != "providers"}
+distinct = rollups.distinct_counts(**distinct_selection).iloc[0]
+col_u1, col_u2, col_u3 = st.columns(3)
+with col_u1:
+    st.metric("Unique active drivers (≈)", f"{distinct['drivers']:,}")
+with col_u2:
+    st.metric("Unique routes (≈)", f"{distinct['routes']:,}")
+with col_u3:
+    st.metric("Unique passengers (≈)", f"{distinct['passengers']:,}" if distinct["passengers"] else "–")
+
 # ----------------------------
 # POLICY EXPLAINER (CANCELLATION + PAYMENTS)
 # ----------------------------
@@ -196,35 +225,25 @@ with tab_driver:
     st.markdown("### 🚖 Driver app – supply & earnings view")
 
     if drivers:
-        df_drivers = pd.DataFrame(drivers)
+        df_drivers = drivers.frame()
         st.markdown("**Registered drivers (from Driver app)**")
-        st.dataframe(df_drivers)
-
-        if not df_trips_filtered.empty and "driver_username" in df_trips_filtered.columns:
-            df_d = df_trips_filtered.copy()
-            agg = df_d.groupby("driver_username").agg(
-                trips_count=("price_xof", "count"),
-                total_revenue_xof=("price_xof", "sum"),
-                driver_earnings_xof=("driver_earnings_xof", "sum")
-                if "driver_earnings_xof" in df_d.columns
-                else ("price_xof", "sum"),
-            ).reset_index()
-
-            # Join with driver info if available
-            if "username" in df_drivers.columns:
-                join_cols = ["username", "first_name", "last_name", "city", "transport_type"]
-                join_cols = [c for c in join_cols if c in df_drivers.columns]
-                df_info = df_drivers[join_cols].copy()
-                agg = agg.merge(df_info, how="left", left_on="driver_username", right_on="username")
-
-                agg["driver_name"] = agg.apply(
-                    lambda r: f"{r.get('first_name', '')} {r.get('last_name', '')}".strip()
-                    if (pd.notna(r.get('first_name', '')) or pd.notna(r.get('last_name', '')))
-                    else r["driver_username"],
-                    axis=1
-                )
-            else:
-                agg["driver_name"] = agg["driver_username"]
+        paginated_table(
+            "drivers_tab",
+            frame_source(df_drivers),
+            df_drivers.columns,
+            filters={c: sorted(df_drivers[c].dropna().unique()) for c in ("city", "status") if c in df_drivers.columns},
+            default_sort="username",
+        )
+
+        if "driver_username" in roll_tables and not roll_tables["driver_username"].empty:
+            agg = roll_tables["driver_username"].rename(columns={
+                "trips": "trips_count",
+                "price_xof_sum": "total_revenue_xof",
+                "driver_earnings_xof_sum": "driver_earnings_xof",
+            })[["driver_username", "trips_count", "total_revenue_xof", "driver_earnings_xof"]]
+
+            # Names and attributes from the cached driver dimension (index lookup)
+            agg = get_driver_dimension().enrich(agg)
 
             agg = agg.sort_values("driver_earnings_xof", ascending=False)
 
@@ -235,6 +254,11 @@ with tab_driver:
 
             st.markdown("**Earnings by driver (XOF)**")
             st.bar_chart(top_drivers.set_index("driver_name")["driver_earnings_xof"])
+
+            active_by_day = rollups.distinct_counts(by="date", **distinct_selection)
+            if not active_by_day.empty:
+                st.markdown("**Active drivers per day (≈, HyperLogLog)**")
+                st.line_chart(downsample(active_by_day.set_index("date")["drivers"]))
         else:
             st.info("No trips for drivers in the current filter range.")
     else:
@@ -244,42 +268,88 @@ with tab_driver:
 with tab_passenger:
     st.markdown("### 🚕 Passenger app – demand & trips view")
 
-    if not df_trips_filtered.empty:
+    if roll_tables:
         # Trips over time
-        if "date_only" in df_trips_filtered.columns:
-            trips_by_day = df_trips_filtered.groupby("date_only").agg(
-                trips_count=("price_xof", "count"),
-                revenue_xof=("price_xof", "sum"),
-            ).reset_index()
-
-            col_p1, col_p2 = st.columns(2)
-            with col_p1:
-                st.markdown("**Trips per day (Passenger app)**")
-                st.line_chart(trips_by_day.set_index("date_only")["trips_count"])
-            with col_p2:
-                st.markdown("**Revenue per day (XOF)**")
-                st.line_chart(trips_by_day.set_index("date_only")["revenue_xof"])
+        trips_by_day = pd.DataFrame({
+            "date_only": roll_tables["date"]["date"].astype(object),
+            "trips_count": roll_tables["date"]["trips"],
+            "revenue_xof": roll_tables["date"]["price_xof_sum"],
+        })
+
+        col_p1, col_p2 = st.columns(2)
+        with col_p1:
+            st.markdown("**Trips per day (Passenger app)**")
+            st.line_chart(downsample(trips_by_day.set_index("date_only")["trips_count"]))
+        with col_p2:
+            st.markdown("**Revenue per day (XOF)**")
+            st.line_chart(downsample(trips_by_day.set_index("date_only")["revenue_xof"]))
 
         # City-level demand
-        if "city" in df_trips_filtered.columns:
-            df_city = df_trips_filtered.dropna(subset=["city"]).copy()
-            city_group = df_city.groupby("city").agg(
-                trips_count=("price_xof", "count"),
-                avg_fare_xof=("price_xof", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-            ).reset_index()
-            city_group["avg_fare_xof"] = city_group["avg_fare_xof"].round(0)
-
-            st.markdown("**Trips by city (Passenger demand)**")
-            st.dataframe(city_group)
-            st.bar_chart(city_group.set_index("city")["trips_count"])
+        city_group = roll_tables["city"].rename(columns={
+            "trips": "trips_count",
+            "price_xof_mean": "avg_fare_xof",
+            "price_xof_sum": "total_revenue_xof",
+        })[["city", "trips_count", "avg_fare_xof", "total_revenue_xof"]]
+        city_group["avg_fare_xof"] = city_group["avg_fare_xof"].round(0)
+
+        st.markdown("**Trips by city (Passenger demand)**")
+        st.dataframe(city_group)
+        st.bar_chart(city_group.set_index("city")["trips_count"])
+
+        # Top routes: per-day Space-Saving sketches, exact counts on request
+        st.markdown("**Top routes (filtered)**")
+        exact_routes = st.checkbox("Exact route counts (audit)", value=False, key="exact_routes")
+        if exact_routes:
+            if "route_summary" in df_trips_filtered.columns and not df_trips_filtered.empty:
+                route_top = (
+                    grouping_sets(df_trips_filtered, ["route_summary"], measures=())["route_summary"]
+                    .rename(columns={"trips": "trips_count"})
+                    .sort_values("trips_count", ascending=False)
+                    .head(10)
+                )
+            else:
+                route_top = pd.DataFrame(columns=["route_summary", "trips_count"])
+        else:
+            route_top = get_heavy_hitters().top("top_routes", n=10, **selection).rename(columns={
+                "estimate": "trips_count",
+                "error": "trips_count_error",
+                "lower_bound": "trips_count_min",
+            })
+            st.caption("Approximate: the true count lies between trips_count_min and trips_count.")
+        st.dataframe(route_top)
+
+    if not df_trips_filtered.empty:
+        # Bamako neighborhood flows: GPS pickups/dropoffs snapped to the
+        # nearest neighborhood, so any trip groups by neighborhood pair.
+        gps_cols = ["pickup_lat", "pickup_lon", "drop_lat", "drop_lon"]
+        if all(c in df_trips_filtered.columns for c in gps_cols):
+            df_gps = df_trips_filtered.dropna(subset=gps_cols)
+            df_flows_nb = pd.DataFrame({
+                "pickup_neighborhood": snap_to_neighborhoods(df_gps["pickup_lat"], df_gps["pickup_lon"]),
+                "dropoff_neighborhood": snap_to_neighborhoods(df_gps["drop_lat"], df_gps["drop_lon"]),
+                "price_xof": df_gps["price_xof"].to_numpy(),
+            }).dropna(subset=["pickup_neighborhood", "dropoff_neighborhood"])
+
+            if not df_flows_nb.empty:
+                nb_group = df_flows_nb.groupby(["pickup_neighborhood", "dropoff_neighborhood"]).agg(
+                    trips_count=("price_xof", "count"),
+                    total_revenue_xof=("price_xof", "sum"),
+                ).reset_index()
+                nb_group["road_distance_miles"] = [
+                    neighborhood_distance_miles(a, b)
+                    for a, b in zip(nb_group["pickup_neighborhood"], nb_group["dropoff_neighborhood"])
+                ]
+                nb_group = nb_group.sort_values("trips_count", ascending=False)
+
+                st.markdown("**Bamako neighborhood flows (GPS snapped to nearest neighborhood)**")
+                st.dataframe(nb_group)
 
         # Distance vs fare
         if "distance_miles" in df_trips_filtered.columns:
-            st.markdown("**Distance vs fare (per trip)**")
-            dist_fare = df_trips_filtered[["distance_miles", "price_xof"]].dropna()
+            st.markdown("**Distance vs fare (trips per hexagonal bin)**")
+            dist_fare = hexbin(df_trips_filtered, "distance_miles", "price_xof")
             if not dist_fare.empty:
-                st.scatter_chart(dist_fare, x="distance_miles", y="price_xof")
+                st.scatter_chart(dist_fare, x="distance_miles", y="price_xof", size="trips", color="trips")
             else:
                 st.info("No valid distance/fare data to plot.")
     else:
@@ -292,22 +362,19 @@ with tab_promos:
     if not df_trips_filtered.empty:
         # Promo codes
         if "promo_code" in df_trips_filtered.columns:
-            df_promo = df_trips_filtered.copy()
-            df_promo = df_promo[df_promo["promo_code"].notna() & (df_promo["promo_code"] != "")]
-            if not df_promo.empty:
-                promo_group = df_promo.groupby("promo_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_gross_before_xof=("price_before_discount_xof", "sum")
-                    if "price_before_discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_discount_xof=("discount_xof", "sum")
-                    if "discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_net_xof=("price_xof", "sum"),
-                ).reset_index()
-                promo_group["avg_discount_per_trip_xof"] = (
-                    promo_group["total_discount_xof"] / promo_group["trips_count"]
-                ).round(2)
+            promo_group = roll_tables.get("promo_code", pd.DataFrame())
+            if not promo_group.empty:
+                promo_group = promo_group.rename(columns={
+                    "trips": "trips_count",
+                    "price_before_discount_xof_sum": "total_gross_before_xof",
+                    "discount_xof_sum": "total_discount_xof",
+                    "price_xof_sum": "total_net_xof",
+                    "discount_xof_mean": "avg_discount_per_trip_xof",
+                })[[
+                    "promo_code", "trips_count", "total_gross_before_xof", "total_discount_xof",
+                    "total_net_xof", "avg_discount_per_trip_xof",
+                ]]
+                promo_group["avg_discount_per_trip_xof"] = promo_group["avg_discount_per_trip_xof"].round(2)
 
                 st.markdown("**Promo performance (from Passenger app)**")
                 st.dataframe(promo_group)
@@ -327,15 +394,14 @@ with tab_promos:
         st.markdown("---")
 
         # Referrals
-        if "referral_code" in df_trips_filtered.columns:
-            df_ref = df_trips_filtered.copy()
-            df_ref = df_ref[df_ref["referral_code"].notna() & (df_ref["referral_code"] != "")]
-            if not df_ref.empty:
-                ref_group = df_ref.groupby("referral_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_revenue_xof=("price_xof", "sum"),
-                    avg_fare_xof=("price_xof", "mean"),
-                ).reset_index()
+        if "referral_code" in trip_tables:
+            ref_group = trip_tables["referral_code"]
+            ref_group = ref_group[ref_group["referral_code"] != ""].rename(columns={
+                "trips": "trips_count",
+                "price_xof_sum": "total_revenue_xof",
+                "price_xof_mean": "avg_fare_xof",
+            })[["referral_code", "trips_count", "total_revenue_xof", "avg_fare_xof"]]
+            if not ref_group.empty:
                 ref_group["avg_fare_xof"] = ref_group["avg_fare_xof"].round(0)
 
                 st.markdown("**Referral performance**")
@@ -353,10 +419,9 @@ with tab_promos:
 with tab_mobile:
     st.markdown("### 📱 Mobile usage – client apps overview")
 
-    if not df_trips_filtered.empty and "client_app" in df_trips_filtered.columns:
-        df_ch = df_trips_filtered.dropna(subset=["client_app"]).copy()
-        if not df_ch.empty:
-            ch_group = df_ch.groupby("client_app").size().reset_index(name="trips_count")
+    if "client_app" in trip_tables:
+        ch_group = trip_tables["client_app"][["client_app", "trips"]].rename(columns={"trips": "trips_count"})
+        if not ch_group.empty:
             st.markdown("**Trips by platform (Passenger / Driver / Web)**")
             st.dataframe(ch_group)
             st.bar_chart(ch_group.set_index("client_app")["trips_count"])
@@ -376,20 +441,21 @@ st.subheader("💵 Payments & cancellation analytics (filtered)")
 
 if not df_trips_filtered.empty:
     # Status breakdown
-    if "status" in df_trips_filtered.columns:
-        status_counts = df_trips_filtered["status"].value_counts().reset_index()
-        status_counts.columns = ["status", "count"]
+    status_counts = roll_tables.get("status", pd.DataFrame())
+    if not status_counts.empty:
+        status_counts = (
+            status_counts[["status", "trips"]]
+            .rename(columns={"trips": "count"})
+            .sort_values("count", ascending=False, ignore_index=True)
+        )
 
         st.markdown("**Trips by status (completed vs cancelled)**")
         st.dataframe(status_counts)
         st.bar_chart(status_counts.set_index("status")["count"])
 
-        cancelled_passenger = int(
-            df_trips_filtered["status"].eq("cancelled_by_passenger").sum()
-        )
-        cancelled_driver = int(
-            df_trips_filtered["status"].eq("cancelled_by_driver").sum()
-        )
+        status_totals = status_counts.set_index("status")["count"]
+        cancelled_passenger = int(status_totals.get("cancelled_by_passenger", 0))
+        cancelled_driver = int(status_totals.get("cancelled_by_driver", 0))
 
         col_c1, col_c2 = st.columns(2)
         with col_c1:
@@ -398,12 +464,7 @@ if not df_trips_filtered.empty:
             st.metric("Trips cancelled by driver", cancelled_driver)
 
     # Cancellation fees
-    if "cancellation_fee_xof" in df_trips_filtered.columns:
-        total_cancel_fees = float(
-            df_trips_filtered["cancellation_fee_xof"].fillna(0).sum()
-        )
-    else:
-        total_cancel_fees = 0.0
+    total_cancel_fees = float(df_roll["cancellation_fee_xof"].sum())
 
     st.metric("Total cancellation fees (XOF)", f"{total_cancel_fees:,.0f}")
 
@@ -423,20 +484,62 @@ if not df_trips_filtered.empty:
 else:
     st.info("No trips in the current filter range to compute payments or cancellations.")
 
+# Ratings / penalties come from the append-only ledger (all time, not filtered)
+ledger_states = get_driver_ledger().states()
+if ledger_states:
+    df_ledger = (
+        pd.DataFrame.from_dict(ledger_states, orient="index")
+        .rename_axis("driver_username")
+        .reset_index()
+        .sort_values("penalties_owed_xof", ascending=False)
+    )
+    df_ledger["rating"] = df_ledger["rating"].round(2)
+    st.markdown("**Driver ratings & cancellation penalties (ledger, all time)**")
+    st.dataframe(df_ledger)
+
 # ----------------------------
 # RAW TABLES AT BOTTOM
 # ----------------------------
 st.markdown("---")
 st.subheader(L("drivers_table_header"))
 if drivers:
-    st.dataframe(pd.DataFrame(drivers))
+    df_drivers = drivers.frame()
+    paginated_table(
+        "drivers_raw",
+        frame_source(df_drivers),
+        df_drivers.columns,
+        filters={c: sorted(df_drivers[c].dropna().unique()) for c in ("city", "status") if c in df_drivers.columns},
+        default_sort="username",
+    )
 else:
     st.info(L("no_drivers"))
 
 st.markdown("---")
 st.subheader(L("trips_table_header") + " (filtered)")
 if not df_trips_filtered.empty:
-    st.dataframe(df_trips_filtered)
+    # One page at a time from the archive, sorted / filtered there
+    archive = get_trip_archive()
+    paginated_table(
+        "trips_raw",
+        archive_source(archive, selection),
+        [c for c in df_trips_filtered.columns if c != "date_only"],
+        filters={c: sorted(df_roll_all[c].dropna().unique()) for c in ("status",) if c in df_roll_all.columns},
+        default_sort="created_at",
+        default_ascending=False,
+    )
+
+    # Streamed partition by partition from the archive, only when clicked
+    col_x1, col_x2 = st.columns([1, 3])
+    with col_x1:
+        export_format = st.selectbox("Download format", available_formats(), key="export_format")
+    with col_x2:
+        export_download_button(
+            "Download filtered trips",
+            "trips_mali_ride_filtered",
+            lambda: archive.iter_read(**selection),
+            export_format,
+            cache_key=(repr(selection), archive.source_version()),
+        )
 else:
     st.info("No trips (for current filters).")
 
@@ -0,0 +1,105 @@
+"""
+Grouping-sets aggregation over trip frames.
+
+The admin dashboards show the same measures (trip count, sums and means of
+fares, distances, commission, earnings) broken down by several dimensions.
+grouping_sets() answers all of those breakdowns from one scan of the data:
+rows are reduced once to the finest grid of the requested dimensions
+(using the categorical codes of the typed trip schema), and every grouping
+set is then rolled up from that small grid instead of from the trips.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_MEASURES = ("price_xof", "distance_miles", "platform_commission_xof", "driver_earnings_xof")
+
+
+def _codes(s):
+    """Category codes shifted by one (0 = missing) and the categories."""
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype("category")
+    return s.cat.codes.to_numpy(np.int64) + 1, s.cat.categories
+
+
+def _cells(code_columns, n_rows):
+    """Dense cell id per row for the combination of the code columns, and the cell count."""
+    key = np.zeros(n_rows, dtype=np.int64)
+    n_cells = 1 if n_rows else 0
+    for codes in code_columns:
+        # Re-densify after every dimension so the combined key never overflows
+        key, uniques = pd.factorize(key * (int(codes.max(initial=0)) + 1) + codes)
+        n_cells = len(uniques)
+    return key, n_cells
+
+
+def grouping_sets(df, sets, measures=DEFAULT_MEASURES, count_column=None):
+    """
+    {set: DataFrame} with one row per group for each grouping set.
+
+    sets: dimension names or tuples of names, e.g. ["city", ("city", "status")].
+    Each table has the set's dimensions, `trips` (row count, or the sum of
+    count_column for pre-aggregated frames such as the daily rollups) and
+    `<m>_sum` / `<m>_mean` for every measure present in df. Rows with a
+    missing value in one of the set's dimensions are left out of that set,
+    like a groupby.
+    """
+    sets = list(sets)
+    dims = []
+    for s in sets:
+        for d in ((s,) if isinstance(s, str) else s):
+            if d not in dims:
+                dims.append(d)
+    measures = [m for m in measures if m in df.columns]
+    integer = {m: pd.api.types.is_integer_dtype(df[m]) for m in measures}
+
+    # One scan: reduce the rows to the finest grid over all dimensions
+    codes, categories = {}, {}
+    for d in dims:
+        codes[d], categories[d] = _codes(df[d])
+    cell, n_cells = _cells([codes[d] for d in dims], len(df))
+
+    first_row = np.full(n_cells, len(df), dtype=np.int64)
+    np.minimum.at(first_row, cell, np.arange(len(df)))
+    grid_codes = {d: codes[d][first_row] for d in dims}
+
+    if count_column is not None:
+        grid = {"trips": np.bincount(cell, weights=df[count_column].to_numpy(np.float64), minlength=n_cells)}
+    else:
+        grid = {"trips": np.bincount(cell, minlength=n_cells).astype(np.float64)}
+    for m in measures:
+        values = df[m].to_numpy(np.float64)
+        present = ~np.isnan(values)
+        grid[m + "_sum"] = np.bincount(cell, weights=np.where(present, values, 0.0), minlength=n_cells)
+        if count_column is not None:
+            present = present * df[count_column].to_numpy(np.float64)
+        grid[m + "_n"] = np.bincount(cell, weights=present, minlength=n_cells)
+
+    # Every grouping set rolls up from the grid
+    tables = {}
+    for s in sets:
+        set_dims = (s,) if isinstance(s, str) else tuple(s)
+        keep = np.ones(n_cells, dtype=bool)
+        for d in set_dims:
+            keep &= grid_codes[d] > 0
+        n_kept = int(keep.sum())
+        group, n_groups = _cells([grid_codes[d][keep] for d in set_dims], n_kept)
+
+        first_cell = np.full(n_groups, n_kept, dtype=np.int64)
+        np.minimum.at(first_cell, group, np.arange(n_kept))
+        out = {}
+        for d in set_dims:
+            out[d] = pd.Categorical.from_codes(
+                grid_codes[d][keep][first_cell] - 1, categories=categories[d]
+            )
+        out["trips"] = np.bincount(group, weights=grid["trips"][keep], minlength=n_groups)
+        for m in measures:
+            total = np.bincount(group, weights=grid[m + "_sum"][keep], minlength=n_groups)
+            n = np.bincount(group, weights=grid[m + "_n"][keep], minlength=n_groups)
+            out[m + "_sum"] = total.round().astype(np.int64) if integer[m] else total
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[m + "_mean"] = np.where(n > 0, total / np.where(n > 0, n, 1), np.nan)
+
+        table = pd.DataFrame(out)
+        table["trips"] = table["trips"].round().astype(np.int64)
+        tables[s] = table.sort_values(list(set_dims), ignore_index=True)
+    return tables
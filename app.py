@@ -1,103 +1,280 @@
 
 import streamlit as st
 import pandas as pd
-from math import radians, sin, cos, asin, sqrt
-import os
-import requests
 import json
+import threading
+import time
 from datetime import datetime
 from google.cloud import firestore
 from google.oauth2 import service_account
 
+from shared import (
+    ADMIN_CODE,
+    MALI_CITIES,
+    BKO_NEIGHBORHOODS,
+    get_trip_distance_miles,
+    get_trip_distance_and_provider,
+    compute_fare,
+)
+from distance_matrix import (
+    city_distance_miles,
+    city_matrix_provider,
+    neighborhood_distance_miles,
+    neighborhood_matrix_provider,
+    gps_label,
+)
+from trip_schema import to_trip_frame
+from aggregation import grouping_sets
+from sketches import build_heavy_hitters
+from exports import available_formats, export_download_button, frame_chunks
+from pagination import frame_source, paginated_table
+from trip_mirror import TripMirror, mirror_path
+from firestore_queries import fetch_trips
+from firestore_writes import WriteBehindQueue
+from driver_dimension import DriverDimension
+from driver_store import DriverStore
+from change_bus import DRIVER_SAVED, DRIVER_UPDATED, ChangeBus
+from storage import FirestoreStorage, MemoryStorage
+
 # -------------------------------------------------
 # CONFIG
 # -------------------------------------------------
 st.set_page_config(page_title="Mali Ride App (Uber-style demo)", layout="wide")
 
-# Simple admin code (change this for your deployment)
-ADMIN_CODE = "owner123"
-
-# Routing provider configs
-USE_REAL_ROUTING = True  # set False to fall back to haversine
-ROUTING_PROVIDER = "openrouteservice"  # or "google"
-
-# API keys (set them as environment variables in Streamlit Cloud)
-ORS_API_KEY = os.getenv("ORS_API_KEY")        # OpenRouteService
-GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")  # Google Maps
-
 # -------------------------------------------------
 # FIRESTORE HELPERS
 # -------------------------------------------------
-def get_firestore_client():
+FIRESTORE_HEALTH_CHECK_SECONDS = 60  # re-check a reused client at most this often
+FIRESTORE_RETRY_SECONDS = 30         # wait between attempts while Firestore is unavailable
+
+
+class _FirestoreConnection:
+    """Process-wide Firestore client, shared by every session and rerun."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+        self.checked_at = 0.0   # last successful connect / health check
+        self.failed_at = None   # last failed connect
+
+
+@st.cache_resource(show_spinner=False)
+def _firestore_connection():
+    return _FirestoreConnection()
+
+
+def _connect_firestore():
+    gcp_section = st.secrets["gcp"]
+    project_id = gcp_section["firestore_project"]
+    cred_info = json.loads(gcp_section["credentials_json"])
+    credentials = service_account.Credentials.from_service_account_info(cred_info)
+    return firestore.Client(project=project_id, credentials=credentials)
+
+
+def _firestore_healthy(client):
+    """One cheap RPC (a point read) to check the channel still works."""
     try:
-        gcp_section = st.secrets["gcp"]
-        project_id = gcp_section["firestore_project"]
-        cred_info = json.loads(gcp_section["credentials_json"])
-        credentials = service_account.Credentials.from_service_account_info(cred_info)
-        client = firestore.Client(project=project_id, credentials=credentials)
-        return client
+        client.collection("_health").document("ping").get(timeout=5)
+        return True
     except Exception:
+        return False
+
+
+def get_firestore_client(warn=True):
+    """
+    The cached Firestore client: created once from st.secrets["gcp"],
+    health-checked every FIRESTORE_HEALTH_CHECK_SECONDS and rebuilt if the
+    check fails. None (in-memory session mode) when it cannot connect.
+    """
+    conn = _firestore_connection()
+    now = time.monotonic()
+    with conn.lock:
+        if conn.client is not None and now - conn.checked_at > FIRESTORE_HEALTH_CHECK_SECONDS:
+            if _firestore_healthy(conn.client):
+                conn.checked_at = now
+            else:
+                try:
+                    conn.client.close()
+                except Exception:
+                    pass
+                conn.client = None
+
+        if conn.client is None and (conn.failed_at is None or now - conn.failed_at > FIRESTORE_RETRY_SECONDS):
+            try:
+                conn.client = _connect_firestore()
+                conn.checked_at = now
+                conn.failed_at = None
+            except Exception:
+                conn.failed_at = now
+        client = conn.client
+
+    if client is None and warn:
         st.warning("Firestore not configured correctly. Using in-memory session only.")
-        return None
+    return client
 
 
-def load_drivers_from_db():
-    client = get_firestore_client()
-    if client is None:
-        return st.session_state.get("drivers", [])
+FIRESTORE_TRIP_LISTENER = False  # also keep the trip mirror current with a snapshot listener
 
-    docs = client.collection("drivers").stream()
-    drivers = []
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        drivers.append(data)
-    return drivers
 
+@st.cache_resource(show_spinner=False)
+def _trip_mirror(project):
+    """Process-wide local mirror of the trips collection (see trip_mirror.py)."""
+    return TripMirror(mirror_path(project))
 
-def save_driver_to_db(driver):
-    client = get_firestore_client()
-    if client is None:
-        st.session_state["drivers"].append(driver)
-        return
 
-    doc_ref = client.collection("drivers").document(driver["username"])
-    doc_ref.set(driver)
+@st.cache_resource(show_spinner=False)
+def _firestore_storage(project):
+    return FirestoreStorage(None, mirror=_trip_mirror(project))
 
 
-def update_driver_in_db(username, updates):
-    client = get_firestore_client()
+def get_storage(warn=True):
+    """
+    FirestoreStorage on the current client, or None without Firestore: the
+    session-state trips list is then the store, and callers update it
+    directly (drivers go to one in-memory store, see _SharedDrivers).
+    """
+    client = get_firestore_client(warn)
     if client is None:
-        for d in st.session_state["drivers"]:
-            if d["username"] == username:
-                d.update(updates)
-        return
+        return None
+    storage = _firestore_storage(client.project)
+    storage.client = client  # may have been reconnected
+    return storage
+
+
+class _SharedDrivers:
+    """
+    Drivers for every session of this process: one DriverStore snapshot
+    (driver_store.py) over Firestore, or over one in-memory store without
+    it. Driver writes go through write() / queue() and are published on an
+    in-process change bus, so the snapshot applies them as deltas. Pings
+    queued for write-behind do not move the store's version: `queued`
+    counts them into the snapshot's version instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.memory = MemoryStorage()
+        self.queued = 0
+        self.bus = ChangeBus()
+        self.store = DriverStore(load=self.load, version=self.version, bus=self.bus)
+        self.dimension = DriverDimension(bus=self.bus)
+
+    def storage(self):
+        storage = get_storage(warn=False)
+        return self.memory if storage is None else storage
+
+    def load(self):
+        return self.storage().load_drivers()
+
+    def version(self):
+        return (self.storage().version("drivers"), self.queued)
+
+    def write(self, write, kind, key, data):
+        """Run write(storage), a Storage write touching drivers, and publish it as `kind`."""
+        with self.lock:
+            before, after = write(self.storage())["drivers"]
+            self.bus.publish(kind, key, data, (before, self.queued), (after, self.queued))
+
+    def queue(self, client, username, updates):
+        """Queue a driver ping for write-behind and publish it."""
+        with self.lock:
+            version = self.storage().version("drivers")
+            _write_behind_queue().set(client, "drivers", username, updates)
+            self.queued += 1
+            self.bus.publish(
+                DRIVER_UPDATED, username, dict(updates), (version, self.queued - 1), (version, self.queued)
+            )
 
-    doc_ref = client.collection("drivers").document(username)
-    doc_ref.set(updates, merge=True)
+
+@st.cache_resource(show_spinner=False)
+def _shared_drivers():
+    return _SharedDrivers()
+
+
+def driver_snapshot():
+    """Shared, read-only drivers snapshot: change drivers through the *_in_db helpers."""
+    return _shared_drivers().store.snapshot()
+
+
+def driver_dimension():
+    """Shared DriverDimension (leaderboard driver columns), kept current by the bus deltas."""
+    shared = _shared_drivers()
+    shared.dimension.follow(shared.store.snapshot())
+    return shared.dimension
+
+
+def save_driver_to_db(driver):
+    _shared_drivers().write(lambda storage: storage.save_driver(driver), DRIVER_SAVED, driver["username"], driver)
+
+
+def update_driver_in_db(username, updates):
+    _shared_drivers().write(
+        lambda storage: storage.update_driver(username, updates), DRIVER_UPDATED, username, dict(updates)
+    )
 
 
 def load_trips_from_db():
-    client = get_firestore_client()
-    if client is None:
+    storage = get_storage()
+    if storage is None:
         return st.session_state.get("trips", [])
 
-    docs = client.collection("trips").order_by("created_at", direction=firestore.Query.DESCENDING).stream()
-    trips = []
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        trips.append(data)
+    # Only trips newer than the mirror's created_at cursor come from Firestore
+    trips = storage.load_trips()
+    if FIRESTORE_TRIP_LISTENER:
+        storage.mirror.listen(storage.client)
     return trips
 
 
+def trips_version():
+    """
+    Changes whenever trips are written: the Firestore store's version (other
+    writers' changes show within its poll interval), or without Firestore
+    the length of the session's trips list, which is only appended to.
+    """
+    storage = get_storage()
+    if storage is None:
+        return len(st.session_state.get("trips", []))
+    return storage.version("trips")
+
+
 def save_trip_to_db(trip):
-    client = get_firestore_client()
-    if client is None:
-        st.session_state["trips"].append(trip)
-        return
+    storage = get_storage()
+    if storage is not None:
+        storage.save_trip(trip)
+
+
+def book_trip_in_db(trip, driver_username=None, driver_updates=None):
+    """Insert a trip and update its driver in one atomic batched write (one round trip)."""
+    storage = get_storage()
+    if storage is None:
+        # The trip only goes to the session's list; the driver to the shared store
+        if driver_username is not None:
+            update_driver_in_db(driver_username, driver_updates)
+    elif driver_username is None:
+        storage.book_trip(trip)
+    else:
+        _shared_drivers().write(
+            lambda storage: storage.book_trip(trip, driver_username, driver_updates),
+            DRIVER_UPDATED, driver_username, dict(driver_updates),
+        )
+
 
-    client.collection("trips").add(trip)
+FIRESTORE_WRITE_BEHIND = False  # queue driver status / location pings, committed in batches
+
+
+@st.cache_resource(show_spinner=False)
+def _write_behind_queue():
+    return WriteBehindQueue()
+
+
+def update_driver_location_in_db(username, updates):
+    """Driver status / location ping: via the write-behind queue when enabled."""
+    if FIRESTORE_WRITE_BEHIND:
+        client = get_firestore_client(warn=False)
+        if client is not None:
+            _shared_drivers().queue(client, username, updates)
+            return
+    update_driver_in_db(username, updates)
 
 # -------------------------------------------------
 # LANGUAGE SUPPORT
@@ -440,124 +617,20 @@ def L(key):
 st.title(L("title"))
 st.caption(L("subtitle"))
 
-# -------------------------------------------------
-# ROUTING HELPERS
-# -------------------------------------------------
-def haversine_miles(lat1, lon1, lat2, lon2):
-    """Great-circle distance between two points (in miles)."""
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    miles = km * 0.621371
-    return miles
-
-
-def get_distance_miles_openrouteservice(lat1, lon1, lat2, lon2):
-    """Use OpenRouteService (OSM-based) to get driving distance in miles."""
-    if not ORS_API_KEY:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-    url = "https://api.openrouteservice.org/v2/directions/driving-car"
-    headers = {"Authorization": ORS_API_KEY, "Content-Type": "application/json"}
-    payload = {
-        "coordinates": [
-            [lon1, lat1],
-            [lon2, lat2]
-        ]
-    }
-
-    try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        meters = data["features"][0]["properties"]["segments"][0]["distance"]
-        miles = meters * 0.000621371
-        return miles
-    except Exception:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-
-def get_distance_miles_google(lat1, lon1, lat2, lon2):
-    """Use Google Distance Matrix API to get driving distance in miles."""
-    if not GOOGLE_MAPS_API_KEY:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-    base_url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        "origins": f"{lat1},{lon1}",
-        "destinations": f"{lat2},{lon2}",
-        "mode": "driving",
-        "units": "imperial",
-        "key": GOOGLE_MAPS_API_KEY,
-    }
-
-    try:
-        resp = requests.get(base_url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        element = data["rows"][0]["elements"][0]
-        if element.get("status") != "OK":
-            return haversine_miles(lat1, lon1, lat2, lon2)
-        meters = element["distance"]["value"]
-        miles = meters * 0.000621371
-        return miles
-    except Exception:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-
-def get_trip_distance_miles(lat1, lon1, lat2, lon2):
-    """Unified routing function."""
-    if not USE_REAL_ROUTING:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-    if ROUTING_PROVIDER == "openrouteservice":
-        return get_distance_miles_openrouteservice(lat1, lon1, lat2, lon2)
-    elif ROUTING_PROVIDER == "google":
-        return get_distance_miles_google(lat1, lon1, lat2, lon2)
-    else:
-        return haversine_miles(lat1, lon1, lat2, lon2)
-
-
-def compute_fare(distance_miles, base_fare=1000, per_mile=300):
-    return round(base_fare + per_mile * distance_miles, 0)
-
-
-MALI_CITIES = {
-    "Bamako": (12.6392, -8.0029),
-    "Kayes": (14.4469, -11.4445),
-    "Ségou": (13.4317, -6.2157),
-    "Mopti": (14.4843, -4.1828),
-    "Sikasso": (11.3170, -5.6665),
-    "Gao": (16.2667, -0.0500),
-    "Tombouctou": (16.7666, -3.0026),
-}
-
-BKO_NEIGHBORHOODS = {
-    "ACI 2000": (12.6475, -7.9835),
-    "Kalaban-Coura": (12.6100, -7.9660),
-    "Badalabougou": (12.6290, -7.9900),
-    "Hamdallaye": (12.6540, -7.9810),
-    "Lafiabougou": (12.6520, -8.0100),
-    "Magnambougou": (12.6250, -7.9500),
-    "Sogoniko": (12.6100, -7.9500),
-    "Baco-Djicoroni": (12.6040, -8.0400),
-    "Djélibougou": (12.6400, -7.9400),
-}
-
 # -------------------------------------------------
 # SESSION STATE
 # -------------------------------------------------
-if "drivers" not in st.session_state:
-    st.session_state["drivers"] = load_drivers_from_db()
+# Shared, read-only drivers snapshot (see _SharedDrivers)
+drivers = driver_snapshot()
 if "logged_driver" not in st.session_state:
     st.session_state["logged_driver"] = None
 if "current_trip" not in st.session_state:
     st.session_state["current_trip"] = None
 if "trips" not in st.session_state:
     st.session_state["trips"] = load_trips_from_db()
+if "heavy_hitters" not in st.session_state:
+    # Per-day top-K sketches for the admin leaderboards, updated as trips are booked
+    st.session_state["heavy_hitters"] = build_heavy_hitters(st.session_state["trips"])
 if "admin_ok" not in st.session_state:
     st.session_state["admin_ok"] = False
 
@@ -639,8 +712,7 @@ if mode == L("driver_area"):
             if not first_name or not last_name or not username or not pin:
                 st.error(L("missing_fields"))
             else:
-                existing = [d for d in st.session_state["drivers"] if d["username"] == username]
-                if existing:
+                if drivers.get(username) is not None:
                     st.error(L("id_used"))
                 else:
                     driver = {
@@ -657,7 +729,6 @@ if mode == L("driver_area"):
                         "status": L("status_options")[0],
                     }
                     save_driver_to_db(driver)
-                    st.session_state["drivers"].append(driver)
                     st.success(
                         L("reg_success").format(
                             name=f"{first_name} {last_name}",
@@ -678,11 +749,10 @@ if mode == L("driver_area"):
 
         driver_obj = None
         if submit_login:
-            for d in st.session_state["drivers"]:
-                if d["username"] == login_user and d["pin"] == login_pin:
-                    driver_obj = d
-                    st.session_state["logged_driver"] = login_user
-                    break
+            d = drivers.get(login_user)
+            if d is not None and d["pin"] == login_pin:
+                driver_obj = d
+                st.session_state["logged_driver"] = login_user
             if driver_obj:
                 st.success(L("login_success").format(name=driver_obj["first_name"]))
             else:
@@ -690,12 +760,7 @@ if mode == L("driver_area"):
 
         if st.session_state["logged_driver"]:
             username_logged = st.session_state["logged_driver"]
-            index_logged = None
-            for idx, d in enumerate(st.session_state["drivers"]):
-                if d["username"] == username_logged:
-                    index_logged = idx
-                    driver_obj = d
-                    break
+            driver_obj = drivers.get(username_logged)
 
             if driver_obj is not None:
                 st.markdown("---")
@@ -715,20 +780,20 @@ if mode == L("driver_area"):
                         new_lon = st.number_input(L("current_lon"), value=float(driver_obj["lon"]))
                     update_btn = st.form_submit_button(L("update_btn"))
 
-                if update_btn and index_logged is not None:
+                if update_btn:
                     updates = {
                         "status": new_status,
                         "lat": new_lat,
                         "lon": new_lon,
                     }
-                    st.session_state["drivers"][index_logged].update(updates)
-                    update_driver_in_db(username_logged, updates)
+                    update_driver_location_in_db(username_logged, updates)
                     st.success(L("update_success"))
 
     st.markdown("---")
     st.subheader(L("all_drivers"))
-    if st.session_state["drivers"]:
-        df_drivers_all = pd.DataFrame(st.session_state["drivers"])
+    drivers = driver_snapshot()  # includes this run's registration / update
+    if drivers:
+        df_drivers_all = drivers.frame()
         display_cols = [
             "username", "first_name", "last_name", "age",
             "transport_type", "payment_method", "city", "status", "lat", "lon"
@@ -748,10 +813,7 @@ elif mode == L("passenger_area"):
     status_available = L("status_options")[0]
     status_busy = L("status_options")[1]
 
-    available_drivers = [
-        d for d in st.session_state["drivers"]
-        if d["status"] == status_available
-    ]
+    available_drivers = drivers.with_status(status_available)
 
     if not available_drivers:
         st.warning(L("no_available"))
@@ -862,12 +924,15 @@ elif mode == L("passenger_area"):
                     else:
                         origin_label = f"{selected_city_for_within} (manual coords)"
                         destination_label = f"{selected_city_for_within} (manual coords)"
+                        if selected_city_for_within == "Bamako":
+                            origin_label = gps_label(pickup_lat, pickup_lon, origin_label)
+                            destination_label = gps_label(drop_lat, drop_lon, destination_label)
             elif route_mode == L("preset_route"):
                 origin_label = from_city
                 destination_label = to_city
             else:
-                origin_label = "Manual GPS pickup"
-                destination_label = "Manual GPS dropoff"
+                origin_label = gps_label(pickup_lat, pickup_lon, "Manual GPS pickup")
+                destination_label = gps_label(drop_lat, drop_lon, "Manual GPS dropoff")
 
             if route_mode == L("within_city") and selected_city_for_within is not None:
                 df_avail = df_avail[df_avail["city"] == selected_city_for_within]
@@ -882,7 +947,21 @@ elif mode == L("passenger_area"):
                 df_avail["distance_to_pickup_miles"] = dist_to_pickup_list
                 df_avail = df_avail.sort_values("distance_to_pickup_miles")
 
-                trip_distance = get_trip_distance_miles(pickup_lat, pickup_lon, drop_lat, drop_lon)
+                # City-to-city and neighborhood distances are precomputed (see distance_matrix.py)
+                trip_distance = None
+                trip_provider = None
+                if route_mode == L("preset_route"):
+                    trip_distance = city_distance_miles(from_city, to_city)
+                    if trip_distance is not None:
+                        trip_provider = city_matrix_provider(from_city, to_city)
+                elif use_neigh and pickup_nb and drop_nb:
+                    trip_distance = neighborhood_distance_miles(pickup_nb, drop_nb)
+                    if trip_distance is not None:
+                        trip_provider = neighborhood_matrix_provider(pickup_nb, drop_nb)
+                if trip_distance is None:
+                    trip_distance, trip_provider = get_trip_distance_and_provider(
+                        pickup_lat, pickup_lon, drop_lat, drop_lon
+                    )
                 price = compute_fare(trip_distance, base_fare=base_fare, per_mile=per_mile)
 
                 platform_commission = round(price * platform_pct / 100)
@@ -925,13 +1004,7 @@ elif mode == L("passenger_area"):
                 if st.button(L("confirm_booking")):
                     selected_driver_username = df_avail.loc[selected_idx, "username"]
 
-                    chosen_driver = None
-                    for d in st.session_state["drivers"]:
-                        if d["username"] == selected_driver_username:
-                            d["status"] = status_busy
-                            update_driver_in_db(d["username"], {"status": status_busy})
-                            chosen_driver = d
-                            break
+                    chosen_driver = drivers.get(selected_driver_username)
 
                     trip_data = {
                         "driver_username": selected_driver_username,
@@ -948,7 +1021,7 @@ elif mode == L("passenger_area"):
                         "driver_pct": driver_pct,
                         "route_mode": route_mode,
                         "city": trip_city,
-                        "routing_provider": ROUTING_PROVIDER if USE_REAL_ROUTING else "haversine",
+                        "routing_provider": trip_provider,
                         "created_at": datetime.utcnow().isoformat(),
                         "origin_label": origin_label,
                         "destination_label": destination_label,
@@ -956,7 +1029,13 @@ elif mode == L("passenger_area"):
                     }
                     st.session_state["current_trip"] = trip_data
                     st.session_state["trips"].append(trip_data)
-                    save_trip_to_db(trip_data)
+                    st.session_state["heavy_hitters"].add_trip(trip_data)
+                    # Trip insert + driver busy status in one batched write
+                    book_trip_in_db(
+                        trip_data,
+                        None if chosen_driver is None else chosen_driver["username"],
+                        {"status": status_busy},
+                    )
 
                     if chosen_driver:
                         st.success(
@@ -993,13 +1072,10 @@ else:
 
     st.write(L("admin_desc"))
 
-    drivers = st.session_state["drivers"]
     trips = st.session_state["trips"]
 
-    df_trips = pd.DataFrame(trips) if trips else pd.DataFrame()
-
-    if not df_trips.empty and "created_at" in df_trips.columns:
-        df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
+    df_trips = to_trip_frame(trips) if trips else pd.DataFrame()
+    trip_download_chunks = None  # default: the filtered frame itself
 
     if not df_trips.empty:
         st.markdown("### 🔎 Filters (trips)")
@@ -1043,22 +1119,115 @@ else:
                 default=provider_options if provider_options else None,
             )
 
-        df_trips_filtered = df_trips.copy()
+        client = get_firestore_client(warn=False)
+        if client is not None:
+            # Filters go into the Firestore query (where / select / paged
+            # start_after); a filter selecting every option is left out.
+            # Refetched only when the filters change or the store does. The
+            # trips download needs whole documents: fetched on click only.
+            pushdown = {
+                "cities": city_filter if set(city_filter) != set(city_options) else None,
+                "start": start_date,
+                "end": end_date,
+                "providers": provider_filter if set(provider_filter) != set(provider_options) else None,
+            }
+            pushdown_key = (repr(pushdown), trips_version())
+            if st.session_state.get("admin_trips_key") != pushdown_key:
+                st.session_state["admin_trips"] = fetch_trips(client, **pushdown)
+                st.session_state["admin_trips_key"] = pushdown_key
+            admin_trips = st.session_state["admin_trips"]
+            df_trips_filtered = to_trip_frame(admin_trips) if admin_trips else pd.DataFrame()
+
+            def trip_download_chunks(client=client, pushdown=pushdown):
+                full_trips = fetch_trips(client, fields=None, **pushdown)
+                return frame_chunks(to_trip_frame(full_trips) if full_trips else pd.DataFrame())()
+        else:
+            df_trips_filtered = df_trips.copy()
 
-        if city_options and city_filter:
-            df_trips_filtered = df_trips_filtered[df_trips_filtered["city"].isin(city_filter)]
+            if city_options and city_filter:
+                df_trips_filtered = df_trips_filtered[df_trips_filtered["city"].isin(city_filter)]
 
-        if "created_at" in df_trips_filtered.columns and df_trips_filtered["created_at"].notna().any():
-            df_trips_filtered = df_trips_filtered[
-                (df_trips_filtered["created_at"].dt.date >= start_date)
-                & (df_trips_filtered["created_at"].dt.date <= end_date)
-            ]
+            if "created_at" in df_trips_filtered.columns and df_trips_filtered["created_at"].notna().any():
+                df_trips_filtered = df_trips_filtered[
+                    (df_trips_filtered["created_at"].dt.date >= start_date)
+                    & (df_trips_filtered["created_at"].dt.date <= end_date)
+                ]
 
-        if provider_options and provider_filter and "routing_provider" in df_trips_filtered.columns:
-            df_trips_filtered = df_trips_filtered[df_trips_filtered["routing_provider"].isin(provider_filter)]
+            if provider_options and provider_filter and "routing_provider" in df_trips_filtered.columns:
+                df_trips_filtered = df_trips_filtered[df_trips_filtered["routing_provider"].isin(provider_filter)]
+
+        sketch_filters = {
+            "cities": city_filter if city_options else None,
+            "providers": provider_filter if provider_options else None,
+            "start": start_date,
+            "end": end_date,
+        }
 
     else:
         df_trips_filtered = df_trips
+        sketch_filters = {}
+
+    # Top drivers / routes come from the streaming sketches unless an exact
+    # (audit) leaderboard is requested
+    exact_leaderboards = st.checkbox(
+        "Exact leaderboards (audit)",
+        value=False,
+        help="Unchecked: top drivers and routes are estimated from per-day Space-Saving "
+             "sketches, with an error bound. Checked: computed from every filtered trip.",
+    )
+
+    # Downloads are generated on click; the trips export is cached per
+    # filter state and trips version (which also moves on in-place updates)
+    export_format = st.selectbox("Download format", available_formats(), key="export_format")
+    export_state = (repr(sketch_filters), trips_version())
+
+    # Every summary table below (city, routing provider, and driver / route
+    # in exact mode) in one scan of the filtered trips
+    summary_dims = ["city", "routing_provider"]
+    if exact_leaderboards:
+        summary_dims += ["driver_username", "route_summary"]
+    summaries = {}
+    if not df_trips_filtered.empty:
+        summaries = grouping_sets(
+            df_trips_filtered,
+            [d for d in summary_dims if d in df_trips_filtered.columns],
+        )
+    summary_columns = {
+        "trips": "trips_count",
+        "distance_miles_sum": "total_distance_miles",
+        "distance_miles_mean": "avg_distance_miles",
+        "price_xof_sum": "total_revenue_xof",
+        "platform_commission_xof_sum": "total_platform_xof",
+        "driver_earnings_xof_sum": "total_driver_xof",
+    }
+
+    def summary_table(dim, columns, tables=None):
+        table = (summaries if tables is None else tables)[dim].rename(columns=summary_columns)
+        for c in ("total_distance_miles", "avg_distance_miles"):
+            if c in table.columns:
+                table[c] = table[c].round(2)
+        return table[[dim] + [c for c in columns if c in table.columns]]
+
+    def leaderboard(dim, sketch_name, estimate_column, columns):
+        """
+        Exact summary table, or the sketch estimate and its error bound with
+        the other columns summed over the trips of the sketch's items only.
+        """
+        if exact_leaderboards:
+            return summary_table(dim, columns) if dim in summaries else None
+        if df_trips_filtered.empty or dim not in df_trips_filtered.columns:
+            return None
+        top = st.session_state["heavy_hitters"].top(sketch_name, n=50, **sketch_filters)
+        top = top.drop(columns="lower_bound").rename(columns={
+            "estimate": estimate_column,
+            "error": estimate_column + "_error",
+        })
+        top_trips = df_trips_filtered[df_trips_filtered[dim].isin(top[dim])]
+        if top_trips.empty:
+            return top
+        others = summary_table(dim, [c for c in columns if c != estimate_column], grouping_sets(top_trips, [dim]))
+        others[dim] = others[dim].astype(object)
+        return top.merge(others, on=dim, how="left")
 
     col_a, col_b, col_c, col_d, col_e, col_f, col_g, col_h = st.columns(8)
 
@@ -1101,14 +1270,19 @@ else:
     st.markdown("---")
     st.subheader(L("drivers_table_header"))
     if drivers:
-        df_drivers = pd.DataFrame(drivers)
-        st.dataframe(df_drivers)
-        csv_drivers = df_drivers.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            label=L("download_drivers"),
-            data=csv_drivers,
-            file_name="drivers_mali_ride.csv",
-            mime="text/csv"
+        df_drivers = drivers.frame()
+        paginated_table(
+            "drivers_raw",
+            frame_source(df_drivers),
+            df_drivers.columns,
+            filters={c: sorted(df_drivers[c].dropna().unique()) for c in ("city", "status") if c in df_drivers.columns},
+            default_sort="username",
+        )
+        export_download_button(
+            L("download_drivers"),
+            "drivers_mali_ride",
+            frame_chunks(df_drivers),
+            export_format,
         )
     else:
         st.info(L("no_drivers"))
@@ -1116,43 +1290,40 @@ else:
     st.markdown("---")
     st.subheader(L("trips_table_header") + " (filtered)")
     if not df_trips_filtered.empty:
-        st.dataframe(df_trips_filtered)
-        csv_trips = df_trips_filtered.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            label=L("download_trips"),
-            data=csv_trips,
-            file_name="trips_mali_ride_filtered.csv",
-            mime="text/csv"
+        paginated_table(
+            "trips_raw",
+            frame_source(df_trips_filtered),
+            [c for c in df_trips_filtered.columns if c != "date_only"],
+            filters={c: sorted(df_trips_filtered[c].dropna().unique()) for c in ("status",) if c in df_trips_filtered.columns},
+            default_sort="created_at",
+            default_ascending=False,
+        )
+        export_download_button(
+            L("download_trips"),
+            "trips_mali_ride_filtered",
+            trip_download_chunks or frame_chunks(df_trips_filtered),
+            export_format,
+            cache_key=export_state,
         )
     else:
         st.info("No trips (for current filters).")
 
     st.markdown("---")
     st.subheader("📍 City-level summary (filtered trips)")
-    if not df_trips_filtered.empty and "city" in df_trips_filtered.columns:
-        df_city = df_trips_filtered.copy()
-        df_city = df_city.dropna(subset=["city"])
-        if not df_city.empty:
-            city_group = df_city.groupby("city").agg(
-                trips_count=("price_xof", "count"),
-                total_distance_miles=("distance_miles", "sum"),
-                avg_distance_miles=("distance_miles", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-                total_platform_xof=("platform_commission_xof", "sum"),
-                total_driver_xof=("driver_earnings_xof", "sum"),
-            ).reset_index()
-
-            city_group["total_distance_miles"] = city_group["total_distance_miles"].round(2)
-            city_group["avg_distance_miles"] = city_group["avg_distance_miles"].round(2)
+    if "city" in summaries:
+        city_group = summary_table("city", [
+            "trips_count", "total_distance_miles", "avg_distance_miles",
+            "total_revenue_xof", "total_platform_xof", "total_driver_xof",
+        ])
+        if not city_group.empty:
 
             st.dataframe(city_group)
 
-            csv_city = city_group.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Download city summary as CSV",
-                data=csv_city,
-                file_name="city_summary_mali_ride.csv",
-                mime="text/csv"
+            export_download_button(
+                "Download city summary as CSV",
+                "city_summary_mali_ride",
+                frame_chunks(city_group),
+                export_format,
             )
 
             st.markdown("#### Trips by city (count)")
@@ -1164,28 +1335,19 @@ else:
 
     st.markdown("---")
     st.subheader("🛰️ Routing provider comparison (filtered trips)")
-    if not df_trips_filtered.empty and "routing_provider" in df_trips_filtered.columns:
-        df_rp = df_trips_filtered.copy()
-        df_rp = df_rp.dropna(subset=["routing_provider"])
-        if not df_rp.empty:
-            rp_group = df_rp.groupby("routing_provider").agg(
-                trips_count=("price_xof", "count"),
-                total_distance_miles=("distance_miles", "sum"),
-                avg_distance_miles=("distance_miles", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-            ).reset_index()
-
-            rp_group["total_distance_miles"] = rp_group["total_distance_miles"].round(2)
-            rp_group["avg_distance_miles"] = rp_group["avg_distance_miles"].round(2)
+    if "routing_provider" in summaries:
+        rp_group = summary_table("routing_provider", [
+            "trips_count", "total_distance_miles", "avg_distance_miles", "total_revenue_xof",
+        ])
+        if not rp_group.empty:
 
             st.dataframe(rp_group)
 
-            csv_rp = rp_group.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Download routing provider summary as CSV",
-                data=csv_rp,
-                file_name="routing_provider_summary_mali_ride.csv",
-                mime="text/csv"
+            export_download_button(
+                "Download routing provider summary as CSV",
+                "routing_provider_summary_mali_ride",
+                frame_chunks(rp_group),
+                export_format,
             )
 
             st.markdown("#### Trips by routing provider (count)")
@@ -1198,48 +1360,19 @@ else:
     st.markdown("---")
     st.subheader("🏆 Top drivers (filtered trips)")
 
-    if not df_trips_filtered.empty and "driver_username" in df_trips_filtered.columns:
-        df_td = df_trips_filtered.copy()
-        df_td = df_td.dropna(subset=["driver_username"])
-
-        if not df_td.empty:
-            agg = df_td.groupby("driver_username").agg(
-                trips_count=("price_xof", "count"),
-                total_distance_miles=("distance_miles", "sum"),
-                avg_distance_miles=("distance_miles", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-                total_platform_xof=("platform_commission_xof", "sum"),
-                total_driver_xof=("driver_earnings_xof", "sum"),
-            ).reset_index()
-
-            agg["total_distance_miles"] = agg["total_distance_miles"].round(2)
-            agg["avg_distance_miles"] = agg["avg_distance_miles"].round(2)
-
-            if drivers:
-                df_drivers_info = pd.DataFrame(drivers)
-                df_drivers_info = df_drivers_info[[
-                    "username", "first_name", "last_name", "city", "transport_type"
-                ]]
-                agg = agg.merge(
-                    df_drivers_info,
-                    how="left",
-                    left_on="driver_username",
-                    right_on="username"
-                )
-
-                agg["driver_name"] = agg.apply(
-                    lambda r: f"{r.get('first_name', '')} {r.get('last_name', '')}".strip()
-                    if (pd.notna(r.get("first_name", "")) or pd.notna(r.get("last_name", "")))
-                    else r["driver_username"],
-                    axis=1
-                )
-            else:
-                agg["driver_name"] = agg["driver_username"]
+    agg = leaderboard("driver_username", "top_drivers", "total_revenue_xof", [
+        "trips_count", "total_distance_miles", "avg_distance_miles",
+        "total_revenue_xof", "total_platform_xof", "total_driver_xof",
+    ])
+    if agg is not None:
+        if not agg.empty:
+            # Driver names / attributes via the session's driver dimension
+            agg = driver_dimension().enrich(agg, columns=("driver_name", "city", "transport_type"))
 
             cols_order = [
                 "driver_username", "driver_name", "city", "transport_type",
                 "trips_count", "total_distance_miles", "avg_distance_miles",
-                "total_revenue_xof", "total_platform_xof", "total_driver_xof"
+                "total_revenue_xof", "total_revenue_xof_error", "total_platform_xof", "total_driver_xof"
             ]
             agg = agg[[c for c in cols_order if c in agg.columns]]
 
@@ -1250,12 +1383,11 @@ else:
 
             st.dataframe(agg_top)
 
-            csv_top = agg_top.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Download top drivers as CSV",
-                data=csv_top,
-                file_name="top_drivers_mali_ride.csv",
-                mime="text/csv"
+            export_download_button(
+                "Download top drivers as CSV",
+                "top_drivers_mali_ride",
+                frame_chunks(agg_top),
+                export_format,
             )
 
             st.markdown("#### Revenue by driver (XOF)")
@@ -1269,23 +1401,12 @@ else:
     st.markdown("---")
     st.subheader("🛣️ Top routes (filtered trips)")
 
-    if not df_trips_filtered.empty and "route_summary" in df_trips_filtered.columns:
-        df_routes = df_trips_filtered.copy()
-        df_routes = df_routes.dropna(subset=["route_summary"])
-
-        if not df_routes.empty:
-            route_group = df_routes.groupby("route_summary").agg(
-                trips_count=("price_xof", "count"),
-                total_distance_miles=("distance_miles", "sum"),
-                avg_distance_miles=("distance_miles", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-                total_platform_xof=("platform_commission_xof", "sum"),
-                total_driver_xof=("driver_earnings_xof", "sum"),
-            ).reset_index()
-
-            route_group["total_distance_miles"] = route_group["total_distance_miles"].round(2)
-            route_group["avg_distance_miles"] = route_group["avg_distance_miles"].round(2)
-
+    route_group = leaderboard("route_summary", "top_routes", "trips_count", [
+        "trips_count", "total_distance_miles", "avg_distance_miles",
+        "total_revenue_xof", "total_platform_xof", "total_driver_xof",
+    ])
+    if route_group is not None:
+        if not route_group.empty:
             route_group = route_group.sort_values("trips_count", ascending=False)
 
             top_r = st.slider("Number of top routes to display", 3, 50, 10)
@@ -1293,12 +1414,11 @@ else:
 
             st.dataframe(route_top)
 
-            csv_routes = route_top.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Download top routes as CSV",
-                data=csv_routes,
-                file_name="top_routes_mali_ride.csv",
-                mime="text/csv"
+            export_download_button(
+                "Download top routes as CSV",
+                "top_routes_mali_ride",
+                frame_chunks(route_top),
+                export_format,
             )
 
             st.markdown("#### Trips by route (count)")
@@ -0,0 +1,203 @@
+"""
+Bulk cancellation for outages (city-wide shutdown, road closures, ...).
+
+Selects trips by city / time window / driver, computes cancellation fees
+column-wise and writes them with one targeted update of the cancelled
+trips (other trips, and writes made meanwhile, are left alone). The new
+ratings of the penalized drivers are written in the same update: one
+transaction on SQLite, one WriteBatch on Firestore (past the batch limit
+the drivers are committed first, then the trips). The JSON, JSONL and
+memory backends cannot make it atomic and write the drivers, then the
+trips. The rating penalties are appended to the driver ledger once that
+write has succeeded.
+
+Trips already cancelled are never selected, so running the same
+cancellation again (e.g. after a failed run) only cancels what is left.
+Driver ratings are stored as absolute values, so writing them again is
+harmless.
+
+    python bulk_cancel.py --by platform --city Bamako --start 2026-10-01 --end 2026-10-02
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from shared import (
+    load_trips_from_db,
+    load_drivers_from_db,
+    update_trips_and_drivers_in_db,
+    PASSENGER_LATE_CANCEL_FEE_PCT,
+    DRIVER_CANCEL_PENALTY_PCT,
+    DRIVER_RATING_PENALTY_STEP,
+)
+from trip_schema import to_trip_frame
+from driver_ledger import (
+    get_driver_ledger,
+    EVENT_DRIVER_CANCELLATION,
+    EVENT_PASSENGER_CANCELLATION,
+)
+
+# cancelled_by -> (status, fee % of fare). "platform" is for outages: no fee, no penalty.
+CANCELLATION_RULES = {
+    "passenger": ("cancelled_by_passenger", PASSENGER_LATE_CANCEL_FEE_PCT),
+    "driver": ("cancelled_by_driver", DRIVER_CANCEL_PENALTY_PCT),
+    "platform": ("cancelled_by_platform", 0),
+}
+
+CANCELLED_STATUSES = {status for status, _ in CANCELLATION_RULES.values()}
+
+
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def select_trips(df_trips, city=None, start=None, end=None, driver_username=None):
+    """
+    Boolean mask of trips that match the filters and are not cancelled yet.
+
+    city may be a name or a list of names; start/end bound created_at
+    (start inclusive, end exclusive).
+    """
+    mask = pd.Series(True, index=df_trips.index)
+    if "status" in df_trips.columns:
+        mask &= ~df_trips["status"].isin(CANCELLED_STATUSES)
+    if city:
+        cities = [city] if isinstance(city, str) else list(city)
+        mask &= df_trips.get("city", pd.Series(index=df_trips.index, dtype=object)).isin(cities)
+    if driver_username:
+        mask &= df_trips.get("driver_username", pd.Series(index=df_trips.index, dtype=object)) == driver_username
+    if start is not None or end is not None:
+        created = pd.to_datetime(df_trips.get("created_at"), errors="coerce", utc=True, format="ISO8601")
+        if start is not None:
+            mask &= created >= _utc(start)
+        if end is not None:
+            mask &= created < _utc(end)
+    return mask
+
+
+def bulk_cancel_trips(
+    cancelled_by,
+    city=None,
+    start=None,
+    end=None,
+    driver_username=None,
+    batch_size=10000,
+    dry_run=False,
+):
+    """
+    Cancel every matching trip and return a report with per-batch timings.
+
+    Fees follow the same rules as apply_passenger_cancellation /
+    apply_driver_cancellation; cancellations are recorded in the driver
+    ledger, and driver cancellations lower the ratings stored on drivers.
+    """
+    status, fee_pct = CANCELLATION_RULES[cancelled_by]
+    timings = {}
+
+    t0 = time.perf_counter()
+    trips = load_trips_from_db()
+    df = to_trip_frame(trips)
+    positions = [] if df.empty else list(df.index[select_trips(df, city, start, end, driver_username)])
+    timings["select_seconds"] = time.perf_counter() - t0
+
+    report = {
+        "cancelled_by": cancelled_by,
+        "status": status,
+        "matched": len(positions),
+        "total_fees_xof": 0,
+        "batches": [],
+        "drivers_penalized": 0,
+        "dry_run": dry_run,
+    }
+    if not positions:
+        report.update(timings)
+        return report
+
+    prices = df["price_xof"].astype("int64")
+    changes = {}
+    for b in range(0, len(positions), batch_size):
+        tb = time.perf_counter()
+        batch = positions[b:b + batch_size]
+        fees = (prices.loc[batch] * fee_pct / 100.0).round().astype(int)
+        for pos, fee in zip(batch, fees.tolist()):
+            changes[trips[pos]["id"]] = {
+                "status": status,
+                "cancellation_fee_xof": fee,
+                "platform_commission_xof": fee,
+                "driver_earnings_xof": 0,
+            }
+        report["total_fees_xof"] += int(fees.sum())
+        report["batches"].append({
+            "batch": len(report["batches"]),
+            "trips": len(batch),
+            "seconds": time.perf_counter() - tb,
+        })
+
+    if dry_run:
+        report.update(timings)
+        return report
+
+    # The ratings the ledger will give the drivers once the penalties are appended
+    t0 = time.perf_counter()
+    rows, driver_changes = [], {}
+    if cancelled_by in ("driver", "passenger"):
+        kind = EVENT_DRIVER_CANCELLATION if cancelled_by == "driver" else EVENT_PASSENGER_CANCELLATION
+        delta = -DRIVER_RATING_PENALTY_STEP if cancelled_by == "driver" else 0.0
+        rows = [
+            (trips[pos].get("driver_username"), kind, changes[trips[pos]["id"]]["cancellation_fee_xof"], delta)
+            for pos in positions
+            if trips[pos].get("driver_username")
+        ]
+        usernames = {username for username, *_ in rows}
+        ledger = get_driver_ledger()
+        # Opening balances first, so a driver's history starts from its stored rating
+        ledger.seed_from_drivers(d for d in load_drivers_from_db() if d.get("username") in usernames)
+        if cancelled_by == "driver":
+            driver_changes = ledger.projections_after(rows)
+    timings["ratings_seconds"] = time.perf_counter() - t0
+
+    # Trips and driver ratings in one write, then the ledger in one append
+    t0 = time.perf_counter()
+    update_trips_and_drivers_in_db(changes, driver_changes)
+    timings["write_seconds"] = time.perf_counter() - t0
+    if rows:
+        t0 = time.perf_counter()
+        ledger.append_events(rows)
+        timings["ratings_seconds"] += time.perf_counter() - t0
+    report["drivers_penalized"] = len(driver_changes)
+
+    report.update(timings)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cancel many trips at once (outages).")
+    parser.add_argument("--by", choices=sorted(CANCELLATION_RULES), required=True,
+                        help="Who the cancellation is charged to (platform = no fee).")
+    parser.add_argument("--city", action="append", help="City to cancel (repeatable).")
+    parser.add_argument("--start", help="created_at >= START (ISO date/time, UTC)")
+    parser.add_argument("--end", help="created_at < END (ISO date/time, UTC)")
+    parser.add_argument("--driver", help="Only this driver_username")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--dry-run", action="store_true", help="Compute fees but write nothing.")
+    args = parser.parse_args()
+
+    rep = bulk_cancel_trips(
+        args.by,
+        city=args.city,
+        start=args.start,
+        end=args.end,
+        driver_username=args.driver,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(f"Matched {rep['matched']} trips -> {rep['status']}, fees {rep['total_fees_xof']:,} XOF")
+    for b in rep["batches"]:
+        print(f"  batch {b['batch']}: {b['trips']} trips in {b['seconds'] * 1000:.1f} ms")
+    for key in ("select_seconds", "write_seconds", "ratings_seconds"):
+        if key in rep:
+            print(f"  {key.replace('_seconds', '')}: {rep[key] * 1000:.1f} ms")
+    if rep["drivers_penalized"]:
+        print(f"  {rep['drivers_penalized']} drivers penalized")
@@ -0,0 +1,185 @@
+"""
+Bulk copy of drivers and trips between storage backends (storage.py).
+
+Moving data with the per-record save functions costs one full-file
+rewrite (json) or one round trip (Firestore) per record. This streams
+each collection out of the source in batches (Storage.iter_batches) and
+writes every batch with one bulk call on the target: one SQLite
+transaction, one JSONL append, one Firestore WriteBatch.
+
+Progress is kept in a checkpoint file, so an interrupted run picks up
+after the last batch the target committed instead of starting over:
+
+- a batch is recorded as pending before it is written, and done after;
+- on resume, a pending trip batch counts as written if the target holds
+  exactly its rows more than before it (Storage.count). Drivers are
+  upserted by username, so a pending driver batch is simply sent again.
+
+Trips are appended, so copying them into a target that already has trips
+needs --replace (clear the target first) or --append.
+
+    python bulk_transfer.py --from json --to sqlite
+    python bulk_transfer.py --from sqlite --to jsonl --to-dir backups/2026-10-19
+    python bulk_transfer.py --from firestore --to sqlite --kinds trips --replace
+"""
+import argparse
+import os
+import time
+
+from firestore_writes import MAX_BATCH_WRITES
+from shared import DATA_DIR
+from storage import STORAGE_BACKENDS, JsonlStorage, make_storage, read_json, write_json
+
+KINDS = ("drivers", "trips")
+DEFAULT_BATCH_SIZE = 5000
+
+
+def checkpoint_path(source, target):
+    return os.path.join(DATA_DIR, f"bulk_transfer_{source}_{target}.json")
+
+
+def _describe(kind, data_dir):
+    return kind if kind in ("firestore", "memory") else f"{kind}:{os.path.abspath(data_dir)}"
+
+
+# ---------------------------------
+# TRANSFER
+# ---------------------------------
+def _settle_pending(target, kind, state):
+    """Finish or drop the batch an interrupted run was writing."""
+    pending = state.pop("pending", None)
+    if pending is None or kind == "drivers":
+        return None
+    count = target.count(kind)
+    if count == state["target_rows"] + pending["rows"]:
+        state["cursor"] = pending["cursor"]
+        state["rows"] += pending["rows"]
+        state["target_rows"] = count
+        return "written"
+    if count == state["target_rows"]:
+        return "dropped"
+    raise RuntimeError(
+        f"{kind}: target has {count} rows, expected {state['target_rows']} "
+        f"(+{pending['rows']}); it changed since the checkpoint, use --restart"
+    )
+
+
+def transfer_kind(source, target, kind, state, save, batch_size=DEFAULT_BATCH_SIZE,
+                  replace=False, append=False, on_batch=None):
+    """
+    Copy one collection ("drivers" / "trips") from source to target,
+    resuming from `state` (a checkpoint entry, updated in place; `save()`
+    persists it). Returns the number of rows copied by this call.
+    """
+    if state.get("done"):
+        return 0
+    if "target_rows" not in state:
+        if replace:
+            (target.write_drivers if kind == "drivers" else target.write_trips)([])
+        existing = target.count(kind)
+        if kind == "trips" and existing and not append:
+            raise RuntimeError(f"target already has {existing} trips: use --replace or --append")
+        state.update(cursor=None, rows=0, target_rows=existing, seconds=0.0)
+        save()
+    elif _settle_pending(target, kind, state) is not None:
+        save()
+
+    write = target.save_drivers if kind == "drivers" else target.save_trips
+    copied = 0
+    seconds, started = state["seconds"], time.perf_counter()
+    for batch, cursor in source.iter_batches(kind, batch_size, state["cursor"]):
+        state["pending"] = {"cursor": cursor, "rows": len(batch)}
+        save()
+        t0 = time.perf_counter()
+        write(batch)
+        del state["pending"]
+        state["cursor"] = cursor
+        state["rows"] += len(batch)
+        if kind == "trips":
+            state["target_rows"] += len(batch)
+        state["seconds"] = seconds + time.perf_counter() - started
+        save()
+        copied += len(batch)
+        if on_batch is not None:
+            on_batch(kind, len(batch), time.perf_counter() - t0, state)
+    state["seconds"] = seconds + time.perf_counter() - started
+    state["done"] = True
+    save()
+    return copied
+
+
+def bulk_transfer(source_kind, target_kind, source_dir=DATA_DIR, target_dir=DATA_DIR, kinds=KINDS,
+                  batch_size=DEFAULT_BATCH_SIZE, replace=False, append=False, restart=False,
+                  checkpoint=None, on_batch=None):
+    """
+    Copy `kinds` from one backend to another (see make_storage); returns
+    the checkpoint dict with rows / seconds per kind.
+    """
+    source_name = _describe(source_kind, source_dir)
+    target_name = _describe(target_kind, target_dir)
+    if source_name == target_name:
+        raise ValueError("source and target are the same store")
+    if target_kind == "firestore":
+        batch_size = min(batch_size, MAX_BATCH_WRITES - 1)  # one atomic WriteBatch per batch (+ its _meta counter)
+
+    checkpoint = checkpoint or checkpoint_path(source_kind, target_kind)
+    progress = {} if restart else read_json(checkpoint, {})
+    if progress and (progress.get("source"), progress.get("target")) != (source_name, target_name):
+        raise RuntimeError(f"{checkpoint} is for {progress.get('source')} -> {progress.get('target')}; use --restart")
+    progress.update(source=source_name, target=target_name)
+    progress.setdefault("kinds", {})
+
+    if target_kind not in ("firestore", "memory"):
+        os.makedirs(target_dir, exist_ok=True)
+    source = make_storage(source_kind, source_dir)
+    target = make_storage(target_kind, target_dir)
+    if isinstance(target, JsonlStorage):
+        # Compacting as the log doubles would re-read it every time: leave
+        # one compaction to the target's next regular write
+        target.compact_min_bytes = float("inf")
+    for kind in kinds:
+        state = progress["kinds"].setdefault(kind, {})
+        transfer_kind(source, target, kind, state, lambda: write_json(checkpoint, progress),
+                      batch_size, replace, append, on_batch)
+    return progress
+
+
+def _print_batch(kind, rows, seconds, state):
+    rate = state["rows"] / state["seconds"] if state["seconds"] else 0
+    print(f"  {kind}: +{rows} in {seconds * 1000:.1f} ms, {state['rows']} total, {rate:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    backends = [b for b in STORAGE_BACKENDS if b != "memory"]
+    parser = argparse.ArgumentParser(description="Copy drivers and trips between storage backends.")
+    parser.add_argument("--from", dest="source", choices=backends, required=True)
+    parser.add_argument("--to", dest="target", choices=backends, required=True)
+    parser.add_argument("--from-dir", default=DATA_DIR, help="Data directory of a file / SQLite source.")
+    parser.add_argument("--to-dir", default=DATA_DIR, help="Data directory of a file / SQLite target.")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--replace", action="store_true", help="Clear the target's collections first.")
+    parser.add_argument("--append", action="store_true", help="Add trips to a target that already has some.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of an earlier run.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default data/bulk_transfer_<from>_<to>.json).")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary.")
+    args = parser.parse_args()
+
+    progress = bulk_transfer(
+        args.source,
+        args.target,
+        source_dir=args.from_dir,
+        target_dir=args.to_dir,
+        kinds=args.kinds,
+        batch_size=args.batch_size,
+        replace=args.replace,
+        append=args.append,
+        restart=args.restart,
+        checkpoint=args.checkpoint,
+        on_batch=None if args.quiet else _print_batch,
+    )
+    print(f"{progress['source']} -> {progress['target']}")
+    for kind in args.kinds:
+        state = progress["kinds"][kind]
+        rate = state["rows"] / state["seconds"] if state["seconds"] else 0
+        print(f"  {kind}: {state['rows']} rows in {state['seconds']:.2f} s ({rate:,.0f} rows/s)")
@@ -0,0 +1,139 @@
+"""
+Publish / subscribe for driver and trip changes.
+
+shared.py publishes an event for every driver write, every new trip and
+every targeted trip update / delete; DriverStore and TripStoreView subscribe and apply the event as a
+delta instead of reloading the whole collection.
+
+Events get increasing sequence numbers. With a SQLite path the events go
+through a `changes` table that every process polls (cheap: one indexed
+query for seq > last seen), so a driver going Available in driver_app
+reaches passenger_app on its next rerun. Events are dispatched in
+sequence order, including this process's own, which are dispatched as
+soon as they are published. Without a path the bus is in-process only.
+
+Each event carries the store's version before and after the write, as
+returned by the Storage write itself (read under its lock / transaction,
+so a concurrent write never falls inside another write's span). A
+consumer applies a delta only if its view is exactly at `before`, then
+moves to `after`; at any other version (a missed or pruned event, a
+write that bypassed the bus, another process's Firestore counter) it
+reloads on its next read. Deltas are an optimization, never the only way
+to get current.
+"""
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+
+CHANGE_LOG_KEEP = 10_000   # events kept in the SQLite log
+PRUNE_EVERY = 1_000        # prune the log every N published events
+
+DRIVER_SAVED = "driver_saved"      # key: username, data: the whole driver
+DRIVER_UPDATED = "driver_updated"  # key: username, data: the merged fields
+TRIP_SAVED = "trip_saved"          # data: the trip
+DRIVERS_UPDATED = "drivers_updated"  # data: {username: merged fields}
+TRIPS_UPDATED = "trips_updated"      # data: {trip id: merged fields}
+TRIPS_DELETED = "trips_deleted"      # data: list of trip ids
+
+
+class ChangeEvent:
+    def __init__(self, seq, kind, key, data, before, after):
+        self.seq = seq
+        self.kind = kind
+        self.key = key
+        self.data = data
+        self.before = before
+        self.after = after
+
+    def __repr__(self):
+        return f"ChangeEvent(seq={self.seq}, kind={self.kind!r}, key={self.key!r})"
+
+
+class ChangeBus:
+    """Sequenced change events, in-process or shared through a SQLite file."""
+
+    def __init__(self, path=None, keep=CHANGE_LOG_KEEP):
+        self.path = path
+        self.keep = keep
+        self._lock = threading.RLock()
+        self._subscribers = defaultdict(list)  # kind (None = all) -> callables
+        self._conn = None
+        self.seq = 0                           # last sequence number dispatched
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "kind TEXT NOT NULL, key TEXT, data TEXT, before TEXT, after TEXT)"
+            )
+            # Consumers load the current state themselves; only later events matter
+            self.seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def subscribe(self, fn, kinds=None):
+        """Call fn(event) for events of the given kinds (all kinds if None)."""
+        with self._lock:
+            for kind in kinds or (None,):
+                if fn not in self._subscribers[kind]:
+                    self._subscribers[kind].append(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            for fns in self._subscribers.values():
+                if fn in fns:
+                    fns.remove(fn)
+
+    def publish(self, kind, key=None, data=None, before=None, after=None):
+        """Record an event and dispatch it (and anything published before it); returns its seq."""
+        if self._conn is None:
+            with self._lock:
+                self.seq += 1
+                self._dispatch(ChangeEvent(self.seq, kind, key, data, before, after))
+                return self.seq
+
+        # The connection is shared by every thread: insert, rowid and prune
+        # under the lock, like poll() (re-entrant, so the poll can follow)
+        with self._lock:
+            seq = self._conn.execute(
+                "INSERT INTO changes (kind, key, data, before, after) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, _dumps(data), _dumps(before), _dumps(after)),
+            ).lastrowid
+            if seq % PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - self.keep,))
+            self.poll()
+            return seq
+
+    def poll(self):
+        """Dispatch events other processes published since the last poll; returns how many."""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, kind, key, data, before, after FROM changes WHERE seq > ? ORDER BY seq",
+                (self.seq,),
+            ).fetchall()
+            for seq, kind, key, data, before, after in rows:
+                self.seq = seq
+                self._dispatch(ChangeEvent(seq, kind, key, _loads(data), _loads(before), _loads(after)))
+            return len(rows)
+
+    def _dispatch(self, event):
+        for fn in self._subscribers.get(event.kind, []) + self._subscribers.get(None, []):
+            try:
+                fn(event)
+            except Exception:
+                # consumers fall back to reloading; never fail the writer for them
+                pass
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _loads(value):
+    return None if value is None else json.loads(value)
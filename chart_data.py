@@ -0,0 +1,109 @@
+"""
+Bounded chart payloads for the dashboards.
+
+Charts used to receive one point per trip (distance vs fare) or per day
+(line charts), so what the browser received grew with the history. Data goes
+through this module first:
+
+- hexbin() pre-bins a scatter into a hexagonal 2D histogram: at most
+  about 2 * gridsize**2 / sqrt(3) cells, however many trips there are;
+- downsample() reduces a time series to a fixed point budget with
+  Largest-Triangle-Three-Buckets (Steinarsson, 2013), which keeps the
+  peaks and dips that plain striding would drop.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+HEXBIN_GRIDSIZE = 40      # hexagons across the x range
+MAX_LINE_POINTS = 500     # points per line chart series
+
+
+# ---------------------------------
+# SCATTER -> HEXBIN
+# ---------------------------------
+def hexbin(df, x, y, gridsize=HEXBIN_GRIDSIZE, count_column="trips"):
+    """
+    Hexagonal 2D histogram of df[x] vs df[y].
+
+    Returns one row per non-empty hexagon: its centre (x, y columns) and the
+    number of rows that fall in it (`count_column`). Uses the two offset
+    rectangular lattices construction (as matplotlib's hexbin).
+    """
+    xs = pd.to_numeric(df[x], errors="coerce").to_numpy(np.float64)
+    ys = pd.to_numeric(df[y], errors="coerce").to_numpy(np.float64)
+    keep = np.isfinite(xs) & np.isfinite(ys)
+    xs, ys = xs[keep], ys[keep]
+    if not len(xs):
+        return pd.DataFrame(columns=[x, y, count_column])
+
+    nx = gridsize
+    ny = max(1, int(round(gridsize / math.sqrt(3))))
+    xmin, xmax = xs.min(), xs.max()
+    ymin, ymax = ys.min(), ys.max()
+    sx = (xmax - xmin) / nx or 1.0
+    sy = (ymax - ymin) / ny or 1.0
+    u = (xs - xmin) / sx
+    v = (ys - ymin) / sy
+
+    # Lattice 1 has centres on integer points, lattice 2 on the half-integer
+    # points; each row goes to the nearest centre of either lattice
+    i1, j1 = np.round(u), np.round(v)
+    i2, j2 = np.floor(u), np.floor(v)
+    d1 = (u - i1) ** 2 + 3.0 * (v - j1) ** 2
+    d2 = (u - i2 - 0.5) ** 2 + 3.0 * (v - j2 - 0.5) ** 2
+    first = d1 < d2
+    cu = np.where(first, i1, i2 + 0.5)
+    cv = np.where(first, j1, j2 + 0.5)
+
+    cells = pd.DataFrame({"cu": cu, "cv": cv}).value_counts(sort=False).reset_index(name=count_column)
+    return pd.DataFrame({
+        x: xmin + cells["cu"].to_numpy() * sx,
+        y: ymin + cells["cv"].to_numpy() * sy,
+        count_column: cells[count_column].to_numpy(np.int64),
+    })
+
+
+# ---------------------------------
+# TIME SERIES -> LTTB
+# ---------------------------------
+def lttb_indices(x, y, n_out):
+    """Indices of the n_out points LTTB keeps from (x, y), x sorted ascending."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # First and last points are kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nlo, nhi = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        # Pick the point making the largest triangle with the previous pick
+        # and the average of the next bucket
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def downsample(series, max_points=MAX_LINE_POINTS):
+    """
+    Series (index = x, e.g. dates) reduced to at most max_points with LTTB.
+    Missing values are dropped; short series are returned sorted, unchanged.
+    """
+    s = series.dropna().sort_index()
+    if len(s) <= max_points:
+        return s
+    index = s.index
+    if pd.api.types.is_numeric_dtype(index):
+        xs = index.to_numpy(np.float64)
+    else:
+        xs = pd.to_datetime(index).to_numpy("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return s.iloc[lttb_indices(xs, s.to_numpy(np.float64), max_points)]
@@ -0,0 +1,277 @@
+"""
+Precomputed road distances between fixed places.
+
+The road distance between two Mali cities (or two Bamako neighborhoods)
+never changes, so instead of calling the routing API for every quote we
+build the full matrix once, ship it as a small JSON file and look
+distances up. GPS points can be snapped to the nearest neighborhood so
+arbitrary trips can be grouped (and priced) by neighborhood pair.
+
+Each pair records the provider that computed it. A pair that only has a
+haversine estimate (built with --haversine, or the routing API failed for
+it) is not used while a real routing provider is configured: the quote is
+then routed live instead.
+
+Build / refresh the matrix from the command line:
+
+    python distance_matrix.py               # configured routing provider
+    python distance_matrix.py --haversine   # offline stand-in, no API calls
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+from math import radians, cos, sqrt
+
+import numpy as np
+
+from shared import (
+    DATA_DIR,
+    MALI_CITIES,
+    BKO_NEIGHBORHOODS,
+    haversine_miles,
+    get_trip_distance_and_provider,
+    active_routing_provider,
+)
+
+CITY_MATRIX_PATH = os.path.join(DATA_DIR, "city_distance_matrix.json")
+NEIGHBORHOOD_MATRIX_PATH = os.path.join(DATA_DIR, "neighborhood_distance_matrix.json")
+
+# A GPS point further than this from every neighborhood is not snapped
+NEIGHBORHOOD_SNAP_MILES = 2.0
+
+# path -> (mtime, matrix); lets a refresh done by another process be picked up
+_LOADED = {}
+
+
+# ---------------------------------
+# BUILD / SAVE / LOAD
+# ---------------------------------
+
+def build_matrix(points, provider=None):
+    """
+    Compute the full distance matrix for a {name: (lat, lon)} mapping.
+
+    provider=None uses the configured routing provider (which itself falls
+    back to haversine when no API key is set, or per pair when the API
+    fails); "haversine" forces the offline stand-in. "providers" records
+    the provider of each pair, "provider" the one shared by every pair
+    ("mixed" otherwise).
+    """
+    if provider == "haversine":
+        def distance_fn(*coords):
+            return haversine_miles(*coords), "haversine"
+    else:
+        distance_fn = get_trip_distance_and_provider
+
+    names = list(points.keys())
+    miles, providers = [], []
+    for a in names:
+        row, row_providers = [], []
+        for b in names:
+            if a == b:
+                d, used = 0.0, None
+            else:
+                d, used = distance_fn(*points[a], *points[b])
+            row.append(round(float(d), 2))
+            row_providers.append(used)
+        miles.append(row)
+        providers.append(row_providers)
+
+    used = {p for row in providers for p in row if p is not None}
+    return {
+        "provider": used.pop() if len(used) == 1 else ("mixed" if used else active_routing_provider()),
+        "built_at": datetime.utcnow().isoformat(),
+        "names": names,
+        "miles": miles,
+        "providers": providers,
+    }
+
+
+def save_matrix(matrix, path):
+    """Write the matrix as compact JSON (atomic replace)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(matrix, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    _LOADED.pop(path, None)
+
+
+def load_matrix(path):
+    """Return the matrix stored at path (cached until the file changes), or None."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _LOADED.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            matrix = json.load(f)
+    except Exception:
+        return None
+    matrix["index"] = {name: i for i, name in enumerate(matrix.get("names", []))}
+    _LOADED[path] = (mtime, matrix)
+    return matrix
+
+
+def matrix_provider(matrix, a, b):
+    """Provider that computed the a -> b distance (matrices without "providers": the matrix's)."""
+    if matrix is None:
+        return None
+    i = matrix["index"].get(a)
+    j = matrix["index"].get(b)
+    if i is None or j is None:
+        return None
+    providers = matrix.get("providers")
+    return (providers[i][j] if providers else None) or matrix.get("provider")
+
+
+def matrix_distance_miles(matrix, a, b):
+    """
+    Distance a -> b from a loaded matrix, or None if either name is unknown,
+    or if the pair is a haversine estimate while a real routing provider
+    is configured (the caller routes it live instead).
+    """
+    if matrix is None:
+        return None
+    i = matrix["index"].get(a)
+    j = matrix["index"].get(b)
+    if i is None or j is None:
+        return None
+    if i != j and matrix_provider(matrix, a, b) == "haversine" and active_routing_provider() != "haversine":
+        return None
+    return matrix["miles"][i][j]
+
+
+# ---------------------------------
+# CITY-TO-CITY
+# ---------------------------------
+
+def load_city_matrix():
+    return load_matrix(CITY_MATRIX_PATH)
+
+
+def city_distance_miles(from_city, to_city):
+    """Road distance between two MALI_CITIES entries, or None if not precomputed."""
+    return matrix_distance_miles(load_city_matrix(), from_city, to_city)
+
+
+def city_matrix_provider(from_city, to_city):
+    """Provider of the precomputed from_city -> to_city distance."""
+    return matrix_provider(load_city_matrix(), from_city, to_city)
+
+
+def refresh_city_matrix(provider=None):
+    """Recompute the city-to-city matrix and store it."""
+    matrix = build_matrix(MALI_CITIES, provider=provider)
+    save_matrix(matrix, CITY_MATRIX_PATH)
+    return load_city_matrix()
+
+
+# ---------------------------------
+# BAMAKO NEIGHBORHOODS
+# ---------------------------------
+
+def load_neighborhood_matrix():
+    return load_matrix(NEIGHBORHOOD_MATRIX_PATH)
+
+
+def neighborhood_distance_miles(pickup_nb, drop_nb):
+    """Road distance between two BKO_NEIGHBORHOODS entries, or None if not precomputed."""
+    return matrix_distance_miles(load_neighborhood_matrix(), pickup_nb, drop_nb)
+
+
+def neighborhood_matrix_provider(pickup_nb, drop_nb):
+    """Provider of the precomputed pickup_nb -> drop_nb distance."""
+    return matrix_provider(load_neighborhood_matrix(), pickup_nb, drop_nb)
+
+
+def refresh_neighborhood_matrix(provider=None):
+    """Recompute the neighborhood x neighborhood matrix and store it."""
+    matrix = build_matrix(BKO_NEIGHBORHOODS, provider=provider)
+    save_matrix(matrix, NEIGHBORHOOD_MATRIX_PATH)
+    return load_neighborhood_matrix()
+
+
+# Neighborhood centres projected once (equirectangular around Bamako), so
+# snapping is a handful of multiplications instead of trig per point.
+_MILES_PER_DEGREE = 6371.0 * 0.621371 * radians(1.0)
+_NB_NAMES = list(BKO_NEIGHBORHOODS.keys())
+_NB_LAT = np.array([BKO_NEIGHBORHOODS[n][0] for n in _NB_NAMES])
+_NB_LON = np.array([BKO_NEIGHBORHOODS[n][1] for n in _NB_NAMES])
+_NB_COS_LAT = cos(radians(float(_NB_LAT.mean())))
+
+
+def nearest_neighborhood(lat, lon, max_miles=NEIGHBORHOOD_SNAP_MILES):
+    """
+    Snap a GPS point to the closest Bamako neighborhood.
+
+    Returns (name, miles) or (None, None) when the point is further than
+    max_miles from every neighborhood (e.g. outside Bamako).
+    """
+    if lat is None or lon is None:
+        return None, None
+    best_name, best_sq = None, None
+    for name, nb_lat, nb_lon in zip(_NB_NAMES, _NB_LAT, _NB_LON):
+        dy = lat - nb_lat
+        dx = (lon - nb_lon) * _NB_COS_LAT
+        sq = dx * dx + dy * dy
+        if best_sq is None or sq < best_sq:
+            best_name, best_sq = name, sq
+    miles = float(sqrt(best_sq) * _MILES_PER_DEGREE)
+    if miles > max_miles:
+        return None, None
+    return best_name, miles
+
+
+def gps_label(lat, lon, default):
+    """Label a GPS point like a neighborhood pick ("Bamako – X") when it snaps to one."""
+    name, _ = nearest_neighborhood(lat, lon)
+    if name is None:
+        return default
+    return f"Bamako – {name}"
+
+
+def snap_to_neighborhoods(lats, lons, max_miles=NEIGHBORHOOD_SNAP_MILES):
+    """
+    Vectorized nearest_neighborhood for whole columns of coordinates.
+
+    Returns an object array of neighborhood names (None where nothing is
+    within max_miles or the coordinate is missing).
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    dy = lats[:, None] - _NB_LAT[None, :]
+    dx = (lons[:, None] - _NB_LON[None, :]) * _NB_COS_LAT
+    sq = dx * dx + dy * dy
+    sq = np.where(np.isnan(sq), np.inf, sq)
+    best = sq.argmin(axis=1) if len(lats) else np.zeros(0, dtype=int)
+    best_miles = np.sqrt(sq[np.arange(len(lats)), best]) * _MILES_PER_DEGREE
+    names = np.array(_NB_NAMES, dtype=object)[best]
+    names[~(best_miles <= max_miles)] = None
+    return names
+
+
+# Load once at startup so the first quote is already a lookup.
+load_city_matrix()
+load_neighborhood_matrix()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the precomputed distance matrices.")
+    parser.add_argument(
+        "--haversine",
+        action="store_true",
+        help="Use straight-line distances instead of the routing provider (no API calls).",
+    )
+    args = parser.parse_args()
+
+    provider = "haversine" if args.haversine else None
+    m = refresh_city_matrix(provider=provider)
+    print(f"City matrix: {len(m['names'])} cities via {m['provider']} -> {CITY_MATRIX_PATH}")
+    m = refresh_neighborhood_matrix(provider=provider)
+    print(f"Neighborhood matrix: {len(m['names'])} neighborhoods via {m['provider']} -> {NEIGHBORHOOD_MATRIX_PATH}")
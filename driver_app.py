@@ -5,13 +5,14 @@ import pandas as pd
 from shared import (
     LANG_OPTIONS,
     labels,
-    load_drivers_from_db,
     save_driver_to_db,
     update_driver_in_db,
-    load_trips_from_db,
     get_commission_pct,
     MALI_CITIES,
 )
+from distance_matrix import nearest_neighborhood
+from earnings_ledger import get_earnings_ledger
+from driver_store import get_driver_store
 
 st.set_page_config(page_title="Mali Ride – Driver App", layout="centered")
 
@@ -30,8 +31,8 @@ st.caption(L("subtitle"))
 # ----------------------------
 # SESSION STATE
 # ----------------------------
-if "drivers" not in st.session_state:
-    st.session_state["drivers"] = load_drivers_from_db()
+# Shared, read-only drivers snapshot (see driver_store.py)
+drivers = get_driver_store().snapshot()
 if "logged_driver" not in st.session_state:
     st.session_state["logged_driver"] = None
 
@@ -79,8 +80,7 @@ with tab_reg:
         if not first_name or not last_name or not username or not pin:
             st.error(L("missing_fields"))
         else:
-            existing = [d for d in st.session_state["drivers"] if d["username"] == username]
-            if existing:
+            if drivers.get(username) is not None:
                 st.error(L("id_used"))
             else:
                 driver = {
@@ -97,7 +97,6 @@ with tab_reg:
                     "status": L("status_options")[0],
                 }
                 save_driver_to_db(driver)
-                st.session_state["drivers"].append(driver)
                 st.success(
                     L("reg_success").format(
                         name=f"{first_name} {last_name}",
@@ -118,11 +117,10 @@ with tab_login:
 
     driver_obj = None
     if submit_login:
-        for d in st.session_state["drivers"]:
-            if d["username"] == login_user and d["pin"] == login_pin:
-                driver_obj = d
-                st.session_state["logged_driver"] = login_user
-                break
+        d = drivers.get(login_user)
+        if d is not None and d["pin"] == login_pin:
+            driver_obj = d
+            st.session_state["logged_driver"] = login_user
         if driver_obj:
             st.success(L("login_success").format(name=driver_obj["first_name"]))
         else:
@@ -130,12 +128,7 @@ with tab_login:
 
     if st.session_state["logged_driver"]:
         username_logged = st.session_state["logged_driver"]
-        index_logged = None
-        for idx, d in enumerate(st.session_state["drivers"]):
-            if d["username"] == username_logged:
-                index_logged = idx
-                driver_obj = d
-                break
+        driver_obj = drivers.get(username_logged)
 
         if driver_obj is not None:
             st.markdown("---")
@@ -155,44 +148,29 @@ with tab_login:
                     new_lon = st.number_input(L("current_lon"), value=float(driver_obj["lon"]))
                 update_btn = st.form_submit_button(L("update_btn"))
 
-            if update_btn and index_logged is not None:
+            if update_btn:
+                nearest_nb, _ = nearest_neighborhood(new_lat, new_lon)
                 updates = {
                     "status": new_status,
                     "lat": new_lat,
                     "lon": new_lon,
+                    "neighborhood": nearest_nb,
                 }
-                st.session_state["drivers"][index_logged].update(updates)
                 update_driver_in_db(username_logged, updates)
+                driver_obj = get_driver_store().snapshot().get(username_logged) or driver_obj
                 st.success(L("update_success"))
 
+            if driver_obj.get("neighborhood"):
+                st.caption(f"📍 Nearest Bamako neighborhood: **{driver_obj['neighborhood']}**")
+
             # --- Earnings & trips tracker (last 7 days) ---
             st.markdown("#### 📊 Weekly earnings & trips")
 
-            trips_history = load_trips_from_db()
-            weekly_trips = 0
-            total_driver_earnings = 0
-            total_platform_commission = 0
-            try:
-                df_trips = pd.DataFrame(trips_history)
-                if not df_trips.empty and "created_at" in df_trips.columns and "driver_username" in df_trips.columns:
-                    df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-                    now = pd.Timestamp.utcnow()
-                    last_7_days = now - pd.Timedelta(days=7)
-                    mask = (
-                        (df_trips["driver_username"] == username_logged)
-                        & (df_trips["created_at"] >= last_7_days)
-                        & (df_trips["created_at"] <= now)
-                    )
-                    df_week = df_trips[mask].copy()
-                    weekly_trips = len(df_week)
-                    if "driver_earnings_xof" in df_week.columns:
-                        total_driver_earnings = float(df_week["driver_earnings_xof"].sum())
-                    if "platform_commission_xof" in df_week.columns:
-                        total_platform_commission = float(df_week["platform_commission_xof"].sum())
-            except Exception:
-                weekly_trips = 0
-                total_driver_earnings = 0
-                total_platform_commission = 0
+            # O(1) lookup in the per-driver daily prefix sums
+            week = get_earnings_ledger().last_days(username_logged, days=7)
+            weekly_trips = week["trips"]
+            total_driver_earnings = week["driver_earnings_xof"]
+            total_platform_commission = week["platform_commission_xof"]
 
             current_commission_pct = get_commission_pct(weekly_trips)
 
@@ -205,8 +183,9 @@ with tab_login:
 
 st.markdown("---")
 st.subheader(L("all_drivers"))
-if st.session_state["drivers"]:
-    df_drivers_all = pd.DataFrame(st.session_state["drivers"])
+drivers = get_driver_store().snapshot()  # includes this run's registration / update
+if drivers:
+    df_drivers_all = drivers.frame()
     display_cols = [
         "username", "first_name", "last_name", "age",
         "transport_type", "payment_method", "city", "status", "lat", "lon"
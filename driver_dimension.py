@@ -0,0 +1,157 @@
+"""
+Driver dimension table: username -> display name and attributes.
+
+Leaderboards used to rebuild pd.DataFrame(drivers) on every render, merge
+it in and build `driver_name` with a row-wise apply. A DriverDimension
+keeps one DataFrame indexed by username, updated in place as drivers are
+added or edited, and enrich() adds the driver columns to any frame with
+an index lookup (no Python loop over rows).
+
+Given a change bus (change_bus.py), the dimension applies driver events
+as deltas, like DriverStore: a status / location update touches none of
+its columns and costs nothing. follow() only re-syncs every driver when
+the snapshot was reloaded or an event could not be applied.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from change_bus import DRIVER_SAVED, DRIVER_UPDATED, DRIVERS_UPDATED
+from driver_store import get_driver_store
+from shared import get_change_bus
+
+DIM_COLUMNS = ("first_name", "last_name", "city", "transport_type")
+
+
+def display_names(first, last, fallback):
+    """'First Last' per row (vectorized), or `fallback` when both are missing."""
+    first = pd.Series(first, dtype=object).fillna("").astype(str)
+    last = pd.Series(last, dtype=object).fillna("").astype(str).set_axis(first.index)
+    names = (first + " " + last).str.strip()
+    fallback = pd.Series(fallback, dtype=object).set_axis(first.index)
+    return names.where(names != "", fallback)
+
+
+class DriverDimension:
+    """Indexed driver attributes, maintained incrementally."""
+
+    def __init__(self, drivers=(), bus=None):
+        self._lock = threading.Lock()
+        self._rows = {}       # username -> attribute tuple (to skip unchanged upserts)
+        self._pending = {}    # username -> attribute tuple, not yet in the frame
+        self._frame = pd.DataFrame(columns=[*DIM_COLUMNS, "driver_name"], index=pd.Index([], name="username"))
+        self.version = None     # driver store version the rows are at (None: unknown)
+        self.generation = None  # DriverSnapshot.generation of the last sync
+        self._stale = False     # an event did not apply: re-sync on the next follow()
+        self.syncs = 0
+        self.deltas = 0
+        self.sync(drivers)
+        if bus is not None:
+            bus.subscribe(self._on_change, (DRIVER_SAVED, DRIVER_UPDATED, DRIVERS_UPDATED))
+
+    def _set_row(self, username, row):
+        # Caller holds self._lock
+        if self._rows.get(username) != row:
+            self._rows[username] = row
+            self._pending[username] = row
+
+    def upsert(self, driver):
+        username = driver.get("username")
+        if not username:
+            return
+        with self._lock:
+            self._set_row(username, tuple(driver.get(c) for c in DIM_COLUMNS))
+
+    def sync(self, drivers, version=None, generation=None):
+        """Upsert every driver and drop the ones no longer listed (at store `version`)."""
+        seen = set()
+        for d in drivers:
+            self.upsert(d)
+            seen.add(d.get("username"))
+        with self._lock:
+            gone = [u for u in self._rows if u not in seen]
+            for u in gone:
+                del self._rows[u]
+                self._pending.pop(u, None)
+            if gone:
+                self._frame = self._frame.drop(index=gone, errors="ignore")
+            self.version = version
+            self.generation = generation
+            self._stale = False
+            self.syncs += 1
+
+    def follow(self, snapshot):
+        """Catch up with a driver_store.DriverSnapshot; a full sync only if deltas did not get there."""
+        with self._lock:
+            current = not self._stale and (self.generation, self.version) == (snapshot.generation, snapshot.version)
+        if not current:
+            self.sync(snapshot, snapshot.version, snapshot.generation)
+
+    def _on_change(self, event):
+        with self._lock:
+            if self.version is not None and self.version == event.after:
+                return  # already synced past this event
+            if self.version is None or self.version != event.before:
+                self._stale = True
+                return
+            if event.kind == DRIVER_SAVED:
+                if event.key:
+                    self._set_row(event.key, tuple(event.data.get(c) for c in DIM_COLUMNS))
+            else:
+                changes = {event.key: event.data} if event.kind == DRIVER_UPDATED else event.data
+                for username, fields in changes.items():
+                    if any(c in fields for c in DIM_COLUMNS):
+                        row = dict(zip(DIM_COLUMNS, self._rows.get(username) or (None,) * len(DIM_COLUMNS)))
+                        row.update((c, fields[c]) for c in DIM_COLUMNS if c in fields)
+                        self._set_row(username, tuple(row[c] for c in DIM_COLUMNS))
+            self.version = event.after
+            self.deltas += 1
+
+    def frame(self):
+        """DataFrame indexed by username: DIM_COLUMNS + driver_name."""
+        with self._lock:
+            if self._pending:
+                usernames = list(self._pending)
+                rows = pd.DataFrame(list(self._pending.values()), columns=list(DIM_COLUMNS), index=usernames)
+                rows["driver_name"] = display_names(rows["first_name"], rows["last_name"], rows.index).to_numpy()
+                known = self._frame.index.isin(usernames)
+                # Edited drivers are replaced, new ones appended
+                self._frame = pd.concat([self._frame[~known], rows]).rename_axis("username")
+                self._pending = {}
+            return self._frame
+
+    def enrich(self, df, on="driver_username", columns=(*DIM_COLUMNS, "driver_name")):
+        """
+        df with the driver columns added for each row's `on` username.
+        Columns df already has are left alone; unknown drivers get their
+        username as driver_name.
+        """
+        dim = self.frame()
+        out = df.copy()
+        keys = out[on].astype(object).to_numpy()
+        pos = dim.index.get_indexer(keys)
+        found = pos >= 0
+        for col in columns:
+            if col in out.columns:
+                continue
+            values = np.full(len(out), None, dtype=object)
+            values[found] = dim[col].to_numpy(dtype=object)[pos[found]]
+            if col == "driver_name":
+                values[~found] = keys[~found]
+            out[col] = values
+        return out
+
+
+_DIMENSION = None
+_DIMENSION_LOCK = threading.Lock()
+
+
+def get_driver_dimension():
+    """Process-wide dimension over the shared drivers snapshot, kept current by bus deltas."""
+    global _DIMENSION
+    with _DIMENSION_LOCK:
+        if _DIMENSION is None:
+            _DIMENSION = DriverDimension(bus=get_change_bus())
+        _DIMENSION.follow(get_driver_store().snapshot())
+        return _DIMENSION
@@ -0,0 +1,364 @@
+"""
+Append-only ledger of driver rating and cancellation events.
+
+Every cancellation, rating adjustment and penalty payment is appended as
+a fixed-width binary record to data/driver_ledger.bin (usernames are
+interned in a small JSON side file). Per-driver state - rating,
+cancel_count, penalties owed - is materialized in memory, so reading it is
+a dict lookup, and the whole ledger can be replayed with NumPy to rebuild
+that state from scratch.
+
+The ledger is the source of truth for ratings: shared.py's cancellation
+rules record their events here (seeding a driver's opening balance from
+the driver store first) and store the resulting rating / cancel_count on
+the driver. Several processes share the files: appends take a lock file
+and first catch up with what others appended, and every read applies the
+records appended since the last one (refresh).
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from shared import DATA_DIR, DRIVER_RATING_PENALTY_STEP, DRIVER_MIN_RATING
+from storage import FileLock
+
+LEDGER_PATH = os.path.join(DATA_DIR, "driver_ledger.bin")
+LEDGER_DRIVERS_PATH = os.path.join(DATA_DIR, "driver_ledger_drivers.json")
+
+DRIVER_MAX_RATING = 5.0
+
+# Event kinds
+EVENT_OPENING = 0                  # opening balance: rating_delta = rating, amount_xof = cancel_count
+EVENT_DRIVER_CANCELLATION = 1      # amount_xof = penalty owed, rating_delta = -step
+EVENT_PASSENGER_CANCELLATION = 2   # amount_xof = fee paid by the passenger
+EVENT_RATING_ADJUSTMENT = 3        # rating_delta = signed change
+EVENT_PENALTY_PAYMENT = 4          # amount_xof = penalty paid back
+
+# One record = 21 bytes on disk
+EVENT_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("driver", "<i4"),
+    ("kind", "u1"),
+    ("amount_xof", "<i4"),
+    ("rating_delta", "<f4"),
+])
+
+
+def _empty_state():
+    return {
+        "rating": DRIVER_MAX_RATING,
+        "cancel_count": 0,
+        "passenger_cancel_count": 0,
+        "penalties_owed_xof": 0,
+        "events": 0,
+    }
+
+
+def _apply(state, kind, amount_xof, rating_delta):
+    """Apply one event to a materialized driver state (in place)."""
+    if kind == EVENT_OPENING:
+        state["rating"] = float(rating_delta)
+        state["cancel_count"] += int(amount_xof)
+    elif kind == EVENT_DRIVER_CANCELLATION:
+        state["rating"] = max(DRIVER_MIN_RATING, state["rating"] + float(rating_delta))
+        state["cancel_count"] += 1
+        state["penalties_owed_xof"] += int(amount_xof)
+    elif kind == EVENT_PASSENGER_CANCELLATION:
+        state["passenger_cancel_count"] += 1
+    elif kind == EVENT_RATING_ADJUSTMENT:
+        rating = state["rating"] + float(rating_delta)
+        state["rating"] = min(DRIVER_MAX_RATING, max(DRIVER_MIN_RATING, rating))
+    elif kind == EVENT_PENALTY_PAYMENT:
+        state["penalties_owed_xof"] -= int(amount_xof)
+    state["events"] += 1
+
+
+def _projection(state):
+    return {
+        "rating": round(state["rating"], 2),
+        "cancel_count": state["cancel_count"],
+        "penalties_owed_xof": state["penalties_owed_xof"],
+    }
+
+
+class DriverLedger:
+    """Append-only event log plus the per-driver state materialized from it."""
+
+    def __init__(self, path=LEDGER_PATH, drivers_path=LEDGER_DRIVERS_PATH):
+        self.path = path
+        self.drivers_path = drivers_path
+        self._lock = threading.RLock()
+        self._names = []
+        self._ids = {}
+        self._state = {}
+        self._offset = 0          # bytes of the ledger file applied to _state
+        self.last_replay_seconds = None
+        self.replay()
+
+    # ---------- reads ----------
+
+    def known(self, username):
+        """Whether the driver has any event (e.g. an opening balance) yet."""
+        self.refresh()
+        return username in self._state
+
+    def state(self, username):
+        """Materialized state for one driver (a fresh default if unknown)."""
+        self.refresh()
+        s = self._state.get(username)
+        return dict(s) if s is not None else _empty_state()
+
+    def states(self):
+        """{username: state} for every driver with at least one event."""
+        self.refresh()
+        with self._lock:
+            return {u: dict(s) for u, s in self._state.items()}
+
+    def events(self):
+        """All events as a NumPy structured array (read straight from disk)."""
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        # Whole records only: another process may be half-way through an append
+        count = os.path.getsize(self.path) // EVENT_DTYPE.itemsize
+        return np.fromfile(self.path, dtype=EVENT_DTYPE, count=count)
+
+    def projection(self, username):
+        """The driver fields the ledger owns: rating, cancel_count, penalties_owed_xof."""
+        return _projection(self.state(username))
+
+    def projections_after(self, rows):
+        """
+        {username: projection} for the drivers in `rows` as they will be once
+        those (username, kind, amount_xof, rating_delta) events are appended.
+        Nothing is written.
+        """
+        self.refresh()
+        states = {}
+        with self._lock:
+            for username, kind, amount_xof, rating_delta in rows:
+                if username not in states:
+                    states[username] = dict(self._state.get(username) or _empty_state())
+                # The float32 value append_events will store, so both agree
+                _apply(states[username], kind, int(amount_xof), float(np.float32(rating_delta)))
+        return {username: _projection(s) for username, s in states.items()}
+
+    def apply_to_driver(self, driver_dict):
+        """Copy the ledger's rating / cancel_count onto a driver dict."""
+        driver_dict.update(self.projection(driver_dict.get("username")))
+        return driver_dict
+
+    # ---------- writes ----------
+
+    def record_driver_cancellation(self, trip):
+        """Record the penalty of a trip cancelled by its driver (fees already applied)."""
+        self._append([(
+            trip.get("driver_username"),
+            EVENT_DRIVER_CANCELLATION,
+            trip["cancellation_fee_xof"],
+            -DRIVER_RATING_PENALTY_STEP,
+        )])
+        return trip
+
+    def record_passenger_cancellation(self, trip):
+        """Record a trip cancelled by its passenger (fees already applied) against its driver."""
+        self._append([(
+            trip.get("driver_username"),
+            EVENT_PASSENGER_CANCELLATION,
+            trip["cancellation_fee_xof"],
+            0.0,
+        )])
+        return trip
+
+    def record_rating_adjustment(self, username, delta):
+        self._append([(username, EVENT_RATING_ADJUSTMENT, 0, delta)])
+
+    def record_penalty_payment(self, username, amount_xof):
+        self._append([(username, EVENT_PENALTY_PAYMENT, amount_xof, 0.0)])
+
+    def seed_from_drivers(self, drivers):
+        """
+        Record opening balances (rating, cancel_count) for drivers that are
+        not in the ledger yet, so history starts from their current state.
+        Checked under the ledger's file lock: two processes seeding the same
+        driver record one opening. Returns how many were recorded.
+        """
+        rows = {}
+        for d in drivers:
+            username = d.get("username")
+            if username:
+                rows[username] = (
+                    username,
+                    EVENT_OPENING,
+                    int(d.get("cancel_count", 0)),
+                    float(d.get("rating", DRIVER_MAX_RATING)),
+                )
+        return self._append(list(rows.values()), new_drivers_only=True)
+
+    def append_events(self, rows):
+        """Append many (username, kind, amount_xof, rating_delta) events in one write."""
+        self._append(rows)
+
+    def _driver_id(self, username):
+        driver_id = self._ids.get(username)
+        if driver_id is None:
+            driver_id = len(self._names)
+            self._names.append(username)
+            self._ids[username] = driver_id
+        return driver_id
+
+    def _append(self, rows, new_drivers_only=False):
+        if not rows:
+            return 0
+        with FileLock(self.path + ".lock", self._lock):
+            # Catch up first: ids and opening balances depend on what others appended
+            self.refresh()
+            if new_drivers_only:
+                rows = [r for r in rows if r[0] not in self._state]
+                if not rows:
+                    return 0
+            n_names = len(self._names)
+            records = np.zeros(len(rows), dtype=EVENT_DTYPE)
+            now = time.time()
+            for i, (username, kind, amount_xof, rating_delta) in enumerate(rows):
+                records[i] = (now, self._driver_id(username), kind, amount_xof, rating_delta)
+
+            # Names first, so every record on disk refers to a known driver
+            if len(self._names) != n_names:
+                tmp_path = self.drivers_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._names, f, ensure_ascii=False)
+                os.replace(tmp_path, self.drivers_path)
+            with open(self.path, "ab") as f:
+                records.tofile(f)
+            self._offset += records.nbytes
+
+            # Apply the stored (float32) values so live state matches a replay
+            for (username, _, _, _), rec in zip(rows, records):
+                state = self._state.setdefault(username, _empty_state())
+                _apply(state, int(rec["kind"]), int(rec["amount_xof"]), float(rec["rating_delta"]))
+        return len(rows)
+
+    # ---------- replay ----------
+
+    def _load_names(self):
+        if os.path.exists(self.drivers_path):
+            with open(self.drivers_path, "r", encoding="utf-8") as f:
+                self._names = json.load(f)
+        else:
+            self._names = []
+        self._ids = {name: i for i, name in enumerate(self._names)}
+
+    def refresh(self):
+        """Apply the records appended (by any process) since the last read."""
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size < self._offset:
+                self.replay()  # the file was replaced
+                return
+            n = (size - self._offset) // EVENT_DTYPE.itemsize  # whole records only
+            if not n:
+                return
+            records = np.fromfile(self.path, dtype=EVENT_DTYPE, count=n, offset=self._offset)
+            if int(records["driver"].max()) >= len(self._names):
+                self._load_names()  # names are written before the records using them
+            for rec in records.tolist():
+                _, driver, kind, amount_xof, rating_delta = rec
+                state = self._state.setdefault(self._names[driver], _empty_state())
+                _apply(state, kind, amount_xof, rating_delta)
+            self._offset += records.nbytes
+
+    def replay(self):
+        """
+        Rebuild every driver's state from the ledger file.
+
+        Counts and penalty balances are bincounts over the driver column.
+        Ratings are a clipped sum for drivers whose history only lowers the
+        rating (the usual case); for drivers with upward adjustments or a
+        late opening balance only their rating events are walked in order.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            ev = self.events()
+            self._offset = ev.nbytes
+            self._load_names()  # after the records: every id read is named
+            n = len(self._names)
+            driver = ev["driver"]
+            kind = ev["kind"]
+            amount = ev["amount_xof"].astype(np.int64)
+            delta = ev["rating_delta"].astype(np.float64)
+
+            def count(mask):
+                return np.bincount(driver[mask], minlength=n)
+
+            def total(mask, values):
+                return np.bincount(driver[mask], weights=values[mask], minlength=n)
+
+            is_open = kind == EVENT_OPENING
+            is_dcancel = kind == EVENT_DRIVER_CANCELLATION
+            is_pcancel = kind == EVENT_PASSENGER_CANCELLATION
+            is_adjust = kind == EVENT_RATING_ADJUSTMENT
+            is_payment = kind == EVENT_PENALTY_PAYMENT
+
+            events_per_driver = np.bincount(driver, minlength=n)
+            cancel_count = count(is_dcancel) + total(is_open, amount).astype(np.int64)
+            passenger_cancels = count(is_pcancel)
+            owed = total(is_dcancel, amount) - total(is_payment, amount)
+
+            start = np.full(n, DRIVER_MAX_RATING)
+            start[driver[is_open]] = delta[is_open]
+            rating_moves = is_dcancel | is_adjust
+            rating = np.clip(start + total(rating_moves, delta), DRIVER_MIN_RATING, DRIVER_MAX_RATING)
+
+            first_kind = np.full(n, -1)
+            if len(ev):
+                uniq, first_idx = np.unique(driver, return_index=True)
+                first_kind[uniq] = kind[first_idx]
+            needs_sequential = (
+                (count(is_adjust & (delta > 0)) > 0)
+                | (count(is_open) > 1)
+                | ((count(is_open) == 1) & (first_kind != EVENT_OPENING))
+            )
+
+            # Only the rating depends on event order; walk just those events
+            slow_ids = np.flatnonzero(needs_sequential)
+            if len(slow_ids):
+                mask = np.isin(driver, slow_ids) & (is_open | rating_moves)
+                slow_rating = dict.fromkeys(slow_ids.tolist(), DRIVER_MAX_RATING)
+                for d, k, x in zip(driver[mask].tolist(), kind[mask].tolist(), delta[mask].tolist()):
+                    if k == EVENT_OPENING:
+                        slow_rating[d] = x
+                    elif k == EVENT_DRIVER_CANCELLATION:
+                        slow_rating[d] = max(DRIVER_MIN_RATING, slow_rating[d] + x)
+                    else:
+                        slow_rating[d] = min(DRIVER_MAX_RATING, max(DRIVER_MIN_RATING, slow_rating[d] + x))
+                for d, r in slow_rating.items():
+                    rating[d] = r
+
+            self._state = {}
+            for i in np.flatnonzero(events_per_driver):
+                self._state[self._names[i]] = {
+                    "rating": float(rating[i]),
+                    "cancel_count": int(cancel_count[i]),
+                    "passenger_cancel_count": int(passenger_cancels[i]),
+                    "penalties_owed_xof": int(owed[i]),
+                    "events": int(events_per_driver[i]),
+                }
+
+        self.last_replay_seconds = time.perf_counter() - started
+        return self.last_replay_seconds
+
+
+_DEFAULT_LEDGER = None
+
+
+def get_driver_ledger():
+    """Process-wide ledger on the default data files, caught up with other processes' appends."""
+    global _DEFAULT_LEDGER
+    if _DEFAULT_LEDGER is None:
+        _DEFAULT_LEDGER = DriverLedger()
+    else:
+        _DEFAULT_LEDGER.refresh()
+    return _DEFAULT_LEDGER
@@ -0,0 +1,129 @@
+"""
+Process-wide driver snapshots shared by every Streamlit session.
+
+The split apps used to copy all drivers into st.session_state["drivers"]
+when a session started and read that copy from then on: memory grew with
+sessions x drivers, and a passenger kept seeing a driver as Available long
+after the driver went Busy. A DriverStore holds one immutable snapshot per
+process, tagged with the store's version (shared.drivers_version). Sessions
+read it on every run without copying it; when the version moves (a write
+in this or another process) the next read loads a new snapshot, and the
+sessions still holding the old one are unaffected. Single-driver changes
+and bulk driver updates published on the change bus (change_bus.py) are
+applied as deltas, so a status / location update does not reload every
+driver.
+
+Snapshots are shared: treat the driver dicts as read-only and change
+drivers through shared.save_driver_to_db / update_driver(s)_in_db.
+"""
+import threading
+
+import pandas as pd
+
+from change_bus import DRIVER_SAVED, DRIVER_UPDATED, DRIVERS_UPDATED
+from shared import drivers_version, get_change_bus, load_drivers_from_db
+
+_UNKNOWN = object()  # version of a snapshot that may be newer than the version read
+
+
+class DriverSnapshot:
+    """
+    Drivers as of one store version, indexed by username. `generation`
+    numbers the full load the snapshot comes from (kept by deltas).
+    """
+
+    def __init__(self, drivers, version, generation=0):
+        self.version = version
+        self.generation = generation
+        self.drivers = tuple(dict(d) for d in drivers)
+        self._by_username = {d.get("username"): d for d in self.drivers}
+        self._frame = None
+
+    def replace(self, drivers, version):
+        """New snapshot with `drivers` replacing the ones with their usernames (or added)."""
+        snapshot = DriverSnapshot((), version, self.generation)
+        by_username = {d.get("username"): d for d in drivers}
+        snapshot.drivers = tuple(by_username.get(d.get("username"), d) for d in self.drivers) + tuple(
+            d for u, d in by_username.items() if u not in self._by_username
+        )
+        snapshot._by_username = {**self._by_username, **by_username}
+        return snapshot
+
+    def __iter__(self):
+        return iter(self.drivers)
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def get(self, username):
+        return self._by_username.get(username)
+
+    def with_status(self, status):
+        return [d for d in self.drivers if d.get("status") == status]
+
+    def frame(self):
+        """DataFrame of the drivers, built once per snapshot (do not modify)."""
+        if self._frame is None:
+            self._frame = pd.DataFrame(list(self.drivers))
+        return self._frame
+
+
+class DriverStore:
+    """Current DriverSnapshot, reloaded when the store's version changes."""
+
+    def __init__(self, load=load_drivers_from_db, version=drivers_version, bus=None):
+        self._load = load
+        self._version = version
+        self._bus = bus
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stale = False          # an event did not apply: reload on the next read
+        self.loads = 0
+        self.deltas = 0
+        if bus is not None:
+            bus.subscribe(self._on_change, (DRIVER_SAVED, DRIVER_UPDATED, DRIVERS_UPDATED))
+
+    def _on_change(self, event):
+        with self._lock:
+            current = self._snapshot
+            if current is None or current.version == event.after:
+                return  # nothing loaded yet, or the event is already in the snapshot
+            if current.version != event.before:
+                self._stale = True  # not at the version the event applies to: reload instead
+                return
+            changes = {event.key: event.data} if event.kind == DRIVER_UPDATED else event.data
+            if event.kind == DRIVER_SAVED:
+                drivers = [dict(event.data)]
+            else:
+                drivers = [{**(current.get(u) or {"username": u}), **fields} for u, fields in changes.items()]
+            self._snapshot = current.replace(drivers, event.after)
+            self.deltas += 1
+
+    def snapshot(self):
+        if self._bus is not None:
+            self._bus.poll()
+        version = self._version()
+        with self._lock:
+            current = self._snapshot
+            if current is None or self._stale or version is None or version != current.version:
+                self._stale = False
+                drivers = self._load()
+                if self._version() != version:
+                    version = _UNKNOWN  # written during the load: never apply deltas on top
+                self.loads += 1
+                current = DriverSnapshot(drivers, version, self.loads)
+                self._snapshot = current
+            return current
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_driver_store():
+    """Process-wide DriverStore over the shared driver storage."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = DriverStore(bus=get_change_bus())
+        return _STORE
@@ -0,0 +1,149 @@
+"""
+Per-driver earnings ledger with daily prefix sums.
+
+For every driver (and for the platform as a whole) we keep cumulative
+totals of driver_earnings_xof, platform_commission_xof, gross fares and
+trip counts, one slot per UTC day. The total over any date range is then the
+difference of two prefix values - O(1), however long the history - and
+a new trip only touches the end of its driver's series.
+"""
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from trip_views import TripStoreView
+
+MEASURES = ("trips", "price_xof", "driver_earnings_xof", "platform_commission_xof")
+
+
+def _trip_day(trip):
+    """UTC day ordinal of a trip's created_at (None if missing / unparsable)."""
+    created = trip.get("created_at")
+    if not created:
+        return None
+    try:
+        return date.fromisoformat(str(created)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def _as_ordinal(d):
+    if isinstance(d, (datetime, pd.Timestamp)):
+        d = d.date()
+    return d.toordinal()
+
+
+class _PrefixSeries:
+    """Daily prefix sums for one key; prefix[m][i] = total of the first i days."""
+
+    def __init__(self, first_day):
+        self.first_day = first_day
+        self.prefix = {m: [0] for m in MEASURES}
+
+    def n_days(self):
+        return len(self.prefix["trips"]) - 1
+
+    def add(self, day, values):
+        if day < self.first_day:
+            # Backdated before the series start: pad the front with empty days
+            gap = self.first_day - day
+            for m in MEASURES:
+                self.prefix[m] = [0] * gap + self.prefix[m]
+            self.first_day = day
+
+        i = day - self.first_day
+        n = self.n_days()
+        if i >= n:
+            # Usual case: today's (or a new) day at the end
+            for m in MEASURES:
+                p = self.prefix[m]
+                p.extend([p[-1]] * (i - n + 1))
+        for m in MEASURES:
+            v = values[m]
+            if v:
+                p = self.prefix[m]
+                for k in range(i + 1, len(p)):
+                    p[k] += v
+
+    def total(self, start_day, end_day):
+        """Totals for start_day..end_day inclusive (day ordinals)."""
+        n = self.n_days()
+        i = min(max(start_day - self.first_day, 0), n)
+        j = min(max(end_day - self.first_day + 1, 0), n)
+        if j <= i:
+            return {m: 0 for m in MEASURES}
+        return {m: self.prefix[m][j] - self.prefix[m][i] for m in MEASURES}
+
+
+class EarningsLedger:
+    """Prefix-sum series per driver plus one for the whole platform."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._drivers = {}
+        self._platform = None
+
+    def add_trip(self, trip):
+        day = _trip_day(trip)
+        if day is None:
+            return
+        values = {
+            "trips": 1,
+            "price_xof": int(trip.get("price_xof") or 0),
+            "driver_earnings_xof": int(trip.get("driver_earnings_xof") or 0),
+            "platform_commission_xof": int(trip.get("platform_commission_xof") or 0),
+        }
+        with self._lock:
+            if self._platform is None:
+                self._platform = _PrefixSeries(day)
+            self._platform.add(day, values)
+            username = trip.get("driver_username")
+            if username:
+                series = self._drivers.get(username)
+                if series is None:
+                    series = self._drivers[username] = _PrefixSeries(day)
+                series.add(day, values)
+
+    def driver_total(self, username, start, end):
+        """{trips, price_xof, driver_earnings_xof, platform_commission_xof} for a driver, start..end inclusive."""
+        series = self._drivers.get(username)
+        if series is None:
+            return {m: 0 for m in MEASURES}
+        return series.total(_as_ordinal(start), _as_ordinal(end))
+
+    def platform_total(self, start, end):
+        if self._platform is None:
+            return {m: 0 for m in MEASURES}
+        return self._platform.total(_as_ordinal(start), _as_ordinal(end))
+
+    def last_days(self, username, days=7, today=None):
+        """Driver totals over the last `days` UTC days, today included."""
+        today = today or datetime.utcnow().date()
+        return self.driver_total(username, today - timedelta(days=days - 1), today)
+
+    def driver_totals(self, start, end):
+        """One row per driver with trips in start..end (for leaderboards)."""
+        s, e = _as_ordinal(start), _as_ordinal(end)
+        rows = []
+        for username, series in self._drivers.items():
+            t = series.total(s, e)
+            if t["trips"]:
+                rows.append({"driver_username": username, **t})
+        return pd.DataFrame(rows, columns=["driver_username", *MEASURES])
+
+
+def build_earnings_ledger(trips):
+    ledger = EarningsLedger()
+    for t in trips:
+        ledger.add_trip(t)
+    return ledger
+
+
+# Process-wide ledger over the trip store (see trip_views.TripStoreView)
+_VIEW = TripStoreView(EarningsLedger, EarningsLedger.add_trip, name="earnings_ledger")
+
+
+def get_earnings_ledger():
+    """Ledger over the trip store, kept up to date with new trips."""
+    return _VIEW.get()
@@ -0,0 +1,164 @@
+"""
+Lazy, cached file exports for the admin download buttons.
+
+Nothing is encoded while the page renders: a download button only holds a
+callable, which runs when the user clicks. The export is then written
+chunk by chunk (gzip CSV, Parquet or plain CSV) to a temp file of its own
+in data/exports/ and cached under a key built from the export name, format
+and the caller's filter state, so a second click on the same selection
+reuses the file.
+"""
+import csv
+import gzip
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+import streamlit as st
+
+from shared import DATA_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAVE_PYARROW = False
+
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")
+EXPORT_CACHE_MAX_FILES = 20
+CHUNK_ROWS = 50_000
+
+# format -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "csv": ("csv", "text/csv"),
+}
+
+
+def available_formats():
+    return [f for f in EXPORT_FORMATS if f != "parquet" or HAVE_PYARROW]
+
+
+def frame_chunks(df, chunk_rows=CHUNK_ROWS):
+    """Chunk source for an in-memory DataFrame."""
+    def chunks():
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    return chunks
+
+
+def _cache_path(name, fmt, cache_key):
+    digest = hashlib.sha1(repr((name, fmt, cache_key)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(EXPORT_DIR, f"{name}-{digest}.{EXPORT_FORMATS[fmt][0]}")
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:  # pruned by another export meanwhile
+        return 0
+
+
+def _prune_cache():
+    files = [os.path.join(EXPORT_DIR, f) for f in os.listdir(EXPORT_DIR) if not f.endswith(".tmp")]
+    files.sort(key=_mtime, reverse=True)
+    for path in files[EXPORT_CACHE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_csv(path, chunks, compress):
+    opener = gzip.open if compress else open
+    rows = 0
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0), quoting=csv.QUOTE_MINIMAL)
+            rows += len(chunk)
+    return rows
+
+
+def _write_parquet(path, chunks):
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            # Categories differ between chunks; write them as plain values
+            chunk = chunk.astype({
+                c: object for c in chunk.columns if isinstance(chunk[c].dtype, pd.CategoricalDtype)
+            })
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            else:
+                chunk = chunk.reindex(columns=writer.schema.names)
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame().to_parquet(path)
+    return rows
+
+
+def export_file(name, chunks, fmt="csv.gz", cache_key=None):
+    """
+    Contents of the export file for `chunks` (a callable returning
+    DataFrames), written first unless the same (name, fmt, cache_key) is
+    cached. Bytes rather than a path: another export may prune the file
+    as soon as this one returns.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = _cache_path(name, fmt, cache_key)
+    if cache_key is not None:
+        try:
+            with open(path, "rb") as f:
+                os.utime(path)  # keep recently used exports in the cache
+                return f.read()
+        except OSError:
+            pass  # not cached (or pruned meanwhile)
+
+    # A temp file per export: concurrent exports of the same key do not collide
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=EXPORT_DIR)
+    os.close(fd)
+    try:
+        if fmt == "parquet":
+            _write_parquet(tmp_path, chunks())
+        else:
+            _write_csv(tmp_path, chunks(), compress=(fmt == "csv.gz"))
+        with open(tmp_path, "rb") as f:
+            data = f.read()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _prune_cache()
+    return data
+
+
+def export_download_button(label, name, chunks, fmt="csv.gz", cache_key=None, key=None):
+    """
+    st.download_button whose file is only generated when clicked.
+
+    chunks: callable returning an iterable of DataFrames (see frame_chunks);
+    cache_key: anything describing the data + filter state (None = no cache).
+    """
+    ext, mime = EXPORT_FORMATS[fmt]
+
+    def data():
+        return export_file(name, chunks, fmt, cache_key)
+
+    return st.download_button(
+        label=label,
+        data=data,
+        file_name=f"{name}.{ext}",
+        mime=mime,
+        key=key,
+        on_click="ignore",
+    )
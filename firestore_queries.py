@@ -0,0 +1,111 @@
+"""
+Filtered, projected and paginated Firestore trip reads (app.py admin).
+
+fetch_trips() pushes the admin filters into the query instead of fetching
+every trip and filtering in pandas:
+
+- created_at range as where() clauses (created_at is an ISO string, so
+  string order is time order);
+- city / routing_provider / driver_username as `in` clauses, as long as
+  the combined disjunction stays within Firestore's limit of 30;
+  anything left over is filtered on the returned rows;
+- select() so only the needed fields are sent (fields=None fetches whole
+  documents);
+- pages of PAGE_SIZE documents, continued with start_after().
+
+Range + `in` queries need the composite indexes in firestore.indexes.json
+(deploy with `firebase deploy --only firestore:indexes`).
+"""
+from datetime import timedelta
+
+try:
+    from google.cloud.firestore_v1.base_query import FieldFilter
+except ImportError:  # pragma: no cover - depends on the environment
+    FieldFilter = None
+
+PAGE_SIZE = 500
+MAX_DISJUNCTIONS = 30
+
+# Fields the admin dashboard reads from each trip
+ADMIN_TRIP_FIELDS = (
+    "created_at",
+    "city",
+    "routing_provider",
+    "driver_username",
+    "route_summary",
+    "origin_label",
+    "destination_label",
+    "distance_miles",
+    "price_xof",
+    "platform_commission_xof",
+    "driver_earnings_xof",
+    "status",
+)
+
+
+def _in_filters(filters):
+    """
+    Split {field: values} into the `in` clauses to send (combined size <=
+    MAX_DISJUNCTIONS, smallest first) and the ones to apply locally.
+    """
+    pushed, local = {}, {}
+    combinations = 1
+    for field, values in sorted(filters.items(), key=lambda kv: len(kv[1])):
+        if values and combinations * len(values) <= MAX_DISJUNCTIONS:
+            pushed[field] = values
+            combinations *= len(values)
+        else:
+            local[field] = values
+    return pushed, local
+
+
+def trip_query(client, start=None, end=None, in_filters=None, fields=None, collection="trips"):
+    """Query for trips created between start and end (dates, inclusive)."""
+    query = client.collection(collection)
+    for field, values in (in_filters or {}).items():
+        query = query.where(filter=FieldFilter(field, "in", list(values)))
+    if start is not None:
+        query = query.where(filter=FieldFilter("created_at", ">=", start.isoformat()))
+    if end is not None:
+        query = query.where(filter=FieldFilter("created_at", "<", (end + timedelta(days=1)).isoformat()))
+    if fields:
+        query = query.select(list(fields))
+    return query.order_by("created_at")
+
+
+def stream_pages(query, page_size=PAGE_SIZE):
+    """Documents of `query`, fetched page by page with start_after cursors."""
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def fetch_trips(client, cities=None, start=None, end=None, providers=None, drivers=None,
+                fields=ADMIN_TRIP_FIELDS, page_size=PAGE_SIZE):
+    """
+    Trip dicts (with their doc `id`) matching the filters. None (or an
+    empty list) means no filter on that field; fields=None returns whole
+    documents.
+    """
+    filters = {
+        field: list(values)
+        for field, values in (("city", cities), ("routing_provider", providers), ("driver_username", drivers))
+        if values
+    }
+    pushed, local = _in_filters(filters)
+    query = trip_query(client, start, end, pushed, fields)
+
+    trips = []
+    for doc in stream_pages(query, page_size):
+        data = doc.to_dict()
+        if all(data.get(field) in values for field, values in local.items()):
+            data["id"] = doc.id
+            trips.append(data)
+    return trips
@@ -0,0 +1,148 @@
+"""
+Batched Firestore writes (app.py).
+
+commit_writes() sends several document writes as WriteBatches of at most
+MAX_BATCH_WRITES (Firestore's limit per batch), i.e. one round trip per
+500 writes. WriteBehindQueue buffers high-rate updates (driver status /
+location pings) and commits them from a background thread every
+FLUSH_INTERVAL_SECONDS, or as soon as a full batch is waiting. Updates to
+the same document are merged while they wait, so a driver pinging ten
+times between flushes costs one write.
+
+commit_counted() also increments a counter document per collection
+(META_COLLECTION/{collection}) in every batch, so readers can tell
+whether a collection changed with one point read
+(storage.FirestoreStorage.version).
+"""
+import atexit
+import threading
+
+try:
+    from google.cloud.firestore import Increment
+except ImportError:  # pragma: no cover - depends on the environment
+    Increment = None
+
+MAX_BATCH_WRITES = 500
+FLUSH_INTERVAL_SECONDS = 2.0
+META_COLLECTION = "_meta"  # one {"version": n} counter document per collection
+
+
+def commit_writes(client, writes, max_batch=MAX_BATCH_WRITES):
+    """
+    Commit (collection, doc_id, data, merge) writes in batches of up to
+    max_batch; each batch is atomic. doc_id None creates a document with
+    a generated id, data None deletes the document. Returns the number of
+    batches sent.
+    """
+    writes = list(writes)
+    batches = 0
+    for start in range(0, len(writes), max_batch):
+        batch = client.batch()
+        for collection, doc_id, data, merge in writes[start:start + max_batch]:
+            ref = client.collection(collection).document(doc_id)  # None -> generated id
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data, merge=merge)
+        batch.commit()
+        batches += 1
+    return batches
+
+
+def commit_counted(client, writes, max_batch=MAX_BATCH_WRITES):
+    """
+    commit_writes() that also increments `version` in
+    META_COLLECTION/{collection} for each collection a batch writes, in
+    that batch. Returns {collection: [counter value after each batch]}.
+    """
+    writes = list(writes)
+    collections = sorted({w[0] for w in writes})
+    step = max_batch - len(collections)  # the counter writes count towards the limit
+    counters = {c: [] for c in collections}
+    for start in range(0, len(writes), step):
+        chunk = writes[start:start + step]
+        batch = client.batch()
+        for collection, doc_id, data, merge in chunk:
+            ref = client.collection(collection).document(doc_id)
+            if data is None:
+                batch.delete(ref)
+            else:
+                batch.set(ref, data, merge=merge)
+        touched = sorted({w[0] for w in chunk})
+        for collection in touched:
+            batch.set(client.collection(META_COLLECTION).document(collection), {"version": Increment(1)}, merge=True)
+        results = batch.commit()
+        for collection, result in zip(touched, results[len(chunk):]):
+            counters[collection].append(result.transform_results[0].integer_value)
+    return counters
+
+
+class WriteBehindQueue:
+    """Buffered document writes, committed in batches from a background thread."""
+
+    def __init__(self, interval=FLUSH_INTERVAL_SECONDS, max_batch=MAX_BATCH_WRITES):
+        self.interval = interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}      # (collection, doc_id) -> (data, merge)
+        self._client = None
+        self._thread = None
+        self.last_error = None
+        atexit.register(self.flush)
+
+    def set(self, client, collection, doc_id, data, merge=True):
+        """Queue a write of `data` to collection/doc_id (merged into the document if merge)."""
+        key = (collection, doc_id)
+        with self._lock:
+            self._client = client
+            queued = self._pending.get(key)
+            if queued is not None and merge:
+                data = {**queued[0], **data}
+                merge = queued[1]
+            self._pending[key] = (dict(data), merge)
+            full = len(self._pending) >= self.max_batch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Commit everything queued so far; returns the number of writes sent."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                client = self._client
+            if not pending or client is None:
+                return 0
+            try:
+                commit_counted(
+                    client,
+                    ((c, d, data, merge) for (c, d), (data, merge) in pending.items()),
+                    self.max_batch,
+                )
+            except Exception as exc:
+                # Put the writes back under any newer ones and retry next flush
+                self.last_error = exc
+                with self._lock:
+                    for key, (data, merge) in pending.items():
+                        newer = self._pending.get(key)
+                        if newer is None:
+                            self._pending[key] = (data, merge)
+                        elif newer[1]:
+                            self._pending[key] = ({**data, **newer[0]}, merge)
+                return 0
+            self.last_error = None
+            return len(pending)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
@@ -5,14 +5,14 @@ import pandas as pd
 from shared import (
     LANG_OPTIONS,
     labels,
-    load_drivers_from_db,
     save_driver_to_db,
     update_driver_in_db,
-    save_trip_to_db,
+    book_trip_in_db,
     get_trip_distance_miles,
     compute_fare,
     MALI_CITIES,
 )
+from driver_store import get_driver_store
 
 st.set_page_config(page_title="Mali Ride – Mobile App", layout="centered")
 
@@ -30,8 +30,8 @@ st.caption(L("subtitle"))
 # ----------------------------
 # SESSION STATE
 # ----------------------------
-if "drivers" not in st.session_state:
-    st.session_state["drivers"] = load_drivers_from_db()
+# Shared, read-only drivers snapshot (see driver_store.py)
+drivers = get_driver_store().snapshot()
 if "logged_driver" not in st.session_state:
     st.session_state["logged_driver"] = None
 if "current_trip" not in st.session_state:
@@ -95,8 +95,7 @@ if mode == L("mobile_driver_tab"):
             if not first_name or not last_name or not username or not pin:
                 st.error(L("missing_fields"))
             else:
-                existing = [d for d in st.session_state["drivers"] if d["username"] == username]
-                if existing:
+                if drivers.get(username) is not None:
                     st.error(L("id_used"))
                 else:
                     driver = {
@@ -113,7 +112,6 @@ if mode == L("mobile_driver_tab"):
                         "status": L("status_options")[0],
                     }
                     save_driver_to_db(driver)
-                    st.session_state["drivers"].append(driver)
                     st.success(
                         L("reg_success").format(
                             name=f"{first_name} {last_name}",
@@ -132,11 +130,10 @@ if mode == L("mobile_driver_tab"):
 
         driver_obj = None
         if submit_login:
-            for d in st.session_state["drivers"]:
-                if d["username"] == login_user and d["pin"] == login_pin:
-                    driver_obj = d
-                    st.session_state["logged_driver"] = login_user
-                    break
+            d = drivers.get(login_user)
+            if d is not None and d["pin"] == login_pin:
+                driver_obj = d
+                st.session_state["logged_driver"] = login_user
             if driver_obj:
                 st.success(L("login_success").format(name=driver_obj["first_name"]))
             else:
@@ -144,12 +141,7 @@ if mode == L("mobile_driver_tab"):
 
         if st.session_state["logged_driver"]:
             username_logged = st.session_state["logged_driver"]
-            index_logged = None
-            for idx, d in enumerate(st.session_state["drivers"]):
-                if d["username"] == username_logged:
-                    index_logged = idx
-                    driver_obj = d
-                    break
+            driver_obj = drivers.get(username_logged)
 
             if driver_obj is not None:
                 status_options = L("status_options")
@@ -160,13 +152,12 @@ if mode == L("mobile_driver_tab"):
                 )
                 new_lat = st.number_input(L("current_lat"), value=float(driver_obj["lat"]))
                 new_lon = st.number_input(L("current_lon"), value=float(driver_obj["lon"]))
-                if st.button(L("update_btn")) and index_logged is not None:
+                if st.button(L("update_btn")):
                     updates = {
                         "status": new_status,
                         "lat": new_lat,
                         "lon": new_lon,
                     }
-                    st.session_state["drivers"][index_logged].update(updates)
                     update_driver_in_db(username_logged, updates)
                     st.success(L("update_success"))
 
@@ -179,10 +170,7 @@ else:
     status_available = L("status_options")[0]
     status_busy = L("status_options")[1]
 
-    available_drivers = [
-        d for d in st.session_state["drivers"]
-        if d.get("status") == status_available
-    ]
+    available_drivers = drivers.with_status(status_available)
 
     if not available_drivers:
         st.warning(L("no_available"))
@@ -250,12 +238,7 @@ else:
                 if st.button(L("confirm_booking")):
                     selected_driver_username = df_avail.loc[selected_idx, "username"]
 
-                    chosen_driver = None
-                    for d in st.session_state["drivers"]:
-                        if d["username"] == selected_driver_username:
-                            d["status"] = status_busy
-                            chosen_driver = d
-                            break
+                    chosen_driver = drivers.get(selected_driver_username)
 
                     trip_data = {
                         "driver_username": selected_driver_username,
@@ -280,7 +263,12 @@ else:
                     }
                     st.session_state["current_trip"] = trip_data
                     st.session_state["trips"].append(trip_data)
-                    save_trip_to_db(trip_data)
+                    # Trip + the driver's busy status in one write
+                    book_trip_in_db(
+                        trip_data,
+                        None if chosen_driver is None else chosen_driver["username"],
+                        {"status": status_busy},
+                    )
 
                     if chosen_driver:
                         st.success(
@@ -0,0 +1,105 @@
+"""
+Paginated tables for the dashboards.
+
+st.dataframe(df) sends the whole frame to the browser on every rerun.
+paginated_table() only sends one page: a fetch function returns the rows
+of the requested page, sorted and filtered at the source, together with
+the total number of matching rows. The payload therefore stays the same
+size however long the trip history gets.
+
+    fetch(offset, limit, sort_by, ascending, where) -> (page DataFrame, total)
+
+where is {column: allowed values}. frame_source() serves in-memory
+frames (drivers, the app.py session trips); archive_source() serves the
+trip archive, which reads only the partitions that hold the page.
+"""
+import math
+
+import pandas as pd
+import streamlit as st
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+def frame_source(data):
+    """fetch() over an in-memory DataFrame or list of dicts."""
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+
+    def fetch(offset, limit, sort_by=None, ascending=True, where=None):
+        rows = df
+        for col, values in (where or {}).items():
+            rows = rows[rows[col].isin(list(values))] if col in rows.columns else rows.iloc[0:0]
+        if sort_by in rows.columns:
+            try:
+                rows = rows.sort_values(sort_by, ascending=ascending, kind="stable", na_position="last")
+            except TypeError:  # mixed types in an object column
+                rows = rows.sort_values(
+                    sort_by, ascending=ascending, kind="stable", na_position="last",
+                    key=lambda s: s.astype(str),
+                )
+        return rows.iloc[offset:offset + limit], len(rows)
+
+    return fetch
+
+
+def archive_source(archive, selection=None):
+    """fetch() over a trip_archive.TripArchive, limited to `selection` (read() filters)."""
+    selection = selection or {}
+
+    def fetch(offset, limit, sort_by=None, ascending=True, where=None):
+        return archive.read_page(
+            offset, limit, sort_by=sort_by or "created_at", ascending=ascending, where=where, **selection
+        )
+
+    return fetch
+
+
+def paginated_table(key, fetch, sort_columns, filters=None, default_sort=None,
+                    default_ascending=True, page_size=50):
+    """
+    Render a sortable, filterable table one page at a time.
+
+    key: unique widget key prefix; sort_columns: columns offered for
+    sorting; filters: {column: options} rendered as multiselects and passed
+    to fetch as `where`. Returns the total number of matching rows.
+    """
+    sort_columns = list(sort_columns)
+    c1, c2, c3 = st.columns([2, 1, 1])
+    with c1:
+        sort_index = sort_columns.index(default_sort) if default_sort in sort_columns else 0
+        sort_by = st.selectbox("Sort by", sort_columns, index=sort_index, key=f"{key}_sort") if sort_columns else None
+    with c2:
+        order = st.selectbox(
+            "Order", ["Ascending", "Descending"], index=0 if default_ascending else 1, key=f"{key}_order"
+        )
+    with c3:
+        size_index = PAGE_SIZES.index(page_size) if page_size in PAGE_SIZES else 0
+        limit = st.selectbox("Rows per page", PAGE_SIZES, index=size_index, key=f"{key}_size")
+
+    where = {}
+    if filters:
+        filter_cols = st.columns(len(filters))
+        for col_widget, (col, options) in zip(filter_cols, filters.items()):
+            with col_widget:
+                chosen = st.multiselect(col, options, key=f"{key}_where_{col}")
+            if chosen:
+                where[col] = chosen
+
+    page_key = f"{key}_page"
+    page = int(st.session_state.get(page_key, 1))
+    rows, total = fetch((page - 1) * limit, limit, sort_by, order == "Ascending", where)
+    n_pages = max(1, math.ceil(total / limit))
+    if page > n_pages:
+        # Filters shrank the result; jump to the last page
+        page = n_pages
+        rows, total = fetch((page - 1) * limit, limit, sort_by, order == "Ascending", where)
+    st.session_state[page_key] = page
+
+    st.dataframe(rows, hide_index=True)
+    c1, c2 = st.columns([1, 3])
+    with c1:
+        st.number_input("Page", min_value=1, max_value=n_pages, step=1, key=page_key)
+    with c2:
+        first = (page - 1) * limit
+        st.caption(f"Rows {min(first + 1, total):,}–{first + len(rows):,} of {total:,} · page {page} of {n_pages}")
+    return total
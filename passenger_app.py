@@ -5,10 +5,9 @@ import pandas as pd
 from shared import (
     LANG_OPTIONS,
     labels,
-    load_drivers_from_db,
-    save_trip_to_db,
-    load_trips_from_db,
+    book_trip_in_db,
     get_trip_distance_miles,
+    get_trip_distance_and_provider,
     compute_fare,
     MALI_CITIES,
     BKO_NEIGHBORHOODS,
@@ -16,6 +15,15 @@ from shared import (
 )
 
 from promotions import apply_promo
+from earnings_ledger import get_earnings_ledger
+from driver_store import get_driver_store
+from distance_matrix import (
+    city_distance_miles,
+    city_matrix_provider,
+    neighborhood_distance_miles,
+    neighborhood_matrix_provider,
+    gps_label,
+)
 
 st.set_page_config(page_title="Mali Ride – Passenger App", layout="centered")
 
@@ -26,7 +34,7 @@ st.sidebar.markdown("### 🌍 Language / Langue / Kan")
 lang = st.sidebar.selectbox("", LANG_OPTIONS, index=0)
 
 def L(key):
-    return labels.get(lang, labels["English" "French"]).get(key, key)
+    return labels.get(lang, labels["English"]).get(key, key)
 
 st.title(L("title_passenger"))
 st.caption(L("subtitle"))
@@ -34,8 +42,8 @@ st.caption(L("subtitle"))
 # ----------------------------
 # SESSION STATE
 # ----------------------------
-if "drivers" not in st.session_state:
-    st.session_state["drivers"] = load_drivers_from_db()
+# Shared, read-only drivers snapshot (see driver_store.py)
+drivers = get_driver_store().snapshot()
 if "current_trip" not in st.session_state:
     st.session_state["current_trip"] = None
 if "trips" not in st.session_state:
@@ -66,10 +74,7 @@ st.header(L("passenger_header"))
 status_available = L("status_options")[0]
 status_busy = L("status_options")[1]
 
-available_drivers = [
-    d for d in st.session_state["drivers"]
-    if d["status"] == status_available
-]
+available_drivers = drivers.with_status(status_available)
 
 if not available_drivers:
     st.warning(L("no_available"))
@@ -182,12 +187,15 @@ else:
                 else:
                     origin_label = f"{selected_city_for_within} (manual coords)"
                     destination_label = f"{selected_city_for_within} (manual coords)"
+                    if selected_city_for_within == "Bamako":
+                        origin_label = gps_label(pickup_lat, pickup_lon, origin_label)
+                        destination_label = gps_label(drop_lat, drop_lon, destination_label)
         elif route_mode == L("preset_route"):
             origin_label = from_city
             destination_label = to_city
         else:
-            origin_label = "Manual GPS pickup"
-            destination_label = "Manual GPS dropoff"
+            origin_label = gps_label(pickup_lat, pickup_lon, "Manual GPS pickup")
+            destination_label = gps_label(drop_lat, drop_lon, "Manual GPS dropoff")
 
         if route_mode == L("within_city") and selected_city_for_within is not None:
             df_avail = df_avail[df_avail["city"] == selected_city_for_within]
@@ -202,7 +210,21 @@ else:
             df_avail["distance_to_pickup_miles"] = dist_to_pickup_list
             df_avail = df_avail.sort_values("distance_to_pickup_miles")
 
-            trip_distance = get_trip_distance_miles(pickup_lat, pickup_lon, drop_lat, drop_lon)
+            # City-to-city and neighborhood distances are precomputed (see distance_matrix.py)
+            trip_distance = None
+            trip_provider = None
+            if route_mode == L("preset_route"):
+                trip_distance = city_distance_miles(from_city, to_city)
+                if trip_distance is not None:
+                    trip_provider = city_matrix_provider(from_city, to_city)
+            elif use_neigh and pickup_nb and drop_nb:
+                trip_distance = neighborhood_distance_miles(pickup_nb, drop_nb)
+                if trip_distance is not None:
+                    trip_provider = neighborhood_matrix_provider(pickup_nb, drop_nb)
+            if trip_distance is None:
+                trip_distance, trip_provider = get_trip_distance_and_provider(
+                    pickup_lat, pickup_lon, drop_lat, drop_lon
+                )
             price_before_promo = compute_fare(trip_distance, base_fare=base_fare, per_mile=per_mile)
 
             # Apply promo code if provided
@@ -254,30 +276,10 @@ else:
             if st.button(L("confirm_booking")):
                 selected_driver_username = df_avail.loc[selected_idx, "username"]
 
-                chosen_driver = None
-                for d in st.session_state["drivers"]:
-                    if d["username"] == selected_driver_username:
-                        d["status"] = status_busy
-                        chosen_driver = d
-                        break
+                chosen_driver = drivers.get(selected_driver_username)
 
                 # --- Dynamic weekly commission based on driver's recent trips ---
-                trips_history = load_trips_from_db()
-                weekly_trips = 0
-                try:
-                    df_trips = pd.DataFrame(trips_history)
-                    if not df_trips.empty and "created_at" in df_trips.columns and "driver_username" in df_trips.columns:
-                        df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-                        now = pd.Timestamp.utcnow()
-                        last_7_days = now - pd.Timedelta(days=7)
-                        mask = (
-                            (df_trips["driver_username"] == selected_driver_username)
-                            & (df_trips["created_at"] >= last_7_days)
-                            & (df_trips["created_at"] <= now)
-                        )
-                        weekly_trips = int(mask.sum())
-                except Exception:
-                    weekly_trips = 0
+                weekly_trips = get_earnings_ledger().last_days(selected_driver_username, days=7)["trips"]
 
                 commission_pct = get_commission_pct(weekly_trips + 1)  # include this trip
                 platform_commission = round(final_price * commission_pct / 100)
@@ -302,7 +304,7 @@ else:
                     "driver_pct": 100 - commission_pct,
                     "route_mode": route_mode,
                     "city": trip_city,
-                    "routing_provider": "openrouteservice",
+                    "routing_provider": trip_provider,
                     "created_at": pd.Timestamp.utcnow().isoformat(),
                     "origin_label": origin_label,
                     "destination_label": destination_label,
@@ -310,7 +312,12 @@ else:
                 }
                 st.session_state["current_trip"] = trip_data
                 st.session_state["trips"].append(trip_data)
-                save_trip_to_db(trip_data)
+                # Trip + the driver's busy status in one write
+                book_trip_in_db(
+                    trip_data,
+                    None if chosen_driver is None else chosen_driver["username"],
+                    {"status": status_busy},
+                )
 
                 if chosen_driver:
                     st.success(
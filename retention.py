@@ -0,0 +1,292 @@
+"""
+Retention: move old trips out of the trip store into cold monthly segments.
+
+Trips created more than RETENTION_DAYS ago are written to immutable,
+gzip-compressed JSONL segments, one or more per month:
+
+    data/cold_trips/month=2026-01/2026-01-0000.jsonl.gz
+
+and removed from the trip store, so every load of the store (apps, views,
+archive sync) only reads recent trips. Nothing is lost for the admin:
+
+- trip_archive: each segment's trips are added once as `cold-<segment>`
+  files in the archive partitions, so old date ranges read them as usual;
+- trip_views: daily rollups, heavy hitters and the earnings ledger start
+  from a cached "cold base" built from the segments, and add the hot trips
+  on top.
+
+A run records its segments as pending, deletes their trips from the
+store by id (one targeted write, published on the change bus; trips saved
+meanwhile are untouched), then commits them. If it stops half way, the
+next run drops the pending segments while the store still holds all of
+their trips, and otherwise deletes what is left of them and commits, so a
+trip is never in both places (or neither).
+
+    python retention.py                 # move trips older than RETENTION_DAYS
+    python retention.py --days 90 --dry-run
+    python retention.py --reindex       # re-add the cold files to the archive
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from shared import DATA_DIR, delete_trips_from_db, load_trips_from_db
+from trip_archive import get_trip_archive
+
+RETENTION_DAYS = int(os.getenv("MALI_RIDE_RETENTION_DAYS", "180"))
+COLD_DIR = os.path.join(DATA_DIR, "cold_trips")
+
+
+def _trip_day(trip):
+    try:
+        return date.fromisoformat(str(trip.get("created_at") or "")[:10])
+    except ValueError:
+        return None
+
+
+# ---------------------------------
+# COLD SEGMENTS
+# ---------------------------------
+class ColdStore:
+    """Immutable monthly segments of trips, listed in a manifest."""
+
+    def __init__(self, root=COLD_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, "_manifest.json")
+        self._lock = threading.Lock()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"segments": [], "through": None}
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _path(self, segment):
+        return os.path.join(self.root, f"month={segment['month']}", f"{segment['name']}.jsonl.gz")
+
+    def segments(self, start=None, end=None, pending=False):
+        """Committed segments (or the pending ones) for months overlapping start..end."""
+        months = (start.strftime("%Y-%m") if start else None, end.strftime("%Y-%m") if end else None)
+        return [
+            s for s in self._read_manifest()["segments"]
+            if s.get("pending", False) == pending
+            and (months[0] is None or s["month"] >= months[0])
+            and (months[1] is None or s["month"] <= months[1])
+        ]
+
+    def through(self):
+        """Last day retention has moved (None before the first run)."""
+        through = self._read_manifest()["through"]
+        return None if through is None else date.fromisoformat(through)
+
+    def version(self):
+        """Changes whenever segments are committed (None without segments)."""
+        names = [s["name"] for s in self.segments()]
+        return f"{len(names)}:{names[-1]}" if names else None
+
+    def iter_trips(self, start=None, end=None):
+        """Trips of the committed segments, optionally limited to created_at dates start..end."""
+        for segment in self.segments(start, end):
+            with gzip.open(self._path(segment), "rt", encoding="utf-8") as f:
+                for line in f:
+                    trip = json.loads(line)
+                    if start is not None or end is not None:
+                        day = _trip_day(trip)
+                        if (start is not None and day < start) or (end is not None and day > end):
+                            continue
+                    yield trip
+
+    def write_segments(self, trips_by_month, through):
+        """Write one new pending segment per month; returns their manifest entries."""
+        with self._lock:
+            manifest = self._read_manifest()
+            taken = defaultdict(int)
+            for s in manifest["segments"]:
+                taken[s["month"]] += 1
+            added = []
+            for month, trips in sorted(trips_by_month.items()):
+                segment = {
+                    "name": f"{month}-{taken[month]:04d}",
+                    "month": month,
+                    "rows": len(trips),
+                    "through": through.isoformat(),
+                    "pending": True,
+                }
+                path = self._path(segment)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                    for t in trips:
+                        f.write(json.dumps(t, ensure_ascii=False, default=str) + "\n")
+                os.replace(path + ".tmp", path)
+                segment["bytes"] = os.path.getsize(path)
+                manifest["segments"].append(segment)
+                added.append(segment)
+            self._write_manifest(manifest)
+            return added
+
+    def commit(self, names, through):
+        with self._lock:
+            manifest = self._read_manifest()
+            for s in manifest["segments"]:
+                if s["name"] in names:
+                    s.pop("pending", None)
+            if manifest["through"] is None or through.isoformat() > manifest["through"]:
+                manifest["through"] = through.isoformat()
+            self._write_manifest(manifest)
+
+    def discard(self, names):
+        with self._lock:
+            manifest = self._read_manifest()
+            for s in manifest["segments"]:
+                if s["name"] in names:
+                    try:
+                        os.remove(self._path(s))
+                    except OSError:
+                        pass
+            manifest["segments"] = [s for s in manifest["segments"] if s["name"] not in names]
+            self._write_manifest(manifest)
+
+    def recover(self, trips):
+        """
+        Settle the segments of an interrupted run against the store's
+        `trips`; returns (committed names, discarded names) and leaves the
+        moved trips out of `trips`.
+        """
+        pending = self.segments(pending=True)
+        if not pending:
+            return [], []
+        cutoff = max(date.fromisoformat(s["through"]) for s in pending)
+        names = [s["name"] for s in pending]
+        moved = {t.get("id") for s in pending for t in _segment_trips(self, s)}
+        left = [t["id"] for t in trips if t.get("id") in moved]
+        if len(left) == len(moved):
+            self.discard(names)     # the delete never ran: they are still hot
+            return [], names
+        delete_trips_from_db(left)  # the delete ran (or some of its batches): finish the run
+        trips[:] = [t for t in trips if t.get("id") not in moved]
+        self.commit(names, cutoff)
+        return names, []
+
+
+_COLD_STORE = None
+
+
+def get_cold_store():
+    global _COLD_STORE
+    if _COLD_STORE is None:
+        _COLD_STORE = ColdStore()
+    return _COLD_STORE
+
+
+# ---------------------------------
+# RETENTION JOB
+# ---------------------------------
+def run_retention(days=RETENTION_DAYS, today=None, dry_run=False, cold=None, archive=None):
+    """
+    Move trips created before the last `days` days (today included) into
+    cold segments. Returns a report dict (trips moved / kept, segments,
+    timings).
+    """
+    cold = cold or get_cold_store()
+    archive = archive or get_trip_archive()
+    today = today or datetime.utcnow().date()
+    through = today - timedelta(days=days)
+    report = {"through": through.isoformat(), "moved": 0, "kept": 0, "segments": [], "recovered": []}
+
+    t0 = time.perf_counter()
+    trips = load_trips_from_db()
+    if not dry_run:
+        report["recovered"], _ = cold.recover(trips)
+
+    by_month = defaultdict(list)
+    kept = 0
+    for t in trips:
+        day = _trip_day(t)
+        if day is not None and day <= through:
+            by_month[day.strftime("%Y-%m")].append(t)
+        else:
+            kept += 1  # recent, or without a usable created_at
+    report["moved"] = sum(len(v) for v in by_month.values())
+    report["kept"] = kept
+    report["select_seconds"] = time.perf_counter() - t0
+    if dry_run:
+        return report
+
+    if by_month:
+        t0 = time.perf_counter()
+        segments = cold.write_segments(by_month, through)
+        delete_trips_from_db(t["id"] for trips in by_month.values() for t in trips)
+        cold.commit([s["name"] for s in segments], through)
+        report["segments"] = segments
+        report["write_seconds"] = time.perf_counter() - t0
+
+    # Drop the moved trips' part files first, then add them back as cold files
+    t0 = time.perf_counter()
+    if by_month or report["recovered"]:
+        archive.sync()
+    add_cold_files(cold, archive, {m: by_month[m] for m in by_month})
+    report["archive_seconds"] = time.perf_counter() - t0
+    return report
+
+
+def _segment_trips(cold, segment):
+    with gzip.open(cold._path(segment), "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def add_cold_files(cold=None, archive=None, trips_by_month=None):
+    """
+    Add the committed segments the trip archive does not have yet (all of
+    them after archive.drop_cold()); returns how many were added.
+    trips_by_month saves re-reading segments whose trips are at hand.
+    """
+    cold = cold or get_cold_store()
+    archive = archive or get_trip_archive()
+    known = archive.cold_segments()
+    added = 0
+    for segment in cold.segments():
+        if segment["name"] in known:
+            continue
+        trips = (trips_by_month or {}).get(segment["month"])
+        if trips is None or len(trips) != segment["rows"]:
+            trips = _segment_trips(cold, segment)
+        archive.add_cold(segment["name"], trips)
+        added += 1
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old trips into cold monthly segments.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS,
+                        help=f"Keep trips of the last DAYS days in the store (default {RETENTION_DAYS}).")
+    parser.add_argument("--dry-run", action="store_true", help="Count the trips to move, write nothing.")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild the archive's cold files.")
+    args = parser.parse_args()
+
+    if args.reindex:
+        archive = get_trip_archive()
+        archive.drop_cold()
+        print(f"Re-added {add_cold_files(archive=archive)} cold segments to the trip archive")
+    else:
+        rep = run_retention(args.days, dry_run=args.dry_run)
+        print(f"Trips up to {rep['through']}: {rep['moved']} moved, {rep['kept']} kept in the store")
+        for name in rep["recovered"]:
+            print(f"  committed {name} (from an interrupted run)")
+        for s in rep["segments"]:
+            print(f"  {s['name']}: {s['rows']} trips, {s['bytes'] / 1024:.1f} KiB")
+        for key in ("select_seconds", "write_seconds", "archive_seconds"):
+            if key in rep:
+                print(f"  {key.replace('_seconds', '')}: {rep[key] * 1000:.1f} ms")
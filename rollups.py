@@ -0,0 +1,167 @@
+"""
+Materialized daily rollups of trips for the admin dashboard.
+
+Trips are pre-aggregated per (date, city, routing_provider, driver,
+promo_code, status) as they are saved. Dashboard filters and metrics read
+these cells instead of the raw trips, so rendering cost depends on
+days x dimensions rather than on the number of trips.
+
+Distinct counts (active drivers, routes, passengers) cannot be summed
+across cells, so each (date, city) also keeps a HyperLogLog sketch per
+field in DISTINCT; sketches merge for any date range x city selection.
+"""
+import threading
+from datetime import date
+
+import pandas as pd
+
+from sketches import HyperLogLog, merge_hlls
+from trip_schema import apply_trip_schema
+from trip_views import TripStoreView
+
+DIMENSIONS = ("date", "city", "routing_provider", "driver_username", "promo_code", "status")
+MEASURES = (
+    "trips",
+    "price_xof",
+    "price_before_discount_xof",
+    "discount_xof",
+    "distance_miles",
+    "platform_commission_xof",
+    "driver_earnings_xof",
+    "cancellation_fee_xof",
+)
+
+# Distinct-count name -> trip field (passenger_id once trips carry one)
+DISTINCT = {
+    "drivers": "driver_username",
+    "routes": "route_summary",
+    "passengers": "passenger_id",
+}
+
+
+def _trip_date(trip):
+    created = trip.get("created_at")
+    if not created:
+        return None
+    try:
+        return date.fromisoformat(str(created)[:10])
+    except ValueError:
+        return None
+
+
+def _num(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if value != value else value  # NaN -> 0
+
+
+class DailyRollups:
+    """{(date, city, provider, driver, promo, status): [measures...]}, kept incrementally."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cells = {}
+        self.distinct = {}   # (date, city) -> {name: HyperLogLog}
+        self._frame = None
+
+    def add_trip(self, trip):
+        day = _trip_date(trip)
+        if day is None:
+            return
+        key = (
+            day,
+            trip.get("city"),
+            trip.get("routing_provider"),
+            trip.get("driver_username"),
+            trip.get("promo_code") or None,
+            trip.get("status"),
+        )
+        price = _num(trip.get("price_xof"))
+        values = (
+            1,
+            price,
+            _num(trip.get("price_before_discount_xof", price)),
+            _num(trip.get("discount_xof")),
+            _num(trip.get("distance_miles")),
+            _num(trip.get("platform_commission_xof")),
+            _num(trip.get("driver_earnings_xof")),
+            _num(trip.get("cancellation_fee_xof")),
+        )
+        with self._lock:
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    cell[i] += v
+            sketches = self.distinct.setdefault((day, trip.get("city")), {})
+            for name, field in DISTINCT.items():
+                value = trip.get(field)
+                if value is not None and value != "":
+                    sketch = sketches.get(name)
+                    if sketch is None:
+                        sketch = sketches[name] = HyperLogLog()
+                    sketch.add(value)
+            self._frame = None
+
+    def frame(self):
+        """All cells as a typed DataFrame (cached until the next insert)."""
+        with self._lock:
+            if self._frame is None:
+                rows = [(*key, *values) for key, values in self.cells.items()]
+                self._frame = apply_trip_schema(pd.DataFrame(rows, columns=[*DIMENSIONS, *MEASURES]))
+            return self._frame
+
+    def query(self, cities=None, providers=None, start=None, end=None):
+        """Cells matching the dashboard filters (start / end dates inclusive)."""
+        df = self.frame()
+        mask = pd.Series(True, index=df.index)
+        if cities:
+            mask &= df["city"].isin(cities)
+        if providers:
+            mask &= df["routing_provider"].isin(providers)
+        if start is not None:
+            mask &= df["date"] >= start
+        if end is not None:
+            mask &= df["date"] <= end
+        return df[mask]
+
+    def distinct_counts(self, cities=None, start=None, end=None, by=None):
+        """
+        Approximate distinct drivers / routes / passengers (HyperLogLog).
+
+        by=None: one row for the whole selection; by="date" or "city": one
+        row per day / city. Columns are the names in DISTINCT.
+        """
+        with self._lock:
+            groups = {}
+            for (day, city), sketches in self.distinct.items():
+                if cities and city not in cities:
+                    continue
+                if (start is not None and day < start) or (end is not None and day > end):
+                    continue
+                key = None if by is None else (day if by == "date" else city)
+                groups.setdefault(key, []).append(sketches)
+
+            rows = []
+            for key, group in groups.items():
+                row = {} if by is None else {by: key}
+                for name in DISTINCT:
+                    row[name] = merge_hlls(s[name] for s in group if name in s).count()
+                rows.append(row)
+        columns = ([] if by is None else [by]) + list(DISTINCT)
+        df = pd.DataFrame(rows, columns=columns)
+        if by is None and df.empty:
+            df = pd.DataFrame([{name: 0 for name in DISTINCT}])
+        return df if by is None else df.sort_values(by, ignore_index=True)
+
+
+# Process-wide rollups over the trip store (see trip_views.TripStoreView)
+_VIEW = TripStoreView(DailyRollups, DailyRollups.add_trip, name="daily_rollups")
+
+
+def get_daily_rollups():
+    """Daily rollups over the trip store, kept up to date with new trips."""
+    return _VIEW.get()
@@ -1,8 +1,19 @@
-import json
 import os
+import requests
 from datetime import datetime, date
 from math import radians, sin, cos, asin, sqrt
 
+from change_bus import (
+    DRIVER_SAVED,
+    DRIVER_UPDATED,
+    DRIVERS_UPDATED,
+    TRIP_SAVED,
+    TRIPS_DELETED,
+    TRIPS_UPDATED,
+    ChangeBus,
+)
+from storage import make_storage, read_json, write_json
+
 # ---------------------------------
 # BASIC LANGUAGE CONFIG
 # ---------------------------------
@@ -89,27 +100,98 @@ DRIVERS_PATH = os.path.join(DATA_DIR, "drivers.json")
 TRIPS_PATH = os.path.join(DATA_DIR, "trips.json")
 ADMIN_LOGINS_PATH = os.path.join(DATA_DIR, "admin_logins.json")
 
-# Some demo cities
-MALI_CITIES = ["Bamako", "Kayes", "Koulikoro", "Sikasso", "Ségou", "Mopti", "Gao", "Tombouctou", "Kidal"]
+# Some demo cities (approximate city-centre coordinates)
+MALI_CITIES = {
+    "Bamako": (12.6392, -8.0029),
+    "Kayes": (14.4469, -11.4445),
+    "Koulikoro": (12.8627, -7.5599),
+    "Sikasso": (11.3170, -5.6665),
+    "Ségou": (13.4317, -6.2157),
+    "Mopti": (14.4843, -4.1828),
+    "Gao": (16.2667, -0.0500),
+    "Tombouctou": (16.7666, -3.0026),
+    "Kidal": (18.4411, 1.4078),
+}
+
+# Bamako neighborhoods, usable as pickup / dropoff points
+BKO_NEIGHBORHOODS = {
+    "ACI 2000": (12.6475, -7.9835),
+    "Kalaban-Coura": (12.6100, -7.9660),
+    "Badalabougou": (12.6290, -7.9900),
+    "Hamdallaye": (12.6540, -7.9810),
+    "Lafiabougou": (12.6520, -8.0100),
+    "Magnambougou": (12.6250, -7.9500),
+    "Sogoniko": (12.6100, -7.9500),
+    "Baco-Djicoroni": (12.6040, -8.0400),
+    "Djélibougou": (12.6400, -7.9400),
+}
+
+# Simple admin code (change this for your deployment)
+ADMIN_CODE = "owner123"
+
+# Routing provider configs
+USE_REAL_ROUTING = True  # set False to fall back to haversine
+ROUTING_PROVIDER = "openrouteservice"  # or "google"
+
+# API keys (set them as environment variables in Streamlit Cloud)
+ORS_API_KEY = os.getenv("ORS_API_KEY")        # OpenRouteService
+GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")  # Google Maps
 
 
 # ---------------------------------
-# JSON HELPERS
+# STORAGE
 # ---------------------------------
+# Backend for drivers / trips: json (data/*.json), sqlite, firestore or
+# memory; see storage.py. Admin logins always stay in JSON.
+STORAGE_BACKEND = os.getenv("MALI_RIDE_STORAGE", "json")
+
+_STORAGE = None
+
+
+def get_storage():
+    """Process-wide Storage for drivers and trips (STORAGE_BACKEND)."""
+    global _STORAGE
+    if _STORAGE is None:
+        _STORAGE = make_storage(STORAGE_BACKEND, DATA_DIR)
+    return _STORAGE
+
+
+def drivers_version():
+    """Changes whenever the stored drivers change (for caches)."""
+    return get_storage().version("drivers")
+
+
+def trips_version():
+    """Changes whenever the stored trips change (for caches)."""
+    return get_storage().version("trips")
 
-def _read_json(path, default):
-    if not os.path.exists(path):
-        return default
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return default
 
+# Driver / trip change events (see change_bus.py): "sqlite" shares them
+# between processes through data/changes.sqlite3, "memory" keeps them in
+# this process (always the case for the per-process memory backend).
+CHANGE_BUS_BACKEND = os.getenv("MALI_RIDE_CHANGE_BUS", "sqlite")
 
-def _write_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+_CHANGE_BUS = None
+
+
+def get_change_bus():
+    global _CHANGE_BUS
+    if _CHANGE_BUS is None:
+        shared_log = CHANGE_BUS_BACKEND == "sqlite" and STORAGE_BACKEND != "memory"
+        _CHANGE_BUS = ChangeBus(os.path.join(DATA_DIR, "changes.sqlite3") if shared_log else None)
+    return _CHANGE_BUS
+
+
+def _publish_write(write, *changes):
+    """
+    Run write() (a Storage write, returning {store: (before, after)}) and
+    publish its (event kind, key, data, "drivers" / "trips") changes with
+    the versions that write went from and to.
+    """
+    versions = write()
+    bus = get_change_bus()
+    for kind, key, data, store in changes:
+        bus.publish(kind, key, data, *versions[store])
 
 
 # ---------------------------------
@@ -118,38 +200,35 @@ def _write_json(path, data):
 
 def load_drivers_from_db():
     """Return list of driver dicts."""
-    return _read_json(DRIVERS_PATH, [])
+    return get_storage().load_drivers()
 
 
 def save_driver_to_db(driver_dict):
-    """Append a driver to the local JSON store."""
-    drivers = load_drivers_from_db()
-    # simple overwrite by username if exists
-    username = driver_dict.get("username")
-    existing_idx = None
-    for i, d in enumerate(drivers):
-        if d.get("username") == username:
-            existing_idx = i
-            break
-    if existing_idx is not None:
-        drivers[existing_idx] = driver_dict
-    else:
-        drivers.append(driver_dict)
-    _write_json(DRIVERS_PATH, drivers)
+    """Insert a driver, or replace the one with the same username."""
+    _publish_write(
+        lambda: get_storage().save_driver(driver_dict),
+        (DRIVER_SAVED, driver_dict.get("username"), driver_dict, "drivers"),
+    )
 
 
 def update_driver_in_db(username, new_data):
-    """Update a driver with username using new_data dict."""
-    drivers = load_drivers_from_db()
-    updated = False
-    for i, d in enumerate(drivers):
-        if d.get("username") == username:
-            drivers[i] = new_data
-            updated = True
-            break
-    if not updated:
-        drivers.append(new_data)
-    _write_json(DRIVERS_PATH, drivers)
+    """Merge new_data into the driver with username (created if missing)."""
+    _publish_write(
+        lambda: get_storage().update_driver(username, new_data),
+        (DRIVER_UPDATED, username, dict(new_data), "drivers"),
+    )
+
+
+def update_drivers_in_db(changes):
+    """Merge {username: fields} into several drivers in one write (bulk updates)."""
+    changes = {username: dict(fields) for username, fields in changes.items()}
+    if changes:
+        _publish_write(lambda: get_storage().update_drivers(changes), (DRIVERS_UPDATED, None, changes, "drivers"))
+
+
+def write_drivers_to_db(drivers):
+    """Replace the whole drivers list in one write (migrations; not published)."""
+    get_storage().write_drivers(drivers)
 
 
 # ---------------------------------
@@ -158,13 +237,52 @@ def update_driver_in_db(username, new_data):
 
 def load_trips_from_db():
     """Return list of trip dicts."""
-    return _read_json(TRIPS_PATH, [])
+    return get_storage().load_trips()
 
 
 def save_trip_to_db(trip_dict):
-    trips = load_trips_from_db()
-    trips.append(trip_dict)
-    _write_json(TRIPS_PATH, trips)
+    """Append a trip (published as a TRIP_SAVED change)."""
+    _publish_write(lambda: get_storage().save_trip(trip_dict), (TRIP_SAVED, None, trip_dict, "trips"))
+
+
+def book_trip_in_db(trip_dict, driver_username=None, driver_updates=None):
+    """Save a trip and update its driver together (one transaction / batch where supported)."""
+    changes = [(TRIP_SAVED, None, trip_dict, "trips")]
+    if driver_username is not None:
+        changes.append((DRIVER_UPDATED, driver_username, dict(driver_updates or {}), "drivers"))
+    _publish_write(lambda: get_storage().book_trip(trip_dict, driver_username, driver_updates), *changes)
+
+
+def update_trips_in_db(changes):
+    """Merge {trip id: fields} into several trips in one write (bulk updates)."""
+    changes = {trip_id: dict(fields) for trip_id, fields in changes.items()}
+    if changes:
+        _publish_write(lambda: get_storage().update_trips(changes), (TRIPS_UPDATED, None, changes, "trips"))
+
+
+def update_trips_and_drivers_in_db(trip_changes, driver_changes):
+    """update_trips_in_db and update_drivers_in_db in one write (one transaction / batch where supported)."""
+    trip_changes = {trip_id: dict(fields) for trip_id, fields in trip_changes.items()}
+    driver_changes = {username: dict(fields) for username, fields in driver_changes.items()}
+    changes = [(TRIPS_UPDATED, None, trip_changes, "trips")]
+    if driver_changes:
+        changes.append((DRIVERS_UPDATED, None, driver_changes, "drivers"))
+    if trip_changes or driver_changes:
+        _publish_write(
+            lambda: get_storage().update_trips_and_drivers(trip_changes, driver_changes), *changes
+        )
+
+
+def delete_trips_from_db(ids):
+    """Delete the trips with these ids in one write."""
+    ids = sorted(set(ids))
+    if ids:
+        _publish_write(lambda: get_storage().delete_trips(ids), (TRIPS_DELETED, None, ids, "trips"))
+
+
+def write_trips_to_db(trips):
+    """Replace the whole trips list in one write (migrations; not published)."""
+    get_storage().write_trips(trips)
 
 
 # ---------------------------------
@@ -173,9 +291,9 @@ def save_trip_to_db(trip_dict):
 
 def save_admin_login_to_db(info):
     """Append an admin login event."""
-    logs = _read_json(ADMIN_LOGINS_PATH, [])
+    logs = read_json(ADMIN_LOGINS_PATH, [])
     logs.append(info)
-    _write_json(ADMIN_LOGINS_PATH, logs)
+    write_json(ADMIN_LOGINS_PATH, logs)
 
 
 # ---------------------------------
@@ -197,6 +315,108 @@ def haversine_miles(lat1, lon1, lat2, lon2):
     return miles
 
 
+def _openrouteservice_miles(lat1, lon1, lat2, lon2):
+    """OpenRouteService driving distance in miles; raises if the API does not answer."""
+    url = "https://api.openrouteservice.org/v2/directions/driving-car"
+    headers = {"Authorization": ORS_API_KEY, "Content-Type": "application/json"}
+    payload = {
+        "coordinates": [
+            [lon1, lat1],
+            [lon2, lat2]
+        ]
+    }
+
+    resp = requests.post(url, json=payload, headers=headers, timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    meters = data["features"][0]["properties"]["segments"][0]["distance"]
+    return meters * 0.000621371
+
+
+def get_distance_miles_openrouteservice(lat1, lon1, lat2, lon2):
+    """Use OpenRouteService (OSM-based) to get driving distance in miles."""
+    if not ORS_API_KEY:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+    try:
+        return _openrouteservice_miles(lat1, lon1, lat2, lon2)
+    except Exception:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+
+
+def _google_miles(lat1, lon1, lat2, lon2):
+    """Google Distance Matrix driving distance in miles; raises if the API does not answer."""
+    base_url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+    params = {
+        "origins": f"{lat1},{lon1}",
+        "destinations": f"{lat2},{lon2}",
+        "mode": "driving",
+        "units": "imperial",
+        "key": GOOGLE_MAPS_API_KEY,
+    }
+
+    resp = requests.get(base_url, params=params, timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    element = data["rows"][0]["elements"][0]
+    if element.get("status") != "OK":
+        raise ValueError(f"no Google route: {element.get('status')}")
+    meters = element["distance"]["value"]
+    return meters * 0.000621371
+
+
+def get_distance_miles_google(lat1, lon1, lat2, lon2):
+    """Use Google Distance Matrix API to get driving distance in miles."""
+    if not GOOGLE_MAPS_API_KEY:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+    try:
+        return _google_miles(lat1, lon1, lat2, lon2)
+    except Exception:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+
+
+def get_trip_distance_miles(lat1, lon1, lat2, lon2):
+    """Unified routing function."""
+    if not USE_REAL_ROUTING:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+
+    if ROUTING_PROVIDER == "openrouteservice":
+        return get_distance_miles_openrouteservice(lat1, lon1, lat2, lon2)
+    elif ROUTING_PROVIDER == "google":
+        return get_distance_miles_google(lat1, lon1, lat2, lon2)
+    else:
+        return haversine_miles(lat1, lon1, lat2, lon2)
+
+
+def active_routing_provider():
+    """Name of the provider get_trip_distance_miles will really use."""
+    if not USE_REAL_ROUTING:
+        return "haversine"
+    if ROUTING_PROVIDER == "openrouteservice" and ORS_API_KEY:
+        return "openrouteservice"
+    if ROUTING_PROVIDER == "google" and GOOGLE_MAPS_API_KEY:
+        return "google"
+    return "haversine"
+
+
+def get_trip_distance_and_provider(lat1, lon1, lat2, lon2):
+    """
+    (miles, provider) like get_trip_distance_miles, where provider is the
+    one that answered: "haversine" when the routing API failed for this pair.
+    """
+    provider = active_routing_provider()
+    route = {"openrouteservice": _openrouteservice_miles, "google": _google_miles}.get(provider)
+    if route is not None:
+        try:
+            return route(lat1, lon1, lat2, lon2), provider
+        except Exception:
+            pass
+    return haversine_miles(lat1, lon1, lat2, lon2), "haversine"
+
+
+def compute_fare(distance_miles, base_fare=1000, per_mile=300):
+    return round(base_fare + per_mile * distance_miles, 0)
+
+
 BASE_FARE_XOF = 700  # example base fare
 PER_MILE_XOF = 300   # per mile
 
@@ -252,10 +472,33 @@ DRIVER_CANCEL_PENALTY_PCT = 35      # % of fare
 DRIVER_RATING_PENALTY_STEP = 0.2    # rating drop per cancellation
 DRIVER_MIN_RATING = 1.0
 
+# Ratings and cancel counts live in the driver ledger (driver_ledger.py);
+# the driver store holds a copy, rewritten after every ledger event.
+
+
+def _driver_ledger(username, driver_dict=None):
+    """The driver ledger, with the driver's opening balance seeded if it has none yet."""
+    from driver_ledger import get_driver_ledger  # driver_ledger imports this module
+
+    ledger = get_driver_ledger()
+    if not ledger.known(username):
+        if driver_dict is None:
+            driver_dict = next((d for d in load_drivers_from_db() if d.get("username") == username), None)
+        ledger.seed_from_drivers([driver_dict] if driver_dict else [])
+    return ledger
+
+
+def _store_ledger_rating(ledger, username):
+    """Copy the ledger's rating / cancel_count / penalties to the stored driver."""
+    projection = ledger.projection(username)
+    update_driver_in_db(username, projection)
+    return projection
+
 
 def apply_passenger_cancellation(trip):
     """
-    Apply passenger cancellation logic to a trip dict.
+    Apply passenger cancellation logic to a trip dict, and record it in
+    the driver ledger against the trip's driver.
 
     Assumes `trip` has:
       - price_xof
@@ -267,13 +510,18 @@ def apply_passenger_cancellation(trip):
     trip["cancellation_fee_xof"] = fee
     trip["platform_commission_xof"] = fee
     trip["driver_earnings_xof"] = 0
+    username = trip.get("driver_username")
+    if username:
+        _driver_ledger(username).record_passenger_cancellation(trip)
     return trip
 
 
 def apply_driver_cancellation(trip):
     """
     Apply driver cancellation logic to a trip dict.
-    35% penalty goes to platform, driver earns 0.
+    35% penalty goes to platform, driver earns 0. The penalty and the
+    rating drop are recorded in the driver ledger, and the driver's new
+    rating / cancel_count are stored.
     """
     price = trip.get("price_xof", 0)
     fee = int(round(price * DRIVER_CANCEL_PENALTY_PCT / 100.0))
@@ -281,21 +529,26 @@ def apply_driver_cancellation(trip):
     trip["cancellation_fee_xof"] = fee
     trip["platform_commission_xof"] = fee
     trip["driver_earnings_xof"] = 0
+    username = trip.get("driver_username")
+    if username:
+        ledger = _driver_ledger(username)
+        ledger.record_driver_cancellation(trip)
+        _store_ledger_rating(ledger, username)
     return trip
 
 
 def penalize_driver_rating(driver_dict):
     """
-    Reduce driver rating when they cancel a trip.
+    Reduce driver rating when they cancel a trip (no fee), through the
+    driver ledger; the driver dict and the stored driver get the result.
+    apply_driver_cancellation already does this: do not call both.
     """
-    rating = float(driver_dict.get("rating", 5.0))
-    cancel_count = int(driver_dict.get("cancel_count", 0))
+    from driver_ledger import EVENT_DRIVER_CANCELLATION
 
-    rating = max(DRIVER_MIN_RATING, rating - DRIVER_RATING_PENALTY_STEP)
-    cancel_count += 1
-
-    driver_dict["rating"] = rating
-    driver_dict["cancel_count"] = cancel_count
+    username = driver_dict.get("username")
+    ledger = _driver_ledger(username, driver_dict)
+    ledger.append_events([(username, EVENT_DRIVER_CANCELLATION, 0, -DRIVER_RATING_PENALTY_STEP)])
+    driver_dict.update(_store_ledger_rating(ledger, username))
     return driver_dict
 
 
@@ -0,0 +1,274 @@
+"""
+Streaming sketches: top-K for the driver and route leaderboards, and
+HyperLogLog for distinct counts in the daily rollups.
+
+Each (day, city, routing_provider) keeps one Space-Saving sketch per
+leaderboard: at most SKETCH_CAPACITY counters, updated in amortized
+O(log capacity) as trips arrive. Sketches of any date range / city / provider selection merge
+into one approximate leaderboard whose counts come with an error bound:
+
+    count - error <= true value <= count
+
+When a day has fewer distinct drivers / routes than the capacity its
+counts are exact (error 0).
+
+HyperLogLog sketches give distinct counts (active drivers, routes,
+passengers) in constant memory; rollups.DailyRollups keeps one per
+(day, city) and merges them for any date range.
+"""
+import hashlib
+import heapq
+import math
+import threading
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from trip_views import TripStoreView
+
+SKETCH_CAPACITY = 100
+
+# leaderboard -> (dimension, weight field; None counts trips)
+LEADERBOARDS = {
+    "top_drivers": ("driver_username", "price_xof"),
+    "top_routes": ("route_summary", None),
+}
+
+
+# ---------------------------------
+# TOP-K LEADERBOARDS
+# ---------------------------------
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter sketch (Metwally et al.) with weighted updates.
+
+    The smallest counter is found with a min-heap holding one (count, seq,
+    item) entry per item. Weighted increments rule out the unit-step stream
+    summary, and counts only grow, so increments leave the heap alone: an
+    entry may be below its item's count, and a stale entry reaching the
+    top is pushed back with the current count before the minimum is taken.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+        self._seq = 0  # tie-breaker, so items themselves are never compared
+
+    def _push(self, item):
+        self._seq += 1
+        heapq.heappush(self._heap, (self.counts[item], self._seq, item))
+
+    def _pop_min(self):
+        if len(self._heap) != len(self.counts):  # counts set directly (merge_sketches)
+            self._heap = [(count, i, item) for i, (item, count) in enumerate(self.counts.items())]
+            heapq.heapify(self._heap)
+            self._seq = len(self._heap)
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            if self.counts[item] == count:
+                return item
+            self._push(item)
+
+    def update(self, item, weight=1):
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            self._push(item)
+        else:
+            # Replace the smallest counter; the newcomer inherits its count as error
+            victim = self._pop_min()
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+            self._push(item)
+
+    def floor(self):
+        """Largest count an untracked item can have (0 until the sketch is full)."""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+
+def merge_sketches(sketches, capacity=SKETCH_CAPACITY):
+    """
+    Merge Space-Saving sketches into one (Agarwal et al., mergeable summaries).
+
+    An item missing from a full sketch may still have up to that sketch's
+    floor there, so the floor is added to both its count and its error.
+    """
+    sketches = [s for s in sketches if s.counts]
+    merged = SpaceSaving(capacity)
+    if not sketches:
+        return merged
+    floors = [s.floor() for s in sketches]
+    total_floor = sum(floors)
+    counts = defaultdict(lambda: total_floor)
+    errors = defaultdict(lambda: total_floor)
+    for s, f in zip(sketches, floors):
+        for item, c in s.counts.items():
+            counts[item] += c - f
+            errors[item] += s.errors[item] - f
+    top = sorted(counts, key=counts.get, reverse=True)[:capacity]
+    merged.counts = {item: counts[item] for item in top}
+    merged.errors = {item: errors[item] for item in top}
+    return merged
+
+
+def _trip_date(trip):
+    try:
+        return date.fromisoformat(str(trip.get("created_at") or "")[:10])
+    except ValueError:
+        return None
+
+
+class HeavyHitters:
+    """Per-day Space-Saving sketches for every leaderboard in LEADERBOARDS."""
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        # (day, city, provider) -> {leaderboard: SpaceSaving}
+        self.days = {}
+
+    def add_trip(self, trip):
+        day = _trip_date(trip)
+        if day is None:
+            return
+        key = (day, trip.get("city"), trip.get("routing_provider"))
+        with self._lock:
+            sketches = self.days.get(key)
+            if sketches is None:
+                sketches = self.days[key] = {name: SpaceSaving(self.capacity) for name in LEADERBOARDS}
+            for name, (dim, weight_field) in LEADERBOARDS.items():
+                item = trip.get(dim)
+                if item is None or item == "":
+                    continue
+                weight = 1
+                if weight_field is not None:
+                    weight = max(0, int(float(trip.get(weight_field) or 0)))
+                sketches[name].update(item, weight)
+
+    def top(self, leaderboard, n=10, cities=None, providers=None, start=None, end=None):
+        """
+        Approximate leaderboard over the selected days, cities and providers.
+
+        Columns: the dimension, `estimate` (upper bound), `error` and
+        `lower_bound` (= estimate - error).
+        """
+        dim, _ = LEADERBOARDS[leaderboard]
+        with self._lock:
+            selected = [
+                sketches[leaderboard]
+                for (day, city, provider), sketches in self.days.items()
+                if (not cities or city in cities)
+                and (not providers or provider in providers)
+                and (start is None or day >= start)
+                and (end is None or day <= end)
+            ]
+            merged = merge_sketches(selected, self.capacity)
+        rows = sorted(merged.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        df = pd.DataFrame(rows, columns=[dim, "estimate"])
+        df["error"] = [merged.errors[item] for item in df[dim]]
+        df["lower_bound"] = df["estimate"] - df["error"]
+        return df
+
+
+def build_heavy_hitters(trips, capacity=SKETCH_CAPACITY):
+    hh = HeavyHitters(capacity)
+    for t in trips:
+        hh.add_trip(t)
+    return hh
+
+
+# Process-wide sketches over the trip store (see trip_views.TripStoreView)
+_VIEW = TripStoreView(HeavyHitters, HeavyHitters.add_trip, name="heavy_hitters")
+
+
+def get_heavy_hitters():
+    """Leaderboard sketches over the trip store, kept up to date with new trips."""
+    return _VIEW.get()
+
+
+# ---------------------------------
+# HYPERLOGLOG (distinct counts)
+# ---------------------------------
+HLL_PRECISION = 10  # 2**10 registers: ~3.3% standard error, 1 KB once dense
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter (Flajolet et al.), mergeable by register max.
+
+    Registers start sparse ({index: rank}) and switch to a dense uint8
+    array once more than 1/64 of them are set, so a day with a handful of
+    drivers costs a few entries rather than 1 KB.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        self.sparse = {}
+        self.registers = None
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if self.registers is not None:
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+        elif rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            if len(self.sparse) > self.m // 64:
+                self._densify()
+
+    def _densify(self):
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+        if self.sparse:
+            self.registers[list(self.sparse)] = list(self.sparse.values())
+        self.sparse = {}
+
+    def merge(self, other):
+        """Fold other into self (in place) and return self."""
+        if other.registers is None and self.registers is None:
+            for index, rank in other.sparse.items():
+                if rank > self.sparse.get(index, 0):
+                    self.sparse[index] = rank
+            if len(self.sparse) > self.m // 64:
+                self._densify()
+            return self
+        if self.registers is None:
+            self._densify()
+        if other.registers is not None:
+            np.maximum(self.registers, other.registers, out=self.registers)
+        elif other.sparse:
+            np.maximum.at(self.registers, list(other.sparse), list(other.sparse.values()))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values added."""
+        if self.registers is None:
+            ranks = np.zeros(self.m, dtype=np.uint8)
+            if self.sparse:
+                ranks[list(self.sparse)] = list(self.sparse.values())
+        else:
+            ranks = self.registers
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / float(np.sum(np.ldexp(1.0, -ranks.astype(np.int64))))
+        zeros = int(np.count_nonzero(ranks == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)  # small-range (linear counting) correction
+        return int(round(estimate))
+
+
+def merge_hlls(hlls, precision=HLL_PRECISION):
+    merged = HyperLogLog(precision)
+    for h in hlls:
+        merged.merge(h)
+    return merged
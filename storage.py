@@ -0,0 +1,1064 @@
+"""
+Storage backends for drivers and trips.
+
+Every entry point reads and writes drivers / trips through one Storage
+interface, with the same semantics on every backend:
+
+- save_driver(d): insert, or replace the driver with the same username;
+- update_driver(username, updates): merge `updates` into the stored
+  driver (dict.update; the driver is created if missing);
+- save_trip(t): append a trip. Trips are keyed by an "id" field, set on
+  the trip dict when it has none (stores written before trips had ids
+  get theirs on their first load);
+- save_drivers / save_trips: bulk save_driver / save_trip, one write
+  (transaction, batch) per call instead of one per item;
+- update_drivers({username: updates}) / update_trips({id: updates}) /
+  delete_trips(ids): targeted bulk changes, one write per call that only
+  touches the listed rows (trip ids not in the store are skipped), so
+  concurrent writes to other rows or fields are kept;
+- write_drivers / write_trips: replace everything (migrations, tests);
+- book_trip(trip, username, updates): save the trip and update its driver
+  together, atomically where the backend supports it;
+- update_trips_and_drivers(trip_changes, driver_changes): update_trips and
+  update_drivers as one write, atomically where the backend supports it
+  (SQLite transaction, Firestore batch up to its write limit; the file
+  and memory backends write the drivers, then the trips);
+- version(kind): a value that changes whenever "drivers" / "trips"
+  change, for caches and derived views. Every write returns
+  {kind: (version before, version after)} for the kinds it wrote, both
+  read under the backend's write lock (file lock, transaction), so
+  consecutive writes chain exactly: one's "after" is the next's "before";
+- iter_batches(kind, batch_size, after) / count(kind): bulk reads for
+  bulk_transfer.py, as (batch, cursor) pairs in a stable order; passing a
+  cursor back as `after` resumes after that batch.
+
+Backends: JsonStorage (data/*.json), JsonlStorage (snapshot + append-only
+log, compacted in the background), SqliteStorage, FirestoreStorage and
+MemoryStorage. Each keeps its own counters in `stats`: calls, rows and
+seconds per operation.
+
+    python storage.py            # time each local backend on the current data
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from firestore_writes import META_COLLECTION, commit_counted
+
+try:
+    from google.cloud import firestore
+    HAVE_FIRESTORE = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAVE_FIRESTORE = False
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: locks are per process only
+    fcntl = None
+
+FIRESTORE_POLL_SECONDS = 30  # how stale FirestoreStorage.version() may be for other writers' changes
+TRIP_UPDATED_AT = "updated_at"  # Firestore trips: server commit time of the last write (trip_mirror cursor)
+COMPACT_MIN_BYTES = 1 << 20  # JsonlStorage: never compact a log smaller than this...
+COMPACT_RATIO = 0.5          # ...or smaller than this fraction of the snapshot
+
+
+# ---------------------------------
+# JSON HELPERS
+# ---------------------------------
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+
+def write_json(path, data):
+    """Write via a temp file + rename, so readers never see a half-written file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _upsert_driver(drivers, driver):
+    """Replace the driver with the same username in the list, or append it."""
+    for i, d in enumerate(drivers):
+        if d.get("username") == driver.get("username"):
+            drivers[i] = driver
+            return
+    drivers.append(driver)
+
+
+def _merge_drivers(drivers, changes):
+    """Merge {username: updates} into the drivers list, appending unknown drivers."""
+    by_username = {d.get("username"): d for d in drivers}
+    for username, updates in changes.items():
+        driver = by_username.get(username)
+        if driver is None:
+            driver = by_username[username] = {"username": username}
+            drivers.append(driver)
+        driver.update(updates)
+
+
+def _merge_trips(trips, changes):
+    for t in trips:
+        updates = changes.get(t.get("id"))
+        if updates:
+            t.update(updates)
+
+
+def new_trip_id():
+    return uuid.uuid4().hex
+
+
+def _with_ids(trips):
+    for t in trips:
+        if not t.get("id"):
+            t["id"] = new_trip_id()
+    return trips
+
+
+# ---------------------------------
+# INTERFACE
+# ---------------------------------
+class Storage:
+    """Driver / trip store; subclasses implement the underscore methods."""
+
+    name = "storage"
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: {"calls": 0, "rows": 0, "seconds": 0.0})
+        self._lock = threading.RLock()
+
+    def _timed(self, op, rows, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        counter = self.stats[op]
+        counter["calls"] += 1
+        counter["rows"] += len(result) if rows is None else rows
+        counter["seconds"] += time.perf_counter() - started
+        return result
+
+    def reset_stats(self):
+        self.stats.clear()
+
+    def _write(self, op, rows, kinds, fn, *args):
+        """Run one write; returns {kind: (version before, version after)}."""
+        with self._write_lock(kinds):
+            before = {k: self.version(k) for k in kinds}
+            self._timed(op, rows, fn, *args)
+            return {k: (before[k], self.version(k)) for k in kinds}
+
+    def _write_lock(self, kinds):
+        """Held around a write and the version reads on both sides of it."""
+        return self._lock
+
+    # Drivers
+    def load_drivers(self):
+        return self._timed("load_drivers", None, self._load_drivers)
+
+    def save_driver(self, driver):
+        return self._write("save_driver", 1, ("drivers",), self._save_drivers, [driver])
+
+    def save_drivers(self, drivers):
+        drivers = list(drivers)
+        return self._write("save_drivers", len(drivers), ("drivers",), self._save_drivers, drivers)
+
+    def update_driver(self, username, updates):
+        return self._write("update_driver", 1, ("drivers",), self._update_drivers, {username: dict(updates)})
+
+    def update_drivers(self, changes):
+        changes = {username: dict(updates) for username, updates in changes.items()}
+        return self._write("update_drivers", len(changes), ("drivers",), self._update_drivers, changes)
+
+    def write_drivers(self, drivers):
+        drivers = list(drivers)
+        return self._write("write_drivers", len(drivers), ("drivers",), self._write_drivers, drivers)
+
+    # Trips
+    def load_trips(self):
+        trips = self._timed("load_trips", None, self._load_trips)
+        if any(not t.get("id") for t in trips):
+            trips = self._assign_trip_ids()
+        return trips
+
+    def _assign_trip_ids(self):
+        """Give an id to the stored trips saved before trips had one (once per store)."""
+        with self._write_lock(("trips",)):
+            trips = self._load_trips()
+            if any(not t.get("id") for t in trips):
+                self._write_trips(_with_ids(trips))
+        return trips
+
+    def save_trip(self, trip):
+        return self._write("save_trip", 1, ("trips",), self._save_trips, _with_ids([trip]))
+
+    def save_trips(self, trips):
+        trips = _with_ids(list(trips))
+        return self._write("save_trips", len(trips), ("trips",), self._save_trips, trips)
+
+    def update_trips(self, changes):
+        changes = {trip_id: dict(updates) for trip_id, updates in changes.items()}
+        return self._write("update_trips", len(changes), ("trips",), self._update_trips, changes)
+
+    def delete_trips(self, ids):
+        ids = set(ids)
+        return self._write("delete_trips", len(ids), ("trips",), self._delete_trips, ids)
+
+    def write_trips(self, trips):
+        trips = list(trips)
+        return self._write("write_trips", len(trips), ("trips",), self._write_trips, trips)
+
+    def book_trip(self, trip, driver_username=None, driver_updates=None):
+        kinds = ("trips",) if driver_username is None else ("drivers", "trips")
+        _with_ids([trip])
+        return self._write("book_trip", 1, kinds, self._book_trip, trip, driver_username, dict(driver_updates or {}))
+
+    def _book_trip(self, trip, driver_username, driver_updates):
+        if driver_username is not None:
+            self._update_drivers({driver_username: driver_updates})
+        self._save_trips([trip])
+
+    def update_trips_and_drivers(self, trip_changes, driver_changes):
+        trip_changes = {trip_id: dict(updates) for trip_id, updates in trip_changes.items()}
+        driver_changes = {username: dict(updates) for username, updates in driver_changes.items()}
+        kinds = ("drivers", "trips") if driver_changes else ("trips",)
+        rows = len(trip_changes) + len(driver_changes)
+        return self._write(
+            "update_trips_and_drivers", rows, kinds, self._update_trips_and_drivers, trip_changes, driver_changes
+        )
+
+    def _update_trips_and_drivers(self, trip_changes, driver_changes):
+        if driver_changes:
+            self._update_drivers(driver_changes)
+        self._update_trips(trip_changes)
+
+    def version(self, kind):
+        raise NotImplementedError
+
+    # Bulk reads
+    def iter_batches(self, kind, batch_size=1000, after=None):
+        items = self.load_drivers() if kind == "drivers" else self.load_trips()
+        for start in range(after or 0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            yield batch, start + len(batch)
+
+    def count(self, kind):
+        return len(self.load_drivers() if kind == "drivers" else self.load_trips())
+
+
+# ---------------------------------
+# JSON FILES
+# ---------------------------------
+class JsonStorage(Storage):
+    """Whole lists in drivers.json / trips.json (rewritten on every change)."""
+
+    name = "json"
+
+    def __init__(self, drivers_path, trips_path):
+        super().__init__()
+        self.paths = {"drivers": drivers_path, "trips": trips_path}
+
+    @contextmanager
+    def _write_lock(self, kinds):
+        # Other processes rewrite the same files: lock them, not just this process
+        with ExitStack() as stack:
+            for kind in sorted(kinds):
+                stack.enter_context(FileLock(self.paths[kind] + ".lock", self._lock))
+            yield
+
+    def _load_drivers(self):
+        return read_json(self.paths["drivers"], [])
+
+    def _save_drivers(self, drivers):
+        with self._lock:
+            stored = self._load_drivers()
+            for d in drivers:
+                _upsert_driver(stored, d)
+            write_json(self.paths["drivers"], stored)
+
+    def _update_drivers(self, changes):
+        with self._lock:
+            stored = self._load_drivers()
+            _merge_drivers(stored, changes)
+            write_json(self.paths["drivers"], stored)
+
+    def _write_drivers(self, drivers):
+        write_json(self.paths["drivers"], drivers)
+
+    def _load_trips(self):
+        return read_json(self.paths["trips"], [])
+
+    def _save_trips(self, trips):
+        with self._lock:
+            stored = self._load_trips()
+            stored.extend(trips)
+            write_json(self.paths["trips"], stored)
+
+    def _update_trips(self, changes):
+        with self._lock:
+            stored = self._load_trips()
+            _merge_trips(stored, changes)
+            write_json(self.paths["trips"], stored)
+
+    def _delete_trips(self, ids):
+        with self._lock:
+            write_json(self.paths["trips"], [t for t in self._load_trips() if t.get("id") not in ids])
+
+    def _write_trips(self, trips):
+        write_json(self.paths["trips"], trips)
+
+    def version(self, kind):
+        # Each rewrite is a new file (temp + rename): a new inode even within
+        # the file system's timestamp granularity
+        try:
+            st = os.stat(self.paths[kind])
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns}:{st.st_size}:{st.st_ino}"
+
+
+# ---------------------------------
+# JSONL SNAPSHOT + LOG
+# ---------------------------------
+class JsonlStorage(Storage):
+    """
+    Per kind, a snapshot and an append-only log, both JSON lines whose
+    first line is a {"generation": n} header:
+
+        data/drivers.snapshot.jsonl   one driver per line
+        data/drivers.log.jsonl        {"op": "save" | "update", ...} per change
+        data/trips.snapshot.jsonl / data/trips.log.jsonl
+                                      {"op": "add" | "update" | "delete", ...}
+
+    A write appends one line instead of rewriting the file. Loading reads
+    the snapshot and replays the log once per process, then only the log
+    lines appended since. When the log outgrows both thresholds
+    (compact_min_bytes, compact_ratio x the snapshot) a background thread
+    compacts: it writes the current state as the next generation's
+    snapshot and starts an empty log. A log whose generation is older
+    than the snapshot's is already part of the snapshot and is ignored,
+    so a compaction interrupted between the two renames loses nothing.
+    Writers and compaction take a lock file (flock) per kind, so several
+    processes can share the files.
+    """
+
+    name = "jsonl"
+
+    def __init__(self, data_dir, compact_min_bytes=COMPACT_MIN_BYTES, compact_ratio=COMPACT_RATIO,
+                 background=True):
+        super().__init__()
+        self.data_dir = data_dir
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_ratio = compact_ratio
+        self.background = background
+        self._cache = {}          # kind -> [generation, log offset, state]
+        self._compacting = set()
+
+    def _path(self, kind, part):
+        return os.path.join(self.data_dir, f"{kind}.{part}.jsonl")
+
+    def _file_lock(self, kind):
+        return FileLock(os.path.join(self.data_dir, f"{kind}.lock"), self._lock)
+
+    @contextmanager
+    def _write_lock(self, kinds):
+        with ExitStack() as stack:
+            for kind in sorted(kinds):
+                stack.enter_context(self._file_lock(kind))
+            yield
+
+    # State: drivers as {username: driver}, trips as {id: trip} (insertion
+    # ordered; a trip without an id gets a key of its own)
+    @staticmethod
+    def _empty(kind):
+        return {}
+
+    @staticmethod
+    def _apply(kind, state, record):
+        op = record["op"]
+        if op in ("save", "add"):
+            data = record["data"]
+            key = data.get("username") if kind == "drivers" else data.get("id") or object()
+            state[key] = data
+        elif op == "update" and kind == "drivers":
+            state.setdefault(record["key"], {"username": record["key"]}).update(record["data"])
+        elif op == "update":
+            if record["key"] in state:
+                state[record["key"]].update(record["data"])
+        elif op == "delete":
+            for key in record["keys"]:
+                state.pop(key, None)
+
+    @staticmethod
+    def _items(kind, state):
+        return list(state.values())
+
+    def _generation(self, part_path):
+        try:
+            with open(part_path, "r", encoding="utf-8") as f:
+                return json.loads(f.readline())["generation"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _read_lines(self, path, offset):
+        """Complete lines from byte `offset` on (a line being appended is left for later)."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        return [json.loads(line) for line in data[:end].splitlines() if line.strip()], offset + end
+
+    def _state(self, kind):
+        """Current state of `kind`, reading only what changed since the last call."""
+        log_path = self._path(kind, "log")
+        with self._lock:
+            cached = self._cache.get(kind)
+            log_generation = self._generation(log_path)
+            if cached is not None and log_generation == cached[0]:
+                offset = cached[1]
+                records, cached[1] = self._read_lines(log_path, offset)
+                for r in records[1:] if offset == 0 else records:  # skip the header of a new log
+                    self._apply(kind, cached[2], r)
+                return cached[2]
+
+            state = self._empty(kind)
+            snapshot_path = self._path(kind, "snapshot")
+            generation = 0
+            if os.path.exists(snapshot_path):
+                (header, *items), _ = self._read_lines(snapshot_path, 0)
+                generation = header["generation"]
+                for item in items:
+                    self._apply(kind, state, {"op": "save", "data": item})
+            offset = 0
+            if log_generation == generation:
+                records, offset = self._read_lines(log_path, 0)
+                for r in records[1:]:
+                    self._apply(kind, state, r)
+            self._cache[kind] = [generation, offset, state]
+            return state
+
+    def _append(self, kind, records):
+        log_path = self._path(kind, "log")
+        with self._file_lock(kind):
+            generation = self._generation(self._path(kind, "snapshot")) or 0
+            if self._generation(log_path) != generation:
+                _write_lines(log_path, [{"generation": generation}])
+            with open(log_path, "ab") as f:
+                f.write(b"".join(
+                    json.dumps(r, ensure_ascii=False, default=str).encode("utf-8") + b"\n" for r in records
+                ))
+        self._maybe_compact(kind)
+
+    def _maybe_compact(self, kind):
+        log_bytes = _file_size(self._path(kind, "log"))
+        snapshot_bytes = _file_size(self._path(kind, "snapshot"))
+        if log_bytes < self.compact_min_bytes or log_bytes < self.compact_ratio * snapshot_bytes:
+            return
+        with self._lock:
+            if kind in self._compacting:
+                return
+            self._compacting.add(kind)
+        if self.background:
+            threading.Thread(target=self.compact, args=(kind,), name=f"compact-{kind}", daemon=True).start()
+        else:
+            self.compact(kind)
+
+    def compact(self, kind, items=None):
+        """Write `items` (default: the current state) as a new snapshot and start an empty log."""
+        started = time.perf_counter()
+        try:
+            with self._file_lock(kind):
+                if items is None:
+                    items = list(self._items(kind, self._state(kind)))
+                generation = (self._generation(self._path(kind, "snapshot")) or 0) + 1
+                _write_lines(self._path(kind, "snapshot"), [{"generation": generation}, *items])
+                _write_lines(self._path(kind, "log"), [{"generation": generation}])
+                # The new generation is what this process holds: no need to re-read it
+                state = self._empty(kind)
+                for item in items:
+                    self._apply(kind, state, {"op": "save", "data": item})
+                self._cache[kind] = [generation, _file_size(self._path(kind, "log")), state]
+            counter = self.stats[f"compact_{kind}"]
+            counter["calls"] += 1
+            counter["rows"] += len(items)
+            counter["seconds"] += time.perf_counter() - started
+        finally:
+            with self._lock:
+                self._compacting.discard(kind)
+
+    def _load_drivers(self):
+        return [dict(d) for d in self._items("drivers", self._state("drivers"))]
+
+    def _save_drivers(self, drivers):
+        self._append("drivers", [{"op": "save", "data": d} for d in drivers])
+
+    def _update_drivers(self, changes):
+        self._append("drivers", [{"op": "update", "key": u, "data": updates} for u, updates in changes.items()])
+
+    def _write_drivers(self, drivers):
+        self.compact("drivers", drivers)
+
+    def _load_trips(self):
+        return [dict(t) for t in self._items("trips", self._state("trips"))]
+
+    def _save_trips(self, trips):
+        self._append("trips", [{"op": "add", "data": t} for t in trips])
+
+    def _update_trips(self, changes):
+        self._append("trips", [{"op": "update", "key": i, "data": updates} for i, updates in changes.items()])
+
+    def _delete_trips(self, ids):
+        self._append("trips", [{"op": "delete", "keys": sorted(ids)}])
+
+    def _write_trips(self, trips):
+        self.compact("trips", trips)
+
+    def version(self, kind):
+        try:
+            snapshot = os.stat(self._path(kind, "snapshot")).st_mtime_ns
+        except OSError:
+            snapshot = None
+        try:
+            log = os.stat(self._path(kind, "log"))
+        except OSError:
+            return None if snapshot is None else f"{snapshot}"
+        return f"{snapshot}:{log.st_mtime_ns}:{log.st_size}"
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _write_lines(path, rows):
+    """Write JSON lines via a temp file + rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+    os.replace(tmp_path, path)
+
+
+class FileLock:
+    """
+    Thread lock + exclusive flock on a lock file (cross-process where fcntl
+    exists). Re-entrant within a thread: a nested lock of the same file
+    does not flock it again (a second flock from this process would wait
+    for the first).
+    """
+
+    _held = {}  # (path, thread id) -> [open lock file, depth]
+
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self._key = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        self._key = (self.path, threading.get_ident())
+        held = self._held.get(self._key)
+        if held is not None:
+            held[1] += 1
+            return self
+        lock_file = None
+        if fcntl is not None:
+            lock_file = open(self.path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        self._held[self._key] = [lock_file, 1]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        held = self._held[self._key]
+        held[1] -= 1
+        if not held[1]:
+            del self._held[self._key]
+            if held[0] is not None:
+                fcntl.flock(held[0], fcntl.LOCK_UN)
+                held[0].close()
+        self.thread_lock.release()
+        return False
+
+
+# ---------------------------------
+# SQLITE
+# ---------------------------------
+class SqliteStorage(Storage):
+    """
+    One row per driver / trip in a SQLite file: driver updates, trip
+    appends and trip updates / deletes (by the indexed trip id) touch only
+    their rows, and book_trip / update_trips_and_drivers are one
+    transaction. A
+    per-kind version counter is bumped in the same transaction as every
+    write, so other processes see changes through version().
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS drivers (username TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS trips (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (kind TEXT PRIMARY KEY, version INTEGER NOT NULL);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(trips)")}
+        if "id" not in columns:  # files written before trips had ids
+            self._conn.execute("ALTER TABLE trips ADD COLUMN id TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trips_id ON trips (id)")
+
+    def _transaction(self, *kinds):
+        return _SqliteTransaction(self, kinds)
+
+    def _write_lock(self, kinds):
+        # The versions are read inside the write's own transaction
+        return self._transaction()
+
+    def _upsert_rows(self, db, drivers):
+        db.executemany(
+            "INSERT INTO drivers (username, data) VALUES (?, ?) "
+            "ON CONFLICT(username) DO UPDATE SET data = excluded.data",
+            [(d.get("username"), json.dumps(d, ensure_ascii=False, default=str)) for d in drivers],
+        )
+
+    def _load_drivers(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM drivers ORDER BY rowid").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def _save_drivers(self, drivers):
+        with self._transaction("drivers") as db:
+            self._upsert_rows(db, drivers)
+
+    def _update_drivers(self, changes):
+        with self._transaction("drivers") as db:
+            drivers = []
+            for username, updates in changes.items():
+                row = db.execute("SELECT data FROM drivers WHERE username = ?", (username,)).fetchone()
+                driver = json.loads(row[0]) if row else {"username": username}
+                driver.update(updates)
+                drivers.append(driver)
+            self._upsert_rows(db, drivers)
+
+    def _write_drivers(self, drivers):
+        with self._transaction("drivers") as db:
+            db.execute("DELETE FROM drivers")
+            self._upsert_rows(db, drivers)
+
+    def _load_trips(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM trips ORDER BY seq").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def _insert_trips(self, db, trips):
+        db.executemany(
+            "INSERT INTO trips (id, data) VALUES (?, ?)",
+            [(t.get("id"), json.dumps(t, ensure_ascii=False, default=str)) for t in trips],
+        )
+
+    def _save_trips(self, trips):
+        with self._transaction("trips") as db:
+            self._insert_trips(db, trips)
+
+    def _update_trips(self, changes):
+        ids = list(changes)
+        with self._transaction("trips") as db:
+            for start in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+                chunk = ids[start:start + 500]
+                rows = db.execute(
+                    f"SELECT seq, id, data FROM trips WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                updated = []
+                for seq, trip_id, data in rows:
+                    trip = json.loads(data)
+                    trip.update(changes[trip_id])
+                    updated.append((json.dumps(trip, ensure_ascii=False, default=str), seq))
+                db.executemany("UPDATE trips SET data = ? WHERE seq = ?", updated)
+
+    def _delete_trips(self, ids):
+        with self._transaction("trips") as db:
+            db.executemany("DELETE FROM trips WHERE id = ?", [(i,) for i in ids])
+
+    def _write_trips(self, trips):
+        with self._transaction("trips") as db:
+            db.execute("DELETE FROM trips")
+            self._insert_trips(db, trips)
+
+    def _book_trip(self, trip, driver_username, driver_updates):
+        with self._transaction("drivers", "trips") as db:
+            if driver_username is not None:
+                self._update_drivers({driver_username: driver_updates})
+            self._insert_trips(db, [trip])
+
+    def _update_trips_and_drivers(self, trip_changes, driver_changes):
+        with self._transaction("drivers", "trips"):
+            super()._update_trips_and_drivers(trip_changes, driver_changes)
+
+    def version(self, kind):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM meta WHERE kind = ?", (kind,)).fetchone()
+        return row[0] if row else 0
+
+    def iter_batches(self, kind, batch_size=1000, after=None):
+        # Pages by rowid / seq: resuming does not re-read earlier rows
+        key = "rowid" if kind == "drivers" else "seq"
+        cursor = after or 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {key}, data FROM {kind} WHERE {key} > ? ORDER BY {key} LIMIT ?",
+                    (cursor, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            cursor = rows[-1][0]
+            yield [json.loads(data) for _, data in rows], cursor
+
+    def count(self, kind):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {kind}").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class _SqliteTransaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT, bumping the version of the written kinds.
+    Nested in another one it joins it: the outermost commits or rolls back.
+    """
+
+    def __init__(self, storage, kinds):
+        self.storage = storage
+        self.kinds = kinds
+        self._outer = False
+
+    def __enter__(self):
+        self.storage._lock.acquire()
+        conn = self.storage._conn
+        self._outer = not conn.in_transaction
+        if self._outer:
+            conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self.storage._conn
+        try:
+            if exc_type is None:
+                conn.executemany(
+                    "INSERT INTO meta (kind, version) VALUES (?, 1) "
+                    "ON CONFLICT(kind) DO UPDATE SET version = version + 1",
+                    [(k,) for k in self.kinds],
+                )
+                if self._outer:
+                    conn.execute("COMMIT")
+            elif self._outer:
+                conn.execute("ROLLBACK")
+        finally:
+            self.storage._lock.release()
+        return False
+
+
+# ---------------------------------
+# FIRESTORE
+# ---------------------------------
+class FirestoreStorage(Storage):
+    """
+    `drivers` documents keyed by username and `trips` documents keyed by
+    trip id. Bulk operations, book_trip and update_trips_and_drivers go
+    through WriteBatches; trips are read through a trip_mirror.TripMirror
+    when one is given.
+    Every trip write sets TRIP_UPDATED_AT to the server timestamp.
+
+    Every write also increments the _meta/{kind} counter in the same batch
+    (firestore_writes.commit_counted); that counter is the version, so it
+    only moves when the collection does.
+    """
+
+    name = "firestore"
+
+    def __init__(self, client, mirror=None):
+        super().__init__()
+        self.client = client
+        self.mirror = mirror
+        self._versions = {}  # kind -> (counter, time.monotonic() it was read)
+        self._spans = {}     # kind -> (before, after) of the write in progress
+
+    def _commit(self, writes):
+        """Commit (collection, doc_id, data, merge) writes and record their version spans."""
+        counters = commit_counted(self.client, writes)
+        now = time.monotonic()
+        for kind, values in counters.items():
+            if not values:
+                continue
+            # Counters not consecutive: another writer got in between batches
+            consecutive = values[-1] - values[0] == len(values) - 1
+            self._spans[kind] = (values[0] - 1 if consecutive else None, values[-1])
+            self._versions[kind] = (values[-1], now)
+
+    def _write(self, op, rows, kinds, fn, *args):
+        # The span comes from the counters the write's batches returned:
+        # version() before the write may not include other writers' changes yet
+        with self._write_lock(kinds):
+            self._spans = {}
+            self._timed(op, rows, fn, *args)
+            return {k: self._spans.get(k) or (self.version(k),) * 2 for k in kinds}
+
+    def _load_drivers(self):
+        drivers = []
+        for doc in self.client.collection("drivers").stream():
+            data = doc.to_dict()
+            data["id"] = doc.id
+            drivers.append(data)
+        return drivers
+
+    def _save_drivers(self, drivers):
+        self._commit([("drivers", d["username"], d, False) for d in drivers])
+
+    def _update_drivers(self, changes):
+        self._commit([("drivers", u, {"username": u, **updates}, True) for u, updates in changes.items()])
+
+    def _write_drivers(self, drivers):
+        # Replaces the collection (migrations): drivers missing from `drivers` are deleted
+        keep = {d["username"] for d in drivers}
+        stale = [doc.id for doc in self.client.collection("drivers").select([]).stream() if doc.id not in keep]
+        self._commit(
+            [("drivers", doc_id, None, False) for doc_id in stale]
+            + [("drivers", d["username"], d, False) for d in drivers],
+        )
+
+    def _load_trips(self):
+        if self.mirror is not None:
+            self.mirror.sync(self.client)
+            return self.mirror.trips()
+        docs = self.client.collection("trips").order_by(
+            "created_at", direction=firestore.Query.DESCENDING
+        ).stream()
+        trips = []
+        for doc in docs:
+            data = doc.to_dict()
+            data.pop(TRIP_UPDATED_AT, None)
+            data["id"] = doc.id
+            trips.append(data)
+        return trips
+
+    def _save_trips(self, trips):
+        # The trip id is the document id, not a field of the document
+        rows = [(t["id"], _without_id(t)) for t in trips]
+        self._commit([("trips", doc_id, _stamped(data), False) for doc_id, data in rows])
+        if self.mirror is not None:
+            self.mirror.upsert(rows)
+
+    def _update_trips(self, changes):
+        # Merge writes in WriteBatches of at most 500; an id deleted meanwhile
+        # would come back as a partial document, so only pass ids just read
+        self._commit([("trips", doc_id, _stamped(updates), True) for doc_id, updates in changes.items()])
+        if self.mirror is not None:
+            self.mirror.update(changes)
+
+    def _delete_trips(self, ids):
+        self._commit([("trips", doc_id, None, False) for doc_id in ids])
+        if self.mirror is not None:
+            self.mirror.delete(ids)
+
+    def _write_trips(self, trips):
+        # Replaces the collection (migrations): trips missing from `trips` are deleted
+        rows = [(t.get("id"), _without_id(t)) for t in trips]
+        keep = {doc_id for doc_id, _ in rows if doc_id}
+        stale = [doc.id for doc in self.client.collection("trips").select([]).stream() if doc.id not in keep]
+        self._commit(
+            [("trips", doc_id, None, False) for doc_id in stale]
+            + [("trips", doc_id, _stamped(data), False) for doc_id, data in rows],
+        )
+        if self.mirror is not None:
+            self.mirror.resync(self.client)
+
+    def _book_trip(self, trip, driver_username, driver_updates):
+        # One batch: the trip, the driver's status and both counters
+        writes = [("trips", trip["id"], _stamped(_without_id(trip)), False)]
+        if driver_username is not None:
+            writes.append(("drivers", driver_username, {"username": driver_username, **driver_updates}, True))
+        self._commit(writes)
+        if self.mirror is not None:
+            self.mirror.upsert([(trip["id"], _without_id(trip))])
+
+    def _update_trips_and_drivers(self, trip_changes, driver_changes):
+        # One batch while the writes fit in it; past that, drivers are committed first
+        self._commit(
+            [("drivers", u, {"username": u, **updates}, True) for u, updates in driver_changes.items()]
+            + [("trips", doc_id, _stamped(updates), True) for doc_id, updates in trip_changes.items()]
+        )
+        if self.mirror is not None:
+            self.mirror.update(trip_changes)
+
+    def version(self, kind):
+        # The _meta/{kind} counter: local writes show up at once, other
+        # writers' within FIRESTORE_POLL_SECONDS (one point read per poll)
+        cached = self._versions.get(kind)
+        now = time.monotonic()
+        if cached is None or now - cached[1] > FIRESTORE_POLL_SECONDS:
+            doc = self.client.collection(META_COLLECTION).document(kind).get()
+            counter = (doc.to_dict() or {}).get("version", 0) if doc.exists else 0
+            if cached is not None:
+                counter = max(counter, cached[0])  # a local write may have landed during the read
+            cached = self._versions[kind] = (counter, now)
+        return cached[0]
+
+    def iter_batches(self, kind, batch_size=500, after=None):
+        # Pages in document id order; the cursor is the last document id
+        collection = self.client.collection(kind)
+        query = collection.order_by("__name__")
+        last = collection.document(after).get() if after else None
+        while True:
+            page = query.limit(batch_size)
+            if last is not None:
+                page = page.start_after(last)
+            docs = list(page.stream())
+            if not docs:
+                return
+            batch = []
+            for doc in docs:
+                data = doc.to_dict()
+                data.pop(TRIP_UPDATED_AT, None)
+                data["id"] = doc.id
+                batch.append(data)
+            last = docs[-1]
+            yield batch, last.id
+
+    def count(self, kind):
+        return self.client.collection(kind).count().get()[0][0].value
+
+
+def _without_id(trip):
+    return {k: v for k, v in trip.items() if k != "id"}
+
+
+def _stamped(data):
+    return {**data, TRIP_UPDATED_AT: firestore.SERVER_TIMESTAMP}
+
+
+# ---------------------------------
+# MEMORY
+# ---------------------------------
+class MemoryStorage(Storage):
+    """Lists held in memory (e.g. Streamlit session state), changed in place."""
+
+    name = "memory"
+
+    def __init__(self, drivers=None, trips=None):
+        super().__init__()
+        self.drivers = drivers if drivers is not None else []
+        self.trips = trips if trips is not None else []
+        self._versions = {"drivers": 0, "trips": 0}
+
+    def _load_drivers(self):
+        return self.drivers
+
+    def _save_drivers(self, drivers):
+        with self._lock:
+            for d in drivers:
+                _upsert_driver(self.drivers, d)
+            self._versions["drivers"] += 1
+
+    def _update_drivers(self, changes):
+        with self._lock:
+            _merge_drivers(self.drivers, changes)
+            self._versions["drivers"] += 1
+
+    def _write_drivers(self, drivers):
+        with self._lock:
+            self.drivers[:] = drivers
+            self._versions["drivers"] += 1
+
+    def _load_trips(self):
+        return self.trips
+
+    def _save_trips(self, trips):
+        with self._lock:
+            self.trips.extend(trips)
+            self._versions["trips"] += 1
+
+    def _update_trips(self, changes):
+        with self._lock:
+            _merge_trips(self.trips, changes)
+            self._versions["trips"] += 1
+
+    def _delete_trips(self, ids):
+        with self._lock:
+            self.trips[:] = [t for t in self.trips if t.get("id") not in ids]
+            self._versions["trips"] += 1
+
+    def _write_trips(self, trips):
+        with self._lock:
+            self.trips[:] = trips
+            self._versions["trips"] += 1
+
+    def version(self, kind):
+        return self._versions[kind]
+
+
+# ---------------------------------
+# FACTORY
+# ---------------------------------
+STORAGE_BACKENDS = ("json", "jsonl", "sqlite", "firestore", "memory")
+
+
+def make_storage(kind, data_dir):
+    """
+    Backend by name (see STORAGE_BACKENDS). json / sqlite keep their files
+    in data_dir; firestore uses the default Google credentials and
+    GOOGLE_CLOUD_PROJECT.
+    """
+    if kind == "json":
+        return JsonStorage(os.path.join(data_dir, "drivers.json"), os.path.join(data_dir, "trips.json"))
+    if kind == "jsonl":
+        return JsonlStorage(data_dir)
+    if kind == "sqlite":
+        return SqliteStorage(os.path.join(data_dir, "mali_ride.sqlite3"))
+    if kind == "firestore":
+        if not HAVE_FIRESTORE:
+            raise RuntimeError("google-cloud-firestore is not installed")
+        return FirestoreStorage(firestore.Client())
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"unknown storage backend {kind!r} (expected one of {', '.join(STORAGE_BACKENDS)})")
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from shared import get_storage
+
+    source = get_storage()
+    drivers, trips = source.load_drivers(), source.load_trips()
+    print(f"{len(drivers)} drivers, {len(trips)} trips from the {source.name} backend\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("json", "jsonl", "sqlite", "memory"):
+            backend = make_storage(kind, tmp)
+            backend.write_drivers(drivers)
+            backend.write_trips(trips)
+            for _ in range(5):
+                backend.load_trips()
+                if drivers:
+                    backend.update_driver(drivers[0]["username"], {"status": drivers[0].get("status")})
+                backend.book_trip(dict(trips[-1]) if trips else {}, drivers[0]["username"] if drivers else None, {})
+            backend.write_trips(trips)  # leave the copy as it was
+            for op, c in sorted(backend.stats.items()):
+                print(f"{kind:7} {op:16} {c['calls']:4} calls {c['rows']:8} rows {c['seconds'] / c['calls'] * 1000:9.2f} ms/call")
+            print()
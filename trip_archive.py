@@ -0,0 +1,664 @@
+"""
+Columnar trip archive partitioned by date and city.
+
+Trips from the trip store are copied into one file per (created_at date,
+city) partition:
+
+    data/trip_archive/date=2026-10-01/city=Bamako/part.parquet
+
+Parquet (pyarrow) is used when available, otherwise a NumPy .npz file with
+one array per column. Reads push the date / city filters down to the
+directory names, so only matching partitions are opened, and only the
+requested columns are read from them. Each partition also stores the
+trip `id` column.
+
+The archive follows the trip store through the change bus (change_bus.py):
+new, updated and deleted trips are queued as they are published, and the
+next sync() rewrites only the partitions they touch, provided the events
+chain from the version the archive was synced from to the store's current
+version and each touched partition still has the rows its manifest entry
+says. Otherwise (a missed event, a write that bypassed the bus, a new
+process) it falls back to a full sync from the store, which still skips
+partitions whose checksum did not change.
+
+Trips moved out of the store by retention.py are added once as immutable
+`cold-<segment>` files next to `part.*` in the same partitions, so reads
+over old ranges include them without knowing about the cold segments.
+
+    python trip_archive.py            # sync the archive and print a summary
+"""
+import json
+import os
+import threading
+import zlib
+from collections import defaultdict
+from datetime import date, datetime
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+from change_bus import TRIP_SAVED, TRIPS_DELETED, TRIPS_UPDATED
+from shared import DATA_DIR, get_change_bus, load_trips_from_db, trips_version
+from storage import FileLock
+from trip_schema import TRIP_SCHEMA, apply_trip_schema, to_trip_frame
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAVE_PYARROW = True
+except ImportError:  # pragma: no cover - depends on the environment
+    HAVE_PYARROW = False
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "trip_archive")
+ARCHIVE_FORMAT = "parquet" if HAVE_PYARROW else "npz"
+
+NULL_PARTITION = "_none"  # trips without a created_at date or a city
+MAX_QUEUED_EVENTS = 10_000  # past this, drop the queue and do one full sync
+
+
+# ---------------------------------
+# PARTITION KEYS
+# ---------------------------------
+def _partition_key(trip):
+    created = str(trip.get("created_at") or "")[:10]
+    try:
+        day = date.fromisoformat(created).isoformat()
+    except ValueError:
+        day = NULL_PARTITION
+    return day, trip.get("city") or NULL_PARTITION
+
+
+def _partition_dir(root, day, city):
+    return os.path.join(root, f"date={day}", f"city={quote(city, safe='')}")
+
+
+def _checksum(rows):
+    """Stable checksum of a partition's trips (to skip unchanged partitions)."""
+    return zlib.crc32(json.dumps(rows, sort_keys=True, default=str).encode("utf-8"))
+
+
+def _record(row):
+    """A row read back from a partition as a trip dict (missing values dropped)."""
+    trip = {}
+    for k, v in row.items():
+        if v is None or v is pd.NaT or (isinstance(v, float) and v != v):
+            continue
+        trip[k] = v.isoformat() if isinstance(v, pd.Timestamp) else v
+    return trip
+
+
+def _chain(events, start, end):
+    """
+    The events leading from version `start` to `end` (a run of events each
+    starting at the previous one's `after`) and the index after the last,
+    or (None, 0) if there is no such run.
+    """
+    for i, event in enumerate(events):
+        if event.before != start:
+            continue
+        run, version = [], start
+        for j in range(i, len(events)):
+            if events[j].before != version:
+                break
+            run.append(events[j])
+            version = events[j].after
+            if version == end:
+                return run, j + 1
+        return None, 0
+    return None, 0
+
+
+def _load_trips():
+    """(version, trips) from the store; the version is None if trips were written during the load."""
+    version = trips_version()
+    trips = load_trips_from_db()
+    if trips_version() != version:
+        version = None  # the next sync is a full one again
+    return version, trips
+
+
+class _Mismatch(Exception):
+    """A partition on disk does not match its manifest entry."""
+
+
+def _as_date(value):
+    if value is None or (isinstance(value, date) and not isinstance(value, datetime)):
+        return value
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date()  # datetime / pd.Timestamp
+
+
+# ---------------------------------
+# FILE FORMATS
+# ---------------------------------
+def _column_arrays(df):
+    """
+    Column name -> Series that both formats can store: the typed trip schema
+    columns as they are, other columns as numbers or strings with None.
+    """
+    arrays = {}
+    for col in df.columns:
+        s = df[col]
+        if col not in TRIP_SCHEMA and not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)):
+            values = s.astype(object)
+            numeric = pd.to_numeric(values, errors="coerce")
+            if numeric.notna().sum() == values.notna().sum() and not values.map(lambda v: isinstance(v, str)).any():
+                s = numeric
+            else:
+                s = values.map(lambda v: None if v is None or v != v else str(v))
+        arrays[col] = s
+    return arrays
+
+
+def _partition_files(path):
+    """Data files of a partition: cold segments first (oldest trips), then the store's part."""
+    ext = "." + ARCHIVE_FORMAT
+    try:
+        names = sorted(n for n in os.listdir(path) if n.endswith(ext))
+    except OSError:
+        return []
+    return [os.path.join(path, n) for n in names if n.startswith("cold-")] + \
+        [os.path.join(path, n) for n in names if n == "part" + ext]
+
+
+def _write_partition(path, rows, name="part"):
+    os.makedirs(path, exist_ok=True)
+    arrays = _column_arrays(to_trip_frame(rows))
+    if ARCHIVE_FORMAT == "parquet":
+        table = pa.Table.from_pandas(pd.DataFrame(arrays), preserve_index=False)
+        target = os.path.join(path, name + ".parquet")
+        pq.write_table(table, target + ".tmp", compression="zstd")
+    else:
+        # Strings, categoricals and timestamps are stored as fixed-width
+        # unicode plus a null mask; reads cast them back with the schema
+        payload = {}
+        for col, s in arrays.items():
+            if not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s)):
+                if isinstance(s.dtype, pd.DatetimeTZDtype):
+                    s = s.map(lambda v: v.isoformat(), na_action="ignore")
+                values = s.astype(object)
+                payload[col] = values.where(values.notna(), "").to_numpy(dtype=str)
+                payload[col + "__null"] = values.isna().to_numpy()
+            else:
+                payload[col] = s.to_numpy()
+        target = os.path.join(path, name + ".npz")
+        with open(target + ".tmp", "wb") as f:
+            np.savez_compressed(f, **payload)
+    os.replace(target + ".tmp", target)
+
+
+def _read_partition(path, columns=None, where=None):
+    """
+    Columns of one partition (None = all), keeping only the rows whose
+    value in each `where` column is one of the allowed values.
+    """
+    frames = [_read_file(f, columns, where) for f in _partition_files(path)]
+    if len(frames) == 1:
+        return frames[0]
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read_file(file_path, columns=None, where=None):
+    where = where or {}
+    if ARCHIVE_FORMAT == "parquet":
+        available = pq.read_schema(file_path).names
+        wanted = [c for c in columns if c in available] if columns else None
+        if any(col not in available for col in where):
+            return pd.DataFrame(columns=wanted or [])
+        filters = [(col, "in", list(values)) for col, values in where.items()] or None
+        table = pq.read_table(file_path, columns=wanted, filters=filters)
+        if not table.num_columns:  # keep the row count when no column is read
+            return pd.DataFrame(index=range(table.num_rows))
+        return table.to_pandas()
+
+    with np.load(file_path) as npz:  # members are read lazily
+        available = [k for k in npz.files if not k.endswith("__null")]
+        wanted = [c for c in columns if c in available] if columns else available
+
+        def column(col):
+            values = npz[col]
+            if col + "__null" in npz.files:
+                values = values.astype(object)
+                values[npz[col + "__null"]] = None
+            return values
+
+        if any(col not in available for col in where):
+            return pd.DataFrame(columns=wanted)
+        n_rows = len(npz[available[0]]) if available else 0
+        df = pd.DataFrame({col: column(col) for col in wanted}, columns=wanted, index=range(n_rows))
+        for col, values in where.items():
+            df = df[pd.Series(column(col)).isin(list(values)).to_numpy()[df.index]]
+        return df.reset_index(drop=True)
+
+
+def _where(providers=None, where=None):
+    where = dict(where or {})
+    if providers is not None:
+        where["routing_provider"] = providers
+    return where
+
+
+# ---------------------------------
+# ARCHIVE
+# ---------------------------------
+class TripArchive:
+    """Date / city partitioned copy of the trip store."""
+
+    def __init__(self, root=ARCHIVE_DIR, bus=None):
+        self.root = root
+        self.manifest_path = os.path.join(root, "_manifest.json")
+        self.last_read_partitions = 0
+        self.last_sync = None        # "current" / "delta" / "full"
+        self._lock = threading.RLock()
+        self._queue_lock = threading.Lock()  # publishers only ever wait for this one
+        self._bus = bus
+        self._events = []            # trip change events not applied yet
+        self._overflow = False
+        if bus is not None:
+            bus.subscribe(self._on_change, (TRIP_SAVED, TRIPS_UPDATED, TRIPS_DELETED))
+
+    def _on_change(self, event):
+        with self._queue_lock:
+            if len(self._events) >= MAX_QUEUED_EVENTS:
+                self._events, self._overflow = [], True
+            if not self._overflow:
+                self._events.append(event)
+
+    def _file_lock(self):
+        # One syncing process at a time (the manifest and part files go together)
+        os.makedirs(self.root, exist_ok=True)
+        return FileLock(os.path.join(self.root, "_sync.lock"), self._lock)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get("format") == ARCHIVE_FORMAT else None
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def source_version(self):
+        """Trip store version the archive was last synced from (None if unknown)."""
+        manifest = self._read_manifest()
+        return None if manifest is None else manifest.get("source_version")
+
+    def sync(self, trips=None, source_version=None):
+        """
+        Bring the archive in line with `trips` (default: the trip store,
+        from the queued change events where possible, see the module doc).
+
+        Returns the number of partitions written; partitions whose trips did
+        not change are left alone, and partitions with no trips are removed.
+        """
+        if trips is not None:
+            with self._file_lock():
+                self.last_sync = "full"
+                return self._sync_all(trips, source_version)
+
+        if self._bus is not None:
+            self._bus.poll()  # outside the lock: dispatching takes it
+        with self._file_lock():
+            source_version = trips_version()
+            manifest = self._read_manifest()
+            with self._queue_lock:
+                events, self._events, overflow, self._overflow = self._events, [], self._overflow, False
+            if manifest is not None and source_version is not None:
+                synced = manifest.get("source_version")
+                if synced == source_version:
+                    self.last_sync = "current"
+                    return 0
+                chain, used = (None, 0) if overflow else _chain(events, synced, source_version)
+                if chain is not None:
+                    with self._queue_lock:
+                        self._events[:0] = events[used:]  # published after the version read: next sync
+                    try:
+                        written = self._apply_events(manifest, chain)
+                    except _Mismatch:
+                        pass
+                    else:
+                        manifest["source_version"] = source_version
+                        self._write_manifest(manifest)
+                        self.last_sync = "delta"
+                        return written
+            self.last_sync = "full"
+            source_version, trips = _load_trips()
+            return self._sync_all(trips, source_version)
+
+    def _part_path(self, day, city):
+        return os.path.join(_partition_dir(self.root, day, city), f"part.{ARCHIVE_FORMAT}")
+
+    def _apply_events(self, manifest, events):
+        """
+        Apply TRIP_SAVED / TRIPS_UPDATED / TRIPS_DELETED events to the store
+        partitions they touch (saves are upserts by id, so applying an event
+        twice is harmless) and update their manifest entries. Returns the
+        partitions written; raises _Mismatch if a partition read does not
+        have the rows its manifest entry says.
+        """
+        parts = manifest["partitions"]
+        loaded = {}     # partition name -> trips
+        located = None  # trip id -> partition name, built on the first update / delete
+
+        def rows_of(name, day, city):
+            if name not in loaded:
+                entry = parts.get(name)
+                path = self._part_path(day, city)
+                if not os.path.exists(path):
+                    if entry is not None and entry["rows"]:
+                        raise _Mismatch(name)
+                    loaded[name] = []
+                else:
+                    df = _read_file(path)
+                    if entry is None or len(df) != entry["rows"]:
+                        raise _Mismatch(name)
+                    loaded[name] = [_record(r) for r in df.to_dict("records")]
+            return loaded[name]
+
+        def locate():
+            index = {}
+            for name, part in parts.items():
+                if name in loaded:
+                    ids = [t.get("id") for t in loaded[name]]
+                else:
+                    path = self._part_path(part["date"], part["city"])
+                    if not os.path.exists(path):
+                        raise _Mismatch(name)
+                    df = _read_file(path, ["id"])
+                    ids = df["id"].tolist() if "id" in df.columns else []
+                index.update(dict.fromkeys(ids, name))
+            for name, rows in loaded.items():
+                index.update(dict.fromkeys((t.get("id") for t in rows), name))
+            return index
+
+        def remove(trip_id):
+            name = located.pop(trip_id, None) if located is not None else None
+            if name is None:
+                return None
+            part = parts.get(name)
+            day, city = (part["date"], part["city"]) if part else name.split("/", 1)
+            rows = rows_of(name, day, city)
+            for i, t in enumerate(rows):
+                if t.get("id") == trip_id:
+                    return rows.pop(i)
+            return None
+
+        def upsert(trip):
+            day, city = _partition_key(trip)
+            name = f"{day}/{city}"
+            if located is not None and located.get(trip.get("id"), name) != name:
+                remove(trip["id"])  # moved to another partition
+            rows = rows_of(name, day, city)
+            for i, t in enumerate(rows):
+                if trip.get("id") is not None and t.get("id") == trip.get("id"):
+                    rows[i] = trip
+                    break
+            else:
+                rows.append(trip)
+            if located is not None:
+                located[trip.get("id")] = name
+
+        for event in events:
+            if event.kind == TRIP_SAVED:
+                upsert(dict(event.data))
+                continue
+            if located is None:
+                located = locate()
+            if event.kind == TRIPS_UPDATED:
+                for trip_id, fields in event.data.items():
+                    trip = remove(trip_id)
+                    if trip is not None:
+                        upsert({**trip, **fields})
+            else:
+                for trip_id in event.data:
+                    remove(trip_id)
+
+        for name, rows in loaded.items():
+            day, city = name.split("/", 1)
+            if rows:
+                _write_partition(_partition_dir(self.root, day, city), rows)
+                # No checksum: the next full sync rewrites the partition once
+                parts[name] = {"date": day, "city": city, "rows": len(rows), "checksum": None}
+            elif name in parts:
+                del parts[name]
+                self._remove_file(day, city, "part")
+        return len(loaded)
+
+    def _sync_all(self, trips, source_version):
+        manifest = self._read_manifest() or {"format": ARCHIVE_FORMAT, "partitions": {}}
+        old_parts = manifest["partitions"]
+
+        groups = defaultdict(list)
+        for t in trips:
+            groups[_partition_key(t)].append(t)
+
+        new_parts = {}
+        written = 0
+        for (day, city), rows in groups.items():
+            name = f"{day}/{city}"
+            checksum = _checksum(rows)
+            new_parts[name] = {"date": day, "city": city, "rows": len(rows), "checksum": checksum}
+            old = old_parts.get(name)
+            if old is None or old.get("checksum") != checksum:
+                _write_partition(_partition_dir(self.root, day, city), rows)
+                written += 1
+
+        for name, part in old_parts.items():
+            if name not in new_parts:
+                self._remove_file(part["date"], part["city"], "part")
+
+        self._write_manifest({
+            "format": ARCHIVE_FORMAT,
+            "source_version": source_version,
+            "partitions": new_parts,
+            "cold": manifest.get("cold", {}),
+        })
+        return written
+
+    def _remove_file(self, day, city, name):
+        """Delete one data file, then the partition / day directories if left empty."""
+        path = _partition_dir(self.root, day, city)
+        try:
+            os.remove(os.path.join(path, f"{name}.{ARCHIVE_FORMAT}"))
+        except OSError:
+            pass
+        for directory in (path, os.path.dirname(path)):
+            if os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+
+    def add_cold(self, segment, trips):
+        """
+        Add the trips of a cold segment (retention.py) as `cold-<segment>`
+        files; they are never rewritten by sync(). Returns the files written.
+        """
+        manifest = self._read_manifest() or {"format": ARCHIVE_FORMAT, "partitions": {}}
+        cold = manifest.setdefault("cold", {})
+        groups = defaultdict(list)
+        for t in trips:
+            groups[_partition_key(t)].append(t)
+        for (day, city), rows in groups.items():
+            _write_partition(_partition_dir(self.root, day, city), rows, name=f"cold-{segment}")
+            part = cold.setdefault(f"{day}/{city}", {"date": day, "city": city, "rows": 0, "segments": []})
+            if segment not in part["segments"]:
+                part["segments"].append(segment)
+                part["rows"] += len(rows)
+        self._write_manifest(manifest)
+        return len(groups)
+
+    def cold_segments(self):
+        """Names of the cold segments already added."""
+        manifest = self._read_manifest() or {}
+        return {seg for part in manifest.get("cold", {}).values() for seg in part["segments"]}
+
+    def drop_cold(self):
+        """Remove every cold file (before re-adding them from the segments)."""
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+        for part in manifest.pop("cold", {}).values():
+            for segment in part["segments"]:
+                self._remove_file(part["date"], part["city"], f"cold-{segment}")
+        self._write_manifest(manifest)
+
+    def partitions(self, cities=None, start=None, end=None):
+        """(date, city) pairs on disk matching the filters, from directory names only."""
+        if not os.path.isdir(self.root):
+            return []
+        start, end = _as_date(start), _as_date(end)
+        cities = set(cities) if cities is not None else None
+        found = []
+        for day_name in sorted(os.listdir(self.root)):
+            if not day_name.startswith("date="):
+                continue
+            day = day_name[len("date="):]
+            if start is not None or end is not None:
+                if day == NULL_PARTITION:
+                    continue
+                d = date.fromisoformat(day)
+                if (start is not None and d < start) or (end is not None and d > end):
+                    continue
+            for city_name in sorted(os.listdir(os.path.join(self.root, day_name))):
+                city = unquote(city_name[len("city="):])
+                if cities is None or city in cities:
+                    found.append((day, city))
+        return found
+
+    def read(self, cities=None, start=None, end=None, providers=None, columns=None, where=None):
+        """
+        Trips as a DataFrame, reading only the matching partitions.
+
+        cities / providers: iterables of names (None = all); start / end:
+        created_at dates, both inclusive; columns: subset to read (None = all);
+        where: {column: allowed values}, pushed down into the partition reads.
+        """
+        frames = list(self.iter_read(cities, start, end, providers, columns, where))
+        if not frames:
+            return pd.DataFrame(columns=columns or [])
+        # Categories differ per partition, so concat yields plain strings
+        return apply_trip_schema(pd.concat(frames, ignore_index=True))
+
+    def iter_read(self, cities=None, start=None, end=None, providers=None, columns=None, where=None):
+        """Same selection as read(), one typed DataFrame per non-empty partition."""
+        parts = self.partitions(cities, start, end)
+        self.last_read_partitions = len(parts)
+        where = _where(providers, where)
+        for day, city in parts:
+            df = _read_partition(_partition_dir(self.root, day, city), columns, where)
+            if not df.empty:
+                yield apply_trip_schema(df)
+
+    def read_page(self, offset, limit, sort_by="created_at", ascending=False,
+                  cities=None, start=None, end=None, providers=None, where=None):
+        """
+        One page of the selected trips, sorted by `sort_by`, and the total
+        number of matching trips.
+
+        Sorting by created_at without row filters is answered from the
+        manifest row counts: partitions are visited in date order and only
+        the days that overlap the page are read. Otherwise only the sort
+        column is read from every partition, and full rows only from the
+        partitions that hold the page.
+        """
+        parts = self.partitions(cities, start, end)
+        where = _where(providers, where)
+        manifest = self._read_manifest() or {"partitions": {}}
+        rows = defaultdict(int)
+        for p in [*manifest["partitions"].values(), *manifest.get("cold", {}).values()]:
+            rows[(p["date"], p["city"])] += p["rows"]
+
+        if sort_by == "created_at" and not where and all(p in rows for p in parts):
+            total = sum(rows[p] for p in parts)
+            days = sorted({day for day, _ in parts if day != NULL_PARTITION}, reverse=not ascending)
+            if any(day == NULL_PARTITION for day, _ in parts):
+                days.append(NULL_PARTITION)  # missing dates sort last either way
+            frames, skipped, seen = [], 0, 0
+            for day in days:
+                day_parts = [p for p in parts if p[0] == day]
+                n = sum(rows[p] for p in day_parts)
+                if seen + n <= offset:
+                    seen += n
+                    skipped = seen
+                    continue
+                for d, city in day_parts:
+                    frames.append(_read_partition(_partition_dir(self.root, d, city)))
+                seen += n
+                if seen >= offset + limit:
+                    break
+            self.last_read_partitions = len(frames)
+            if not frames:
+                return pd.DataFrame(), total
+            df = apply_trip_schema(pd.concat(frames, ignore_index=True))
+            df = df.sort_values("created_at", ascending=ascending, kind="stable", na_position="last")
+            start_row = offset - skipped
+            return df.iloc[start_row:start_row + limit].reset_index(drop=True), total
+
+        # Sort keys only: (partition, row in partition, key) for every match
+        keys = []
+        for i, (day, city) in enumerate(parts):
+            k = _read_partition(_partition_dir(self.root, day, city), [sort_by], where)
+            if not len(k):
+                continue
+            if sort_by not in k.columns:
+                k = pd.DataFrame({sort_by: [None] * len(k)})
+            keys.append(pd.DataFrame({
+                "_part": i,
+                "_row": np.arange(len(k)),
+                "_key": k[sort_by].astype(object).to_numpy(),
+            }))
+        if not keys:
+            self.last_read_partitions = 0
+            return pd.DataFrame(), 0
+        keys = pd.concat(keys, ignore_index=True)
+        total = len(keys)
+        key = apply_trip_schema(pd.DataFrame({sort_by: keys["_key"]}))[sort_by]
+        if isinstance(key.dtype, pd.CategoricalDtype):
+            key = key.astype(object)
+        order = key.sort_values(ascending=ascending, kind="stable", na_position="last").index
+        page = keys.loc[order[offset:offset + limit], ["_part", "_row"]]
+        if page.empty:
+            self.last_read_partitions = 0
+            return pd.DataFrame(), total
+
+        frames = []
+        for i, part_rows in page.groupby("_part", sort=False):
+            day, city = parts[i]
+            df = _read_partition(_partition_dir(self.root, day, city), None, where)
+            frames.append(df.iloc[part_rows["_row"].to_numpy()].set_index(part_rows.index))
+        self.last_read_partitions = len(frames)
+        df = pd.concat(frames).loc[page.index].reset_index(drop=True)
+        return apply_trip_schema(df), total
+
+
+_DEFAULT_ARCHIVE = None
+
+
+def get_trip_archive():
+    """Process-wide archive of the default trip store, following its change events."""
+    global _DEFAULT_ARCHIVE
+    if _DEFAULT_ARCHIVE is None:
+        _DEFAULT_ARCHIVE = TripArchive(bus=get_change_bus())
+    return _DEFAULT_ARCHIVE
+
+
+def load_archived_trips(cities=None, start=None, end=None, providers=None, columns=None):
+    """Sync the archive with the trip store, then read the matching trips."""
+    archive = get_trip_archive()
+    archive.sync()
+    return archive.read(cities=cities, start=start, end=end, providers=providers, columns=columns)
+
+
+if __name__ == "__main__":
+    archive = get_trip_archive()
+    written = archive.sync()
+    parts = archive.partitions()
+    print(f"{ARCHIVE_FORMAT} archive at {archive.root}: {len(parts)} partitions ({written} written, {archive.last_sync} sync)")
@@ -0,0 +1,206 @@
+"""
+Local SQLite mirror of the Firestore `trips` collection (app.py).
+
+load_trips_from_db() used to stream the whole collection, ordered by
+created_at, on every session start. The mirror keeps every trip seen so
+far on disk, and its high-water mark is the largest `updated_at` it
+holds: the server timestamp storage.FirestoreStorage sets on every trip
+write. A sync only asks Firestore for trips written at or after that mark.
+
+created_at is set by the client before the write, so a trip committed
+late can carry an earlier created_at than trips already mirrored; the
+server timestamp is the commit time, and a query sees every write
+committed before it runs, so later writes always get a later stamp.
+`>=` keeps a trip sharing the last stamp; documents are keyed by id, so
+re-fetched ones are simply overwritten. Edited trips are re-fetched the
+same way. Documents written without the stamp (older data, or writers
+outside storage.py) are only fetched by the first sync or by resync().
+An optional snapshot listener keeps the mirror current between syncs.
+
+Trips deleted in Firestore after they were mirrored are only picked up by
+the listener or by resync().
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timezone
+
+from shared import DATA_DIR
+from storage import TRIP_UPDATED_AT
+
+try:
+    from google.cloud.firestore_v1.base_query import FieldFilter
+except ImportError:  # pragma: no cover - depends on the environment
+    FieldFilter = None
+
+MIRROR_DIR = DATA_DIR
+STAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"  # fixed width, so text order is time order
+
+
+def mirror_path(project):
+    """Mirror file for a Firestore project (one mirror per project)."""
+    return os.path.join(MIRROR_DIR, f"trip_mirror_{project or 'default'}.sqlite3")
+
+
+class TripMirror:
+    """Trips from one Firestore collection, mirrored into SQLite."""
+
+    def __init__(self, path, collection="trips"):
+        self.path = path
+        self.collection = collection
+        self._lock = threading.Lock()
+        self._watch = None
+        self._watch_client = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS trips "
+                "(id TEXT PRIMARY KEY, created_at TEXT, updated_at TEXT, data TEXT NOT NULL)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(trips)")}
+            if "updated_at" not in columns:  # mirrors written before the updated_at cursor
+                db.execute("ALTER TABLE trips ADD COLUMN updated_at TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS trips_created_at ON trips (created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS trips_updated_at ON trips (updated_at)")
+
+    def _db(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        return _Transaction(conn)
+
+    # ---------------------------------
+    # LOCAL READS / WRITES
+    # ---------------------------------
+    def cursor(self):
+        """High-water mark: the largest server write time mirrored (None if none)."""
+        with self._db() as db:
+            return db.execute("SELECT MAX(updated_at) FROM trips").fetchone()[0]
+
+    def count(self):
+        with self._db() as db:
+            return db.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+
+    def upsert(self, docs):
+        """
+        Store (doc id, trip dict) pairs, replacing mirrored copies. The
+        TRIP_UPDATED_AT stamp goes to its own column; local copies of trips
+        just written have none and are fetched again by the next sync.
+        """
+        rows = []
+        for doc_id, data in docs:
+            data = dict(data)
+            stamp = data.pop(TRIP_UPDATED_AT, None)
+            rows.append((
+                doc_id,
+                None if data.get("created_at") is None else str(data["created_at"]),
+                _stamp_text(stamp),
+                json.dumps(data, ensure_ascii=False, default=str),
+            ))
+        if rows:
+            with self._lock, self._db() as db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO trips (id, created_at, updated_at, data) VALUES (?, ?, ?, ?)", rows
+                )
+        return len(rows)
+
+    def update(self, changes):
+        """Merge {doc id: fields} into the mirrored trips (ids not mirrored are skipped)."""
+        with self._lock, self._db() as db:
+            for doc_id, fields in changes.items():
+                row = db.execute("SELECT data FROM trips WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                data = {**json.loads(row[0]), **fields}
+                db.execute(
+                    "UPDATE trips SET created_at = ?, data = ? WHERE id = ?",
+                    (None if data.get("created_at") is None else str(data["created_at"]),
+                     json.dumps(data, ensure_ascii=False, default=str), doc_id),
+                )
+
+    def delete(self, doc_ids):
+        doc_ids = [(i,) for i in doc_ids]
+        if doc_ids:
+            with self._lock, self._db() as db:
+                db.executemany("DELETE FROM trips WHERE id = ?", doc_ids)
+
+    def trips(self):
+        """Mirrored trips (with their doc `id`), newest first like the Firestore query."""
+        with self._db() as db:
+            rows = db.execute("SELECT id, data FROM trips ORDER BY created_at DESC").fetchall()
+        trips = []
+        for doc_id, data in rows:
+            trip = json.loads(data)
+            trip["id"] = doc_id
+            trips.append(trip)
+        return trips
+
+    # ---------------------------------
+    # FIRESTORE
+    # ---------------------------------
+    def _query(self, client, cursor):
+        query = client.collection(self.collection)
+        if cursor is None:
+            return query  # whole collection, including documents without a stamp
+        stamp = datetime.strptime(cursor, STAMP_FORMAT).replace(tzinfo=timezone.utc)
+        return query.where(filter=FieldFilter(TRIP_UPDATED_AT, ">=", stamp)).order_by(TRIP_UPDATED_AT)
+
+    def sync(self, client):
+        """Fetch the trips written at or after the high-water mark; returns how many came back."""
+        docs = ((doc.id, doc.to_dict()) for doc in self._query(client, self.cursor()).stream())
+        return self.upsert(docs)
+
+    def resync(self, client):
+        """Drop the mirror and fetch the whole collection again."""
+        with self._lock, self._db() as db:
+            db.execute("DELETE FROM trips")
+        return self.sync(client)
+
+    def listen(self, client):
+        """Keep the mirror current with a snapshot listener (idempotent per client)."""
+        if self._watch is not None and self._watch_client is client:
+            return
+        self.stop()
+
+        def on_snapshot(snapshots, changes, read_time):
+            self.upsert((c.document.id, c.document.to_dict()) for c in changes if c.type.name != "REMOVED")
+            self.delete(c.document.id for c in changes if c.type.name == "REMOVED")
+
+        self._watch = self._query(client, self.cursor()).on_snapshot(on_snapshot)
+        self._watch_client = client
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+        self._watch = None
+        self._watch_client = None
+
+
+def _stamp_text(stamp):
+    """A Firestore timestamp as STAMP_FORMAT text (UTC, microseconds; None if not a datetime)."""
+    if not isinstance(stamp, datetime):
+        return None
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc)
+    return stamp.strftime(STAMP_FORMAT)
+
+
+class _Transaction:
+    """sqlite3 connection that commits (or rolls back) and closes on exit."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        with closing(self.conn):
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        return False
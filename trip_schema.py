@@ -0,0 +1,111 @@
+"""
+Typed DataFrame schema for trips.
+
+`pd.DataFrame(trips)` leaves strings and timestamps as Python objects.
+Every trip loader goes through to_trip_frame / apply_trip_schema instead:
+low-cardinality strings become categoricals, XOF amounts int32,
+coordinates and distances float32, and created_at a parsed UTC
+datetime64. Columns outside the schema are left as they are.
+
+    python trip_schema.py          # memory + groupby timing report on data/trips.json
+"""
+import time
+
+import pandas as pd
+
+# Low-cardinality strings (cities, drivers, routes, codes, statuses)
+CATEGORY_COLUMNS = (
+    "city",
+    "routing_provider",
+    "driver_username",
+    "route_summary",
+    "origin_label",
+    "destination_label",
+    "promo_code",
+    "referral_code",
+    "status",
+    "client_app",
+)
+
+# Whole XOF amounts; a missing amount (e.g. no fee) counts as 0
+XOF_COLUMNS = (
+    "price_xof",
+    "price_before_discount_xof",
+    "discount_xof",
+    "platform_commission_xof",
+    "driver_earnings_xof",
+    "cancellation_fee_xof",
+)
+
+FLOAT_COLUMNS = ("pickup_lat", "pickup_lon", "drop_lat", "drop_lon", "distance_miles")
+
+DATETIME_COLUMNS = ("created_at",)
+
+TRIP_SCHEMA = {
+    **{c: "category" for c in CATEGORY_COLUMNS},
+    **{c: "int32" for c in XOF_COLUMNS},
+    **{c: "float32" for c in FLOAT_COLUMNS},
+    **{c: "datetime64[ns, UTC]" for c in DATETIME_COLUMNS},
+}
+
+
+def apply_trip_schema(df):
+    """Cast the schema columns present in df (in place) and return it."""
+    for col in df.columns.intersection(list(TRIP_SCHEMA)):
+        dtype = TRIP_SCHEMA[col]
+        s = df[col]
+        if dtype == "category":
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                df[col] = s.astype("category")
+        elif str(s.dtype) == dtype:
+            continue
+        elif dtype == "int32":
+            df[col] = pd.to_numeric(s, errors="coerce").fillna(0).round().astype("int32")
+        elif dtype == "float32":
+            df[col] = pd.to_numeric(s, errors="coerce").astype("float32")
+        elif not isinstance(s.dtype, pd.DatetimeTZDtype):
+            df[col] = pd.to_datetime(s, errors="coerce", utc=True, format="ISO8601")
+    return df
+
+
+def to_trip_frame(trips):
+    """List of trip dicts -> typed DataFrame."""
+    return apply_trip_schema(pd.DataFrame(trips))
+
+
+def memory_report(trips):
+    """Per-column memory (bytes) of the untyped vs typed DataFrame of `trips`."""
+    raw = pd.DataFrame(trips)
+    typed = apply_trip_schema(raw.copy())
+    report = pd.DataFrame({
+        "raw_dtype": raw.dtypes.astype(str),
+        "raw_bytes": raw.memory_usage(deep=True, index=False),
+        "typed_dtype": typed.dtypes.astype(str),
+        "typed_bytes": typed.memory_usage(deep=True, index=False),
+    })
+    report.loc["TOTAL", ["raw_bytes", "typed_bytes"]] = report[["raw_bytes", "typed_bytes"]].sum()
+    return report
+
+
+if __name__ == "__main__":
+    from shared import load_trips_from_db
+
+    trips = load_trips_from_db()
+    report = memory_report(trips)
+    print(report.to_string())
+    total = report.loc["TOTAL"]
+    print(f"\n{len(trips)} trips: {total['raw_bytes'] / 1e6:.2f} MB -> {total['typed_bytes'] / 1e6:.2f} MB")
+
+    raw = pd.DataFrame(trips)
+    typed = to_trip_frame(trips)
+    for name, df in (("raw", raw), ("typed", typed)):
+        if "driver_username" not in df.columns:
+            break
+        t0 = time.perf_counter()
+        for _ in range(20):
+            df.groupby(["city", "driver_username"], observed=True).agg(
+                trips_count=("price_xof", "count"),
+                total_revenue_xof=("price_xof", "sum"),
+                total_driver_xof=("driver_earnings_xof", "sum"),
+            )
+        print(f"groupby city x driver ({name}): {(time.perf_counter() - t0) / 20 * 1000:.2f} ms")
@@ -0,0 +1,143 @@
+"""
+In-memory structures derived from the trip store, kept in sync.
+
+A TripStoreView builds its structure from all trips once per process,
+then adds trips incrementally: new trips, from this process or another
+one, arrive as TRIP_SAVED events on the change bus (change_bus.py) and
+are added if the view is at the version the event was published from.
+Otherwise a change of the store's version (shared.trips_version) makes
+the view load the trips and add the ones past its position. If earlier
+trips were changed (TRIPS_UPDATED / TRIPS_DELETED, e.g. a bulk
+cancellation) the structure is rebuilt.
+
+Trips moved to cold segments by retention.py stay counted: a named view
+is rebuilt from a "cold base" (the structure over every cold trip),
+pickled under data/cold_trips/_views/ and rebuilt only when segments are
+added, plus the trips still in the store.
+"""
+import os
+import pickle
+import threading
+
+from change_bus import TRIP_SAVED, TRIPS_DELETED, TRIPS_UPDATED
+from retention import get_cold_store
+from shared import get_change_bus, load_trips_from_db, trips_version
+
+_UNKNOWN = object()  # version of trips that may be newer than the version read
+_LOCK_TYPES = (type(threading.Lock()), type(threading.RLock()))
+
+
+def _fingerprint(trip):
+    """Cheap per-trip checksum of the fields that bulk rewrites change."""
+    return (
+        hash(trip.get("status"))
+        + int(trip.get("platform_commission_xof") or 0)
+        + 7 * int(trip.get("driver_earnings_xof") or 0)
+    )
+
+
+class TripStoreView:
+    """Lazily built, incrementally maintained view over the trip store."""
+
+    def __init__(self, factory, add_trip, name=None):
+        self._factory = factory      # () -> empty structure
+        self._add_trip = add_trip    # (structure, trip) -> None
+        self.name = name             # cold base cache name (None: store trips only)
+        self._cold_version = None
+        self._lock = threading.RLock()
+        self._value = None
+        self._version = None
+        self._pos = 0                # trips from the store already added
+        self._fingerprint = 0
+        self._bus = get_change_bus()
+        self._bus.subscribe(self._on_trip_saved, (TRIP_SAVED,))
+        self._bus.subscribe(self._on_trips_changed, (TRIPS_UPDATED, TRIPS_DELETED))
+
+    def _add(self, trip):
+        self._add_trip(self._value, trip)
+        self._pos += 1
+        self._fingerprint += _fingerprint(trip)
+
+    def _on_trip_saved(self, event):
+        with self._lock:
+            if self._value is None or self._version == event.after:
+                return
+            if self._version == event.before:
+                self._add(event.data)
+                self._version = event.after
+            else:
+                self._version = _UNKNOWN  # catch up from the store on the next get()
+
+    def _on_trips_changed(self, event):
+        # Trips already added changed: the next get() reloads and rebuilds
+        with self._lock:
+            if self._value is not None and self._version != event.after:
+                self._version = _UNKNOWN
+                self._fingerprint = None  # matches no checksum
+
+    def _load(self):
+        """(version, trips); the version is _UNKNOWN if trips were written during the load."""
+        version = trips_version()
+        trips = load_trips_from_db()
+        if trips_version() != version:
+            version = _UNKNOWN
+        return version, trips
+
+    def get(self):
+        self._bus.poll()  # outside the lock: dispatching takes it
+        with self._lock:
+            if self._value is not None and trips_version() == self._version:
+                return self._value
+
+            version, trips = self._load()
+            cold_current = self.name is None or get_cold_store().version() == self._cold_version
+            if self._value is not None and cold_current and len(trips) >= self._pos:
+                if sum(_fingerprint(t) for t in trips[:self._pos]) == self._fingerprint:
+                    for t in trips[self._pos:]:
+                        self._add(t)
+                    self._version = version
+                    return self._value
+
+            self.rebuild(trips, version)
+            return self._value
+
+    def rebuild(self, trips=None, version=None):
+        with self._lock:
+            if trips is None:
+                version, trips = self._load()
+            self._value = self._cold_base()
+            self._pos = 0
+            self._fingerprint = 0
+            for t in trips:
+                self._add(t)
+            self._version = version
+            return self._value
+
+    def _cold_base(self):
+        """The structure over every cold trip (an empty one if unnamed or no segments)."""
+        cold = get_cold_store()
+        version = cold.version() if self.name else None
+        self._cold_version = version
+        if version is None:
+            return self._factory()
+
+        path = os.path.join(cold.root, "_views", f"{self.name}.pkl")
+        try:
+            with open(path, "rb") as f:
+                cached_version, state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            cached_version, state = None, None
+        if cached_version != version:
+            value = self._factory()
+            for trip in cold.iter_trips():
+                self._add_trip(value, trip)
+            state = {k: v for k, v in vars(value).items() if not isinstance(v, _LOCK_TYPES)}
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump((version, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+            return value
+
+        value = self._factory()  # fresh locks
+        vars(value).update(state)
+        return value